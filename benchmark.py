@@ -1,21 +1,295 @@
+"""
+A reproducible benchmark suite for the apt.dat hot paths.
+
+By default, we benchmark a synthetic apt.dat generated from a fixed seed, so results are comparable across machines
+and commits without an X-Plane installation. Results are written as JSON; diff two runs to spot regressions.
+
+    $ python benchmark.py --airports 5000 --output before.json
+    $ python benchmark.py --apt-dat "/path/to/X-Plane/Resources/default scenery/default apt dat/Earth nav data/apt.dat"
+"""
+import argparse
+import copyreg
 import gc
-import timeit
-from xplane_airports.AptDat import AptDat
+import io
+import json
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
 from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from xplane_airports.AptDat import Airport, AptDat, AptDatLine, TokenInterner, WED_LINE_ENDING
+
+
+@dataclass
+class FeatureMix:
+    """The (inclusive) range of how many of each kind of record we generate per airport"""
+    runways: Tuple[int, int] = (1, 4)
+    pavement_nodes: Tuple[int, int] = (20, 400)  # Bezier nodes (111-116 lines) across all taxiway polygons
+    taxi_nodes: Tuple[int, int] = (0, 120)        # Taxi route nodes; we generate roughly one edge per node
+    flows: Tuple[int, int] = (0, 3)
+    frequencies: Tuple[int, int] = (0, 6)
+    start_locations: Tuple[int, int] = (0, 40)
+    truck_parking: Tuple[int, int] = (0, 10)
+    metadata: bool = True
+
+
+_surfaces = ('Asphalt', 'Concrete', 'Grass', 'Dirt')
+_start_types = ('gate', 'hangar', 'tie_down', 'misc')
+_aircraft_types = ('heavy|jets', 'jets|turboprops', 'turboprops|props', 'props', 'helos', 'all')
+_truck_types = ('baggage_loader', 'baggage_train', 'crew_car', 'fuel_liner', 'fuel_jets', 'pushback')
+
+
+def _synthetic_airport_lines(rng: random.Random, index: int, mix: FeatureMix) -> List[str]:
+    def count(bounds: Tuple[int, int]) -> int:
+        return rng.randint(*bounds)
+
+    apt_id = f"X{index:05d}"
+    lat = rng.uniform(-60, 70)
+    lon = rng.uniform(-179, 179)
+
+    def near() -> str:
+        return f"{lat + rng.uniform(-0.02, 0.02):.8f} {lon + rng.uniform(-0.02, 0.02):.8f}"
+
+    lines = [f"1 {rng.randint(0, 9000)} {rng.randint(0, 1)} 0 {apt_id} Synthetic Airport {index}"]
+    if mix.metadata:
+        lines += [f"1302 city City {index % 997}",
+                  f"1302 country Country {index % 193}",
+                  f"1302 datum_lat {lat:.9f}",
+                  f"1302 datum_lon {lon:.9f}",
+                  f"1302 icao_code {apt_id}",
+                  f"1302 iata_code {apt_id[-3:]}",
+                  f"1302 region_code R{index % 50}"]
+
+    for rwy in range(max(1, count(mix.runways))):
+        heading = (rwy * 5 + index) % 18 + 1
+        lines.append(f"100 {rng.uniform(15, 60):.2f} {rng.randint(1, 5)} 0 0.25 0 2 0 "
+                     f"{heading:02d} {near()} 0 0 2 0 1 0 "
+                     f"{heading + 18:02d} {near()} 0 0 2 0 1 0")
+
+    for freq in range(count(mix.frequencies)):
+        lines.append(f"{1050 + freq % 8} {118000 + rng.randint(0, 17000)} FREQ {freq}")
+
+    pavement_nodes = count(mix.pavement_nodes)
+    while pavement_nodes > 0:
+        nodes_in_polygon = min(pavement_nodes, rng.randint(4, 60))
+        pavement_nodes -= nodes_in_polygon
+        lines.append(f"110 {rng.randint(1, 5)} 0.25 {rng.uniform(0, 360):.4f} {rng.choice(_surfaces)} taxiway")
+        for node in range(nodes_in_polygon - 1):
+            lines.append(f"112 {near()} {near()}" if node % 3 else f"111 {near()}")
+        lines.append(f"113 {near()}")
+
+    taxi_nodes = count(mix.taxi_nodes)
+    if taxi_nodes > 1:
+        lines.append("1200 Taxi network")
+        lines += [f"1201 {near()} both {node} _stop" for node in range(taxi_nodes)]
+        for node in range(1, taxi_nodes):
+            lines.append(f"1202 {rng.randrange(node)} {node} twoway taxiway_{rng.choice('ABCDEF')} {rng.choice('ABCDKLMN')}")
+            if node % 10 == 0:
+                lines.append("1204 departure 01,19")
+        lines += [f"1206 {rng.randrange(taxi_nodes)} {rng.randrange(taxi_nodes)} twoway service_{node}" for node in range(taxi_nodes // 10)]
+
+    for flow in range(count(mix.flows)):
+        lines += [f"1000 Flow {flow}",
+                  f"1001 {apt_id} {flow * 90:03d} {flow * 90 + 180:03d} {rng.randint(5, 40)}",
+                  f"1002 {apt_id} {rng.randint(0, 3000)}",
+                  f"1003 {apt_id} {rng.randint(0, 5)}",
+                  "1004 0000 2400",
+                  f"1100 01 {118000 + flow} arrivals|departures jets|turboprops 000359 000359 Rule {flow}"]
+
+    for start in range(count(mix.start_locations)):
+        lines += [f"1300 {near()} {rng.uniform(0, 360):.2f} {rng.choice(_start_types)} {rng.choice(_aircraft_types)} Ramp {start}",
+                  f"1301 {rng.choice('ABCDEF')} airline AAL DAL"]
+
+    for truck in range(count(mix.truck_parking)):
+        lines += [f"1400 {near()} {rng.uniform(0, 360):.2f} {rng.choice(_truck_types)} 2 Truck {truck}",
+                  f"1401 {near()} {rng.uniform(0, 360):.2f} {rng.choice(_truck_types)} Destination {truck}"]
+    return lines
+
+
+def synthetic_apt_dat(num_airports: int, seed: int = 0, mix: Optional[FeatureMix] = None, xplane_version: int = 1100) -> str:
+    """
+    :returns: The text of a complete apt.dat file with ``num_airports`` random (but deterministic for a given seed) airports
+    """
+    rng = random.Random(seed)
+    mix = mix or FeatureMix()
+    blocks = [WED_LINE_ENDING.join(_synthetic_airport_lines(rng, i, mix)) for i in range(num_airports)]
+    header = f"I{WED_LINE_ENDING}{xplane_version} Generated by WorldEditor{WED_LINE_ENDING}{WED_LINE_ENDING}"
+    return header + (WED_LINE_ENDING * 2).join(blocks) + WED_LINE_ENDING * 2 + '99' + WED_LINE_ENDING
+
+
+class BenchContext:
+    """The state shared by all benchmarks in a single run"""
+    def __init__(self, apt_dat_path: Path, work_dir: Path, seed: int):
+        self.apt_dat_path = apt_dat_path
+        self.work_dir = work_dir
+        self.text = apt_dat_path.read_text(encoding='utf8')
+        self.lines = [line for line in self.text.splitlines() if not AptDatLine.raw_is_file_header(line)]
+        self.apt_dat = AptDat.from_file_text(self.text, apt_dat_path)
+        rng = random.Random(seed)
+        self.lookup_ids = [rng.choice(self.apt_dat.airports).id for _ in range(min(1000, len(self.apt_dat)))]
+
+
+def _clear_cached(ctx: BenchContext, prop_name: str):
+    for apt in ctx.apt_dat:
+        apt.__dict__.pop(prop_name, None)
+
 
-xplane_installation = Path('/Users/tyler/design')
-assert xplane_installation.is_dir(), f"{xplane_installation} does not exist or is not a directory"
+def _bench_tokenize(ctx: BenchContext):
+    tokenize = AptDatLine.tokenize
+    for line in ctx.lines:
+        tokenize(line)
 
-iterations = 3
-print(f"Repeating {iterations} iterations of parsing 35,000+ airports from disk (this will take awhile)")
 
-# Tyler observes: We can't just run a bunch of iterations using timeit(), because it disables GC,
-# and we use gigabytes of RAM per parse of our giant files.
-#
-# It's not realistic to benchmark us parsing multiple 300 MB files... there are only so many airports in the world!
-total_seconds = 0
-for i in range(iterations):
-    total_seconds += timeit.timeit(lambda: AptDat(xplane_installation / 'Resources/default scenery/default apt dat/Earth nav data/apt.dat'), number=1)
+def _bench_lookup(ctx: BenchContext):
+    for apt_id in ctx.lookup_ids:
+        ctx.apt_dat.search_by_id(apt_id)
+
+
+def _bench_taxi_network(ctx: BenchContext):
+    _clear_cached(ctx, 'taxi_network')
+    for apt in ctx.apt_dat:
+        apt.taxi_network
+
+
+def _bench_properties(ctx: BenchContext):
+    for prop_name in ('metadata', 'row_codes', 'row_code_index'):
+        _clear_cached(ctx, prop_name)
+    for apt in ctx.apt_dat:
+        apt.metadata
+        apt.latitude
+        apt.longitude
+        apt.has_traffic_flow
+
+
+def _default_pickle(obj) -> bytes:
+    """:returns: The pickle we'd get without our custom reductions: every attribute, including tokens & cached properties"""
+    out = io.BytesIO()
+    pickler = pickle.Pickler(out, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = {cls: lambda instance: (copyreg.__newobj__, (type(instance),), vars(instance))
+                              for cls in (Airport, AptDat)}
+    pickler.dump(obj)
+    return out.getvalue()
+
+
+def _compact_pickle(obj) -> bytes:
+    return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+def _bench_pickle_round_trip(pickle_fn: Callable[[object], bytes]) -> Callable[[BenchContext], object]:
+    def bench(ctx: BenchContext):
+        unpickled = pickle.loads(pickle_fn(ctx.apt_dat))
+        for apt in unpickled:
+            apt.tokenized_lines  # Include the cost of re-tokenizing, if the pickle left that for later
+    return bench
+
+
+# Each benchmark is run ``iterations`` times against the same context; add new hot paths here
+benchmarks = {
+    'tokenize': _bench_tokenize,
+    'parse': lambda ctx: AptDat(ctx.apt_dat_path),
+    'parse_interned': lambda ctx: AptDat(ctx.apt_dat_path, interner=TokenInterner()),
+    'parse_interned_numeric': lambda ctx: AptDat(ctx.apt_dat_path, interner=TokenInterner(numeric_columns=True)),
+    'lookup': _bench_lookup,
+    'properties': _bench_properties,
+    'taxi_network': _bench_taxi_network,
+    'write_to_disk': lambda ctx: ctx.apt_dat.write_to_disk(ctx.work_dir / 'written.dat'),
+    'str': lambda ctx: str(ctx.apt_dat),
+    'pickle': _bench_pickle_round_trip(_compact_pickle),
+    'pickle_default': _bench_pickle_round_trip(_default_pickle),
+}  # type: Dict[str, Callable[[BenchContext], object]]
+
+# Sizes (in bytes) reported alongside the timings of the benchmark with the same name
+sizes = {
+    'pickle': lambda ctx: len(_compact_pickle(ctx.apt_dat)),
+    'pickle_default': lambda ctx: len(_default_pickle(ctx.apt_dat)),
+}  # type: Dict[str, Callable[[BenchContext], int]]
+
+
+def _time_benchmark(fn: Callable[[BenchContext], object], ctx: BenchContext, iterations: int) -> Dict[str, float]:
+    # Tyler observes: We can't just run a bunch of iterations using timeit(), because it disables GC,
+    # and we use gigabytes of RAM per parse of our giant files.
+    timings = []
+    for _ in range(iterations):
+        gc.collect()
+        start = time.perf_counter()
+        fn(ctx)
+        timings.append(time.perf_counter() - start)
     gc.collect()
 
-print(f"Average time over {iterations} runs: {total_seconds / iterations}")
+    # Measured separately, since tracing allocations slows everything down considerably
+    tracemalloc.start()
+    fn(ctx)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'min_seconds': min(timings), 'mean_seconds': sum(timings) / len(timings), 'peak_memory_bytes': peak_bytes}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).parent,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(apt_dat_path: Path, work_dir: Path, iterations: int = 3, seed: int = 0, only: Optional[List[str]] = None) -> Dict[str, object]:
+    """:returns: A JSON-serializable dict of results for every benchmark (or just those named in ``only``)"""
+    ctx = BenchContext(apt_dat_path, work_dir, seed)
+    results = {name: _time_benchmark(fn, ctx, iterations)
+               for name, fn in benchmarks.items()
+               if not only or name in only}
+    for name, size_fn in sizes.items():
+        if name in results:
+            results[name]['bytes'] = size_fn(ctx)
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'apt_dat': str(apt_dat_path),
+        'airports': len(ctx.apt_dat),
+        'lines': len(ctx.lines),
+        'iterations': iterations,
+        'results': results,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apt-dat', type=Path, help="Benchmark this apt.dat file instead of a synthetic one")
+    parser.add_argument('--airports', type=int, default=2000, help="Number of synthetic airports to generate")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the synthetic apt.dat")
+    parser.add_argument('--mix', type=json.loads, default={}, help="JSON overrides for the FeatureMix, like '{\"taxi_nodes\": [500, 2000]}'")
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--only', nargs='*', choices=sorted(benchmarks), help="Run only these benchmarks")
+    parser.add_argument('--output', type=Path, help="Write the JSON results here rather than to stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        if args.apt_dat:
+            apt_dat_path = args.apt_dat.expanduser()
+            generated_with = None
+        else:
+            mix = FeatureMix(**{key: tuple(val) if isinstance(val, list) else val for key, val in args.mix.items()})
+            apt_dat_path = work_dir / 'synthetic.dat'
+            apt_dat_path.write_text(synthetic_apt_dat(args.airports, args.seed, mix), encoding='utf8')
+            generated_with = {'airports': args.airports, 'seed': args.seed, 'mix': asdict(mix)}
+        print(f"Benchmarking {apt_dat_path} ({args.iterations} iterations per benchmark)", file=sys.stderr)
+        report = run(apt_dat_path, work_dir, args.iterations, args.seed, args.only)
+        report['synthetic'] = generated_with
+
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(report_json + '\n')
+    else:
+        print(report_json)
+
+
+if __name__ == '__main__':
+    main()
@@ -28,5 +28,8 @@ setup(
         'requests',
         'dataclasses>=0.6; python_version < "3.7"'
     ],
+    extras_require={
+        'numpy': ['numpy'],  # Vectorized distance matrices in xplane_airports.geodesy
+    },
     test_suite='xplane_airports/test_AptDat.py'
 )
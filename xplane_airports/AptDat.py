@@ -1,16 +1,39 @@
 """
 Tools for reading, inspecting, and manipulating X-Plane’s airport (apt.dat) files.
 """
+import bisect
+import bz2
+import difflib
+import gzip
+import hashlib
+import heapq
+import io
+import sqlite3
 import itertools
+import json
+import lzma
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import suppress
 from dataclasses import dataclass, field
 from operator import attrgetter
 from os import PathLike
 import re
+import stat
+import unicodedata
+import weakref
 from enum import IntEnum, Enum
 from pathlib import Path
-from typing import Callable, Collection, Dict, Iterable, List, Optional, Union, FrozenSet
+from math import ceil, cos, floor, hypot, inf, nan, radians
+from typing import Any, Callable, Collection, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union, FrozenSet
 from xplane_airports._cached_prop import apt_cached_property
+from xplane_airports.geodesy import METERS_PER_NM, NM_PER_DEGREE_LAT, distance_matrix_nm, haversine_nm
 
 WED_LINE_ENDING = '\n'
 
@@ -123,6 +146,45 @@ class MetadataKey(Enum):
     TRANSITION_LEVEL = 'transition_level'
 
 
+class FrequencyType(Enum):
+    AWOS = 'awos'
+    CTAF = 'ctaf'
+    DELIVERY = 'delivery'
+    GROUND = 'ground'
+    TOWER = 'tower'
+    APPROACH = 'approach'
+    CENTER = 'center'
+    UNICOM = 'unicom'
+
+
+# Legacy (25 kHz, 50-57) and 8.33 kHz (1050-1057) COM records -> (type, units per MHz in the record)
+_frequency_row_codes = {
+    **{RowCode(50 + i): (freq_type, 100) for i, freq_type in enumerate(FrequencyType)},
+    **{RowCode(1050 + i): (freq_type, 1000) for i, freq_type in enumerate(FrequencyType)},
+}
+frequency_codes = tuple(_frequency_row_codes)
+
+
+@dataclass(frozen=True)
+class Frequency:
+    """An ATC or advisory radio frequency defined by an airport"""
+    frequency_khz: int             # Like 122800 for 122.8 MHz; an int so it can be compared & indexed exactly
+    frequency_type: FrequencyType
+    name: str = ''                 # Like "CTAF/UNICOM" or "SEATTLE TOWER"
+
+    @property
+    def frequency_mhz(self) -> float:
+        return self.frequency_khz / 1000
+
+    @staticmethod
+    def from_tokenized_line(tokens: List[Union[RowCode, str]]) -> 'Frequency':
+        freq_type, units_per_mhz = _frequency_row_codes[tokens[0]]
+        khz = int(tokens[1]) * (1000 // units_per_mhz)
+        if units_per_mhz == 100 and khz % 50 in (20, 70):
+            khz += 5  # Legacy records truncate 25 kHz channels to 10 kHz (118.025 is written 11802), so we restore the final 5
+        return Frequency(frequency_khz=khz, frequency_type=freq_type, name=' '.join(tokens[2:]))
+
+
 class AptDatLine:
     """
     A single line from an apt.dat file.
@@ -201,6 +263,57 @@ class AptDatLine:
         return tokens
 
 
+class TokenInterner:
+    """
+    An opt-in alternative to ``AptDatLine.tokenize()`` that cuts the memory used by a parse
+    by sharing a single ``str`` object among all identical short tokens (surface codes, ``both``, ``twoway``,
+    ``taxiway_C``, lighting flags, etc.). Long tokens (like coordinates) are almost always unique, so we leave those alone.
+
+    Optionally, the coordinate columns of the most numerous row codes (pavement beziers, taxi route nodes, runways)
+    can be stored as floats up front. ``Airport``'s accessors work the same either way, but code that
+    assumes every token is a ``str`` will need to handle floats in those columns.
+
+    Pass the same interner to multiple parses to share tokens among them.
+    """
+    # The coordinate columns we store as floats when numeric_columns is enabled
+    numeric_columns_by_row_code = {
+        RowCode.LINE_SEGMENT: (1, 2),
+        RowCode.LINE_CURVE: (1, 2, 3, 4),
+        RowCode.RING_SEGMENT: (1, 2),
+        RowCode.RING_CURVE: (1, 2, 3, 4),
+        RowCode.END_SEGMENT: (1, 2),
+        RowCode.END_CURVE: (1, 2, 3, 4),
+        RowCode.TAXI_ROUTE_NODE: (1, 2),
+        RowCode.LAND_RUNWAY: (9, 10, 18, 19),
+    }
+
+    def __init__(self, numeric_columns: bool = False, max_interned_length: int = 10):
+        """
+        :param numeric_columns: If true, we'll store the coordinate columns listed in ``numeric_columns_by_row_code`` as floats
+        :param max_interned_length: We intern only tokens of this length or shorter
+        """
+        self.table = {}  # type: Dict[str, str]
+        self.numeric_columns = self.numeric_columns_by_row_code if numeric_columns else {}
+        self.max_interned_length = max_interned_length
+        self._row_codes = {str(code.value): code for code in RowCode}
+
+    def tokenize(self, line: str) -> List[Union[RowCode, str, float]]:
+        """:returns: The same tokens as ``AptDatLine.tokenize()``, but interned (and possibly with floats in numeric columns)"""
+        table = self.table
+        max_len = self.max_interned_length
+        tokens = [t if len(t) > max_len else table.setdefault(t, t)
+                  for t in line.strip().split(' ')
+                  if t]
+        if tokens:
+            row_code = tokens[0] = self._row_codes.get(tokens[0]) or RowCode(int(tokens[0]))
+            numeric_columns = self.numeric_columns.get(row_code)
+            if numeric_columns:
+                with suppress(ValueError, IndexError):
+                    for col in numeric_columns:
+                        tokens[col] = float(tokens[col])
+        return tokens
+
+
 @dataclass
 class TaxiRouteNode:
     """
@@ -227,10 +340,10 @@ class IcaoWidth(Enum):
 
     @classmethod
     def from_str(cls, string: str):
-        for enum_def in cls:
-            if string == enum_def.value:
-                return enum_def
-        raise LookupError(f'No instance of {cls} matches "{string}"')
+        try:
+            return cls(string)  # Enum's own lookup by value is a dict access, rather than a scan of every member
+        except ValueError:
+            raise LookupError(f'No instance of {cls} matches "{string}"')
 
 
 @dataclass
@@ -249,6 +362,9 @@ class TaxiRouteEdge:
 
     @staticmethod
     def from_tokenized_line(tokens: List[Union[RowCode, str]]) -> 'TaxiRouteEdge':
+        """:param tokens: A 1202 (taxi route edge) or 1206 (ground vehicle service road) line"""
+        if tokens[0] == RowCode.TAXI_ROUTE_ROAD:  # Service roads have no taxiway type
+            return TaxiRouteEdge(name=" ".join(tokens[4:]), node_begin=int(tokens[1]), node_end=int(tokens[2]), one_way=tokens[3] == 'oneway')
         edge = TaxiRouteEdge(name=" ".join(tokens[5:]), node_begin=int(tokens[1]), node_end=int(tokens[2]), one_way=tokens[3] == 'oneway')
 
         taxiway_type = tokens[4]
@@ -281,6 +397,597 @@ class TaxiRouteNetwork:
                  if tokens[0] == RowCode.TAXI_ROUTE_EDGE]
         return TaxiRouteNetwork(nodes=nodes, edges=edges)
 
+    @apt_cached_property
+    def spatial_index(self) -> 'TaxiRouteSpatialIndex':
+        """:returns: An index for snapping positions to this network's nearest nodes & edges (built on first use)"""
+        return TaxiRouteSpatialIndex(self)
+
+
+class EdgeSnap(NamedTuple):
+    """The point on a taxi route edge nearest to some position"""
+    edge: TaxiRouteEdge
+    distance_m: float
+    lat: float  # The nearest point on the edge
+    lon: float
+    fraction: float  # How far along the edge (from node_begin to node_end) the nearest point lies, from 0 to 1
+
+
+class NodeSnap(NamedTuple):
+    node: TaxiRouteNode
+    distance_m: float
+
+
+class TaxiRouteSpatialIndex:
+    """
+    A uniform grid over a taxi route network's nodes and edges, in a local flat projection (meters east & north of the
+    network's center), for quickly snapping ground positions to the network. Distances are planar within that frame,
+    which is plenty accurate over the extent of an airport.
+    """
+    def __init__(self, network: 'TaxiRouteNetwork', cell_size_m: float = 50.0):
+        """
+        :param cell_size_m: The size of each grid cell; roughly the typical distance between nodes works best
+        """
+        self.cell_size_m = cell_size_m
+        nodes = list(network.nodes.values())
+        lat0 = sum(node.lat for node in nodes) / len(nodes) if nodes else 0.0
+        self._lat0 = lat0
+        self._lon0 = sum(node.lon for node in nodes) / len(nodes) if nodes else 0.0
+        self._m_per_deg_lat = NM_PER_DEGREE_LAT * METERS_PER_NM
+        self._m_per_deg_lon = self._m_per_deg_lat * cos(radians(lat0))
+
+        self._nodes = nodes
+        self._node_xy = [self._project(node.lat, node.lon) for node in nodes]
+        self._node_grid = defaultdict(list)  # Cell -> indices into self._nodes
+        for i, (x, y) in enumerate(self._node_xy):
+            self._node_grid[self._cell(x, y)].append(i)
+
+        xy_by_id = {node.id: xy for node, xy in zip(nodes, self._node_xy)}
+        self._segments = []  # (edge, begin x, begin y, end x, end y)
+        self._edge_grid = defaultdict(list)  # Cell -> indices into self._segments of every edge whose bounding box overlaps it
+        for edge in network.edges:
+            if edge.node_begin in xy_by_id and edge.node_end in xy_by_id:
+                (ax, ay), (bx, by) = xy_by_id[edge.node_begin], xy_by_id[edge.node_end]
+                (min_cx, min_cy), (max_cx, max_cy) = self._cell(min(ax, bx), min(ay, by)), self._cell(max(ax, bx), max(ay, by))
+                for cx in range(min_cx, max_cx + 1):
+                    for cy in range(min_cy, max_cy + 1):
+                        self._edge_grid[cx, cy].append(len(self._segments))
+                self._segments.append((edge, ax, ay, bx, by))
+        self._node_bounds = self._grid_bounds(self._node_grid)
+        self._edge_bounds = self._grid_bounds(self._edge_grid)
+
+    def _project(self, lat: float, lon: float) -> Tuple[float, float]:
+        return (lon - self._lon0) * self._m_per_deg_lon, (lat - self._lat0) * self._m_per_deg_lat
+
+    def _unproject(self, x: float, y: float) -> Tuple[float, float]:
+        return self._lat0 + y / self._m_per_deg_lat, self._lon0 + x / self._m_per_deg_lon
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return floor(x / self.cell_size_m), floor(y / self.cell_size_m)
+
+    @staticmethod
+    def _grid_bounds(grid: Dict[Tuple[int, int], List[int]]) -> Tuple[int, int, int, int]:
+        """:returns: The min x, max x, min y, and max y cells that contain anything"""
+        if not grid:
+            return 0, -1, 0, -1
+        return min(cx for cx, _ in grid), max(cx for cx, _ in grid), min(cy for _, cy in grid), max(cy for _, cy in grid)
+
+    @staticmethod
+    def _ring(cx: int, cy: int, ring: int, bounds: Tuple[int, int, int, int]) -> Iterable[Tuple[int, int]]:
+        """:returns: The cells within ``bounds`` exactly ``ring`` cells (in either axis) from (cx, cy)"""
+        min_cx, max_cx, min_cy, max_cy = bounds
+        if ring == 0:
+            return [(cx, cy)]
+        x_range = range(max(cx - ring, min_cx), min(cx + ring, max_cx) + 1)
+        y_range = range(max(cy - ring + 1, min_cy), min(cy + ring - 1, max_cy) + 1)
+        horizontal = [(x, y) for y in (cy - ring, cy + ring) if min_cy <= y <= max_cy for x in x_range]
+        vertical = [(x, y) for x in (cx - ring, cx + ring) if min_cx <= x <= max_cx for y in y_range]
+        return horizontal + vertical
+
+    def _nearest(self, grid: Dict[Tuple[int, int], List[int]], bounds: Tuple[int, int, int, int], x: float, y: float,
+                 distance_to: Callable[[int, float, float], float]) -> Tuple[Optional[int], float]:
+        """Searches rings of cells outward from (x, y) until no unsearched cell could hold anything nearer than the best so far"""
+        min_cx, max_cx, min_cy, max_cy = bounds
+        if min_cx > max_cx:
+            return None, inf
+        cx, cy = self._cell(x, y)
+        first_ring = max(min_cx - cx, cx - max_cx, min_cy - cy, cy - max_cy, 0)  # Skip the empty rings between us & the airport
+        last_ring = max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy)
+        best, best_distance = None, inf
+        seen = set()
+        for ring in range(first_ring, last_ring + 1):
+            for cell in self._ring(cx, cy, ring, bounds):
+                for i in grid.get(cell, ()):
+                    if i not in seen:
+                        seen.add(i)
+                        distance = distance_to(i, x, y)
+                        if distance < best_distance:
+                            best, best_distance = i, distance
+            # Anything in the rings beyond this one is more than ``ring`` cells away
+            if best is not None and best_distance <= ring * self.cell_size_m:
+                break
+        return best, best_distance
+
+    def _node_distance(self, i: int, x: float, y: float) -> float:
+        node_x, node_y = self._node_xy[i]
+        return hypot(node_x - x, node_y - y)
+
+    def _segment_projection(self, i: int, x: float, y: float) -> Tuple[float, float]:
+        """:returns: The distance from (x, y) to the segment, and the fraction of the way along it of the nearest point"""
+        _, ax, ay, bx, by = self._segments[i]
+        dx, dy = bx - ax, by - ay
+        length_squared = dx * dx + dy * dy
+        t = 0.0 if length_squared == 0 else min(1.0, max(0.0, ((x - ax) * dx + (y - ay) * dy) / length_squared))
+        return hypot(ax + t * dx - x, ay + t * dy - y), t
+
+    def nearest_node(self, lat: float, lon: float) -> Optional[NodeSnap]:
+        """:returns: The node nearest the position, or None if the network has no nodes"""
+        x, y = self._project(lat, lon)
+        i, distance = self._nearest(self._node_grid, self._node_bounds, x, y, self._node_distance)
+        return None if i is None else NodeSnap(self._nodes[i], distance)
+
+    def nearest_edge(self, lat: float, lon: float) -> Optional[EdgeSnap]:
+        """:returns: The nearest point on the nearest edge to the position, or None if the network has no edges"""
+        x, y = self._project(lat, lon)
+        i, distance = self._nearest(self._edge_grid, self._edge_bounds, x, y, lambda i, x, y: self._segment_projection(i, x, y)[0])
+        if i is None:
+            return None
+        edge, ax, ay, bx, by = self._segments[i]
+        _, t = self._segment_projection(i, x, y)
+        snapped_lat, snapped_lon = self._unproject(ax + t * (bx - ax), ay + t * (by - ay))
+        return EdgeSnap(edge, distance, snapped_lat, snapped_lon, t)
+
+    def nearest_nodes(self, positions: Iterable[Tuple[float, float]]) -> List[Optional[NodeSnap]]:
+        """:returns: The result of ``nearest_node()`` for each (lat, lon) position"""
+        return [self.nearest_node(lat, lon) for lat, lon in positions]
+
+    def nearest_edges(self, positions: Iterable[Tuple[float, float]]) -> List[Optional[EdgeSnap]]:
+        """:returns: The result of ``nearest_edge()`` for each (lat, lon) position"""
+        return [self.nearest_edge(lat, lon) for lat, lon in positions]
+
+
+def _in_circular_range(value: float, lo: float, hi: float) -> bool:
+    """:returns: True if value falls within [lo, hi], where the range may wrap around (like headings 270-090, or times 2200-0600)"""
+    return lo <= value <= hi if lo <= hi else (value >= lo or value <= hi)
+
+
+@dataclass
+class WeatherConditions:
+    """The METAR-derived conditions used to choose an airport's active traffic flow"""
+    wind_dir: Optional[float] = None  # Degrees; None for calm or variable winds (which satisfy any wind direction)
+    wind_speed_kts: float = 0
+    ceiling_ft: Optional[float] = None  # None for no ceiling
+    visibility_sm: Optional[float] = None  # Statute miles; None for unlimited
+    zulu_time: Optional[int] = None  # Like 1430; None to ignore time rules
+
+
+@dataclass
+class FlowWindRule:
+    """A 1001 record: the flow may be used when the wind is within this range of directions, no stronger than max_speed_kts"""
+    metar_icao: str
+    dir_min: int
+    dir_max: int
+    max_speed_kts: int
+
+    def accepts(self, conditions: WeatherConditions) -> bool:
+        return conditions.wind_speed_kts <= self.max_speed_kts and \
+               (conditions.wind_dir is None or _in_circular_range(conditions.wind_dir, self.dir_min, self.dir_max))
+
+
+@dataclass
+class RunwayUseRule:
+    """A 1100 (or 8.33 kHz 1110) record: how ATC uses a runway while this flow is active"""
+    runway: str                       # The runway end, like "16R"
+    frequency_mhz: float              # The ATC frequency for operations under this rule
+    operations: FrozenSet[str]        # Subset of {'arrivals', 'departures'}
+    equipment: FrozenSet[str]         # Subset of {'heavy', 'jets', 'turboprops', 'props', 'helos', 'fighters'}
+    dep_heading_range: Tuple[int, int]       # Departure headings (min, max) this rule applies to
+    initial_heading_range: Tuple[int, int]   # Initial headings (min, max) assigned to departures
+    name: str = ''
+
+    @staticmethod
+    def from_tokenized_line(tokens: List[Union[RowCode, str]]) -> 'RunwayUseRule':
+        def heading_range(token: str) -> Tuple[int, int]:
+            with suppress(ValueError):
+                return int(token[:3]), int(token[3:6])
+            return 0, 359
+
+        frequency_divisor = 1000 if tokens[0] == RowCode.FLOW_RUNWAY_RULE_CHANNEL else 100
+        return RunwayUseRule(runway=tokens[1], frequency_mhz=int(tokens[2]) / frequency_divisor,
+                             operations=frozenset(tokens[3].split('|')), equipment=frozenset(tokens[4].split('|')),
+                             dep_heading_range=heading_range(tokens[5]), initial_heading_range=heading_range(tokens[6]),
+                             name=' '.join(tokens[7:]))
+
+
+@dataclass
+class TrafficFlow:
+    """
+    A traffic flow (a 1000 record and the records following it): the conditions under which ATC should use it,
+    and how it uses the runways when it's active. A flow may be used only when all its rules are satisfied;
+    multiple wind or time rules are alternatives, any one of which suffices.
+    """
+    name: str
+    wind_rules: List[FlowWindRule] = field(default_factory=list)
+    ceiling_minimums_ft: List[int] = field(default_factory=list)      # From 1002 records
+    visibility_minimums_sm: List[float] = field(default_factory=list)  # From 1003 records
+    time_rules: List[Tuple[int, int]] = field(default_factory=list)    # 1004 (start, end) zulu times, like (2200, 600)
+    traffic_patterns: Dict[str, str] = field(default_factory=dict)    # 1101 runway end -> 'left' or 'right'
+    runway_rules: List[RunwayUseRule] = field(default_factory=list)
+
+    def accepts(self, conditions: WeatherConditions) -> bool:
+        """:returns: True if this flow may be used under the specified conditions"""
+        if self.wind_rules and not any(rule.accepts(conditions) for rule in self.wind_rules):
+            return False
+        if self.ceiling_minimums_ft and conditions.ceiling_ft is not None and conditions.ceiling_ft < max(self.ceiling_minimums_ft):
+            return False
+        if self.visibility_minimums_sm and conditions.visibility_sm is not None and conditions.visibility_sm < max(self.visibility_minimums_sm):
+            return False
+        if self.time_rules and conditions.zulu_time is not None and \
+                not any(_in_circular_range(conditions.zulu_time, start, end) for start, end in self.time_rules):
+            return False
+        return True
+
+    @property
+    def arrival_runways(self) -> List[str]:
+        """:returns: The runway ends used for arrivals under this flow, in the order their rules were defined"""
+        return list(dict.fromkeys(rule.runway for rule in self.runway_rules if 'arrivals' in rule.operations))
+
+    @property
+    def departure_runways(self) -> List[str]:
+        """:returns: The runway ends used for departures under this flow, in the order their rules were defined"""
+        return list(dict.fromkeys(rule.runway for rule in self.runway_rules if 'departures' in rule.operations))
+
+    @staticmethod
+    def from_tokenized_lines(tokenized_lines: Iterable[List[Union[RowCode, str]]]) -> List['TrafficFlow']:
+        """
+        :param tokenized_lines: The airport's flow-related lines (row codes 1000-1004, 1100, 1101, 1110), in file order
+        :returns: The flows, in the order they were defined (which is the order in which ATC considers them)
+        """
+        flows = []
+        for tokens in tokenized_lines:
+            row_code = tokens[0]
+            if row_code == RowCode.FLOW_DEFINITION:
+                flows.append(TrafficFlow(name=' '.join(tokens[1:])))
+            elif not flows:
+                continue  # A rule with no flow to belong to
+            elif row_code == RowCode.FLOW_WIND:
+                flows[-1].wind_rules.append(FlowWindRule(tokens[1], int(tokens[2]), int(tokens[3]), int(tokens[4])))
+            elif row_code == RowCode.FLOW_CEILING:
+                flows[-1].ceiling_minimums_ft.append(int(tokens[2]))
+            elif row_code == RowCode.FLOW_VISIBILITY:
+                flows[-1].visibility_minimums_sm.append(float(tokens[2]))
+            elif row_code == RowCode.FLOW_TIME:
+                flows[-1].time_rules.append((int(tokens[1]), int(tokens[2])))
+            elif row_code == RowCode.FLOW_PATTERN:
+                flows[-1].traffic_patterns[tokens[1]] = tokens[2]
+            elif row_code in (RowCode.FLOW_RUNWAY_RULE, RowCode.FLOW_RUNWAY_RULE_CHANNEL):
+                flows[-1].runway_rules.append(RunwayUseRule.from_tokenized_line(tokens))
+        return flows
+
+
+flow_codes = (RowCode.FLOW_DEFINITION, RowCode.FLOW_WIND, RowCode.FLOW_CEILING, RowCode.FLOW_VISIBILITY, RowCode.FLOW_TIME,
+              RowCode.FLOW_RUNWAY_RULE, RowCode.FLOW_PATTERN, RowCode.FLOW_RUNWAY_RULE_CHANNEL)
+
+
+class StartupLocation(NamedTuple):
+    """A ramp start (gate, hangar, tie-down, etc.) from a 1300 record (plus its 1301 extension) or a legacy 15 record"""
+    lat: float
+    lon: float
+    heading: float
+    location_type: str                   # 'gate', 'hangar', 'tie_down', or 'misc'
+    aircraft_types: FrozenSet[str]       # Subset of {'heavy', 'jets', 'turboprops', 'props', 'helos', 'fighters'}, or {'all'}
+    name: str
+    icao_width: Optional[IcaoWidth] = None    # The largest aircraft that fits; unknown if None
+    operation_type: str = 'none'              # 'none', 'general_aviation', 'airline', 'cargo', or 'military'
+    airline_codes: FrozenSet[str] = frozenset()  # ICAO airline codes allowed to use this spot; any airline if empty
+
+    def accepts_aircraft_type(self, aircraft_type: str) -> bool:
+        return aircraft_type in self.aircraft_types or 'all' in self.aircraft_types
+
+    @staticmethod
+    def from_tokenized_lines(tokenized_lines: Iterable[List[Union[RowCode, str]]]) -> List['StartupLocation']:
+        """
+        :param tokenized_lines: The airport's 15, 1300, and 1301 lines, in file order
+        """
+        out = []
+        for tokens in tokenized_lines:
+            if tokens[0] == RowCode.START_LOCATION_NEW:
+                out.append(StartupLocation(float(tokens[1]), float(tokens[2]), float(tokens[3]), tokens[4],
+                                           frozenset(tokens[5].split('|')), ' '.join(tokens[6:])))
+            elif tokens[0] == RowCode.START_LOCATION_EXT:
+                if out and len(tokens) > 2:  # Extends the preceding 1300 record
+                    width = None
+                    with suppress(LookupError):
+                        width = IcaoWidth.from_str(tokens[1])
+                    out[-1] = out[-1]._replace(icao_width=width, operation_type=tokens[2], airline_codes=frozenset(tokens[3:]))
+            elif tokens[0] == RowCode.STARTUP_LOCATION:
+                out.append(StartupLocation(float(tokens[1]), float(tokens[2]), float(tokens[3]), 'misc', frozenset(['all']), ' '.join(tokens[4:])))
+        return out
+
+
+start_location_codes = (RowCode.STARTUP_LOCATION, RowCode.START_LOCATION_NEW, RowCode.START_LOCATION_EXT)
+
+
+class StartupLocationIndex:
+    """
+    Answers queries like "the free gates that fit an ICAO width D aircraft of airline X, nearest to taxiway exit Y"
+    using precomputed sets of matching spots, rather than re-examining every spot at the airport.
+    """
+    def __init__(self, locations: List[StartupLocation]):
+        self.locations = locations
+        by_type = defaultdict(set)
+        by_aircraft_type = defaultdict(set)
+        by_operation = defaultdict(set)
+        by_airline = defaultdict(set)
+        for i, loc in enumerate(locations):
+            by_type[loc.location_type].add(i)
+            by_operation[loc.operation_type].add(i)
+            for aircraft_type in loc.aircraft_types:
+                by_aircraft_type[aircraft_type].add(i)
+            for airline in loc.airline_codes or ('',):  # '' -> the spots open to any airline
+                by_airline[airline].add(i)
+        self._by_type = dict(by_type)
+        self._by_aircraft_type = dict(by_aircraft_type)
+        self._by_operation = dict(by_operation)
+        self._by_airline = dict(by_airline)
+        # The spots that fit an aircraft of each width class, i.e., spots of that width or wider
+        self._by_min_width = {width: frozenset(i for i, loc in enumerate(locations) if loc.icao_width and loc.icao_width.value >= width.value)
+                              for width in IcaoWidth}
+        cos_lat = cos(radians(sum(loc.lat for loc in locations) / len(locations))) if locations else 1.0
+        self._xy = [(loc.lon * cos_lat, loc.lat) for loc in locations]  # Local equirectangular projection, plenty accurate within an airport
+        self._cos_lat = cos_lat
+
+    def query(self, location_type: Optional[str] = None, icao_width: Optional[IcaoWidth] = None, airline: Optional[str] = None,
+              aircraft_type: Optional[str] = None, operation_type: Optional[str] = None, exclude: Collection[int] = (),
+              near: Optional[Tuple[float, float]] = None, limit: Optional[int] = None) -> List[int]:
+        """
+        :param location_type: Only spots of this type, like 'gate'
+        :param icao_width: Only spots that fit an aircraft of this width class (spots whose width is unknown never match)
+        :param airline: Only spots that accept this ICAO airline code (including spots open to any airline)
+        :param aircraft_type: Only spots that accept this type of aircraft, like 'jets'
+        :param operation_type: Only spots for this type of operation, like 'airline' or 'cargo'
+        :param exclude: Indices of spots to skip, like those that are currently occupied
+        :param near: A (latitude, longitude); if provided, we'll sort the results nearest first
+        :param limit: The maximum number of results to return
+        :returns: Indices into ``locations`` of the matching spots
+        """
+        empty = frozenset()
+        candidate_sets = []
+        if location_type is not None:
+            candidate_sets.append(self._by_type.get(location_type, empty))
+        if icao_width is not None:
+            candidate_sets.append(self._by_min_width[icao_width])
+        if airline is not None:
+            candidate_sets.append(self._by_airline.get(airline, empty) | self._by_airline.get('', empty))
+        if aircraft_type is not None:
+            candidate_sets.append(self._by_aircraft_type.get(aircraft_type, empty) | self._by_aircraft_type.get('all', empty))
+        if operation_type is not None:
+            candidate_sets.append(self._by_operation.get(operation_type, empty))
+
+        if candidate_sets:
+            candidate_sets.sort(key=len)
+            matches = set(candidate_sets[0]).intersection(*candidate_sets[1:])
+        else:
+            matches = set(range(len(self.locations)))
+        matches.difference_update(exclude)
+
+        if near is not None:
+            x0, y0 = near[1] * self._cos_lat, near[0]
+            xy = self._xy
+            key = lambda i: (xy[i][0] - x0) ** 2 + (xy[i][1] - y0) ** 2
+            return heapq.nsmallest(limit, matches, key=key) if limit is not None else sorted(matches, key=key)
+        out = sorted(matches)
+        return out[:limit] if limit is not None else out
+
+
+class TruckParking(NamedTuple):
+    """A spot where a ground service vehicle waits between jobs, from a 1400 record"""
+    lat: float
+    lon: float
+    heading: float
+    truck_type: str  # 'baggage_loader', 'baggage_train', 'crew_car', 'crew_ferrari', 'crew_limo', 'food', 'fuel_jets', 'fuel_liners', 'fuel_props', 'gpu', or 'pushback'
+    num_cars: int    # The number of cars a baggage train pulls (0 for every other type)
+    name: str
+
+    @staticmethod
+    def from_tokenized_line(tokens: List[Union[RowCode, str]]) -> 'TruckParking':
+        return TruckParking(float(tokens[1]), float(tokens[2]), float(tokens[3]), tokens[4], int(tokens[5]), ' '.join(tokens[6:]))
+
+
+class TruckDestination(NamedTuple):
+    """A spot ground service vehicles drive to (like the service area of a gate), from a 1401 record"""
+    lat: float
+    lon: float
+    heading: float
+    truck_types: FrozenSet[str]  # The types of vehicle (as in TruckParking.truck_type) that may use this destination
+    name: str
+
+    @staticmethod
+    def from_tokenized_line(tokens: List[Union[RowCode, str]]) -> 'TruckDestination':
+        return TruckDestination(float(tokens[1]), float(tokens[2]), float(tokens[3]), frozenset(tokens[4].split('|')), ' '.join(tokens[5:]))
+
+
+class GroundRoute(NamedTuple):
+    """A drive along an airport's service roads"""
+    nodes: List[int]   # The IDs of the road nodes passed, in order (empty if the start & end are on the same stretch of road)
+    distance_m: float  # Including the straight-line legs onto the roads at the start, and off them at the end
+
+
+class TruckAssignment(NamedTuple):
+    destination: int  # Index into GroundServiceIndex.destinations
+    route: Optional[GroundRoute]  # None if the airport has no service roads, in which case the destination is the nearest in a straight line
+
+
+class GroundServiceIndex:
+    """
+    Finds the destinations each type of ground service vehicle may use, and routes vehicles to them along the airport's service roads.
+
+    Vehicles join the roads at the nearest point on the nearest road, and likewise leave them at the point nearest their destination.
+    Routes respect one-way roads. The first time we route to a destination, we find the shortest path to it from every road node
+    at once; after that, routing any number of vehicles to the same destination costs little more than snapping them to the roads.
+    """
+    def __init__(self, parking: List[TruckParking], destinations: List[TruckDestination], roads: TaxiRouteNetwork):
+        self.parking = parking
+        self.destinations = destinations
+        self.roads = roads
+        by_truck_type = defaultdict(list)
+        for i, destination in enumerate(destinations):
+            for truck_type in destination.truck_types:
+                by_truck_type[truck_type].append(i)
+        self._by_truck_type = dict(by_truck_type)
+
+        # Node -> (node, length in meters) of each road by which you can drive *to* it
+        incoming = defaultdict(list)
+        nodes = roads.nodes
+        for edge in roads.edges:
+            if edge.node_begin in nodes and edge.node_end in nodes:
+                length = self._edge_length(edge)
+                incoming[edge.node_end].append((edge.node_begin, length))
+                if not edge.one_way:
+                    incoming[edge.node_begin].append((edge.node_end, length))
+        self._incoming = dict(incoming)
+        self._destination_snaps = [self._snap(dest.lat, dest.lon) for dest in destinations] if incoming else []
+        self._trees = {}  # Destination index -> (distance in meters to the destination, next node on the way) from each node that can reach it
+
+    def _edge_length(self, edge: TaxiRouteEdge) -> float:
+        begin, end = self.roads.nodes[edge.node_begin], self.roads.nodes[edge.node_end]
+        return haversine_nm(begin.lat, begin.lon, end.lat, end.lon) * METERS_PER_NM
+
+    def _snap(self, lat: float, lon: float) -> Optional[Tuple[EdgeSnap, float]]:
+        """:returns: The nearest point on the roads, and the length of the road it's on"""
+        snap = self.roads.spatial_index.nearest_edge(lat, lon)
+        return None if snap is None else (snap, self._edge_length(snap.edge))
+
+    def destinations_for(self, truck_type: str) -> List[int]:
+        """:returns: Indices into ``destinations`` of those this type of vehicle (like 'fuel_jets') may use"""
+        return list(self._by_truck_type.get(truck_type, ()))
+
+    def _tree(self, destination: int) -> Tuple[Dict[int, float], Dict[int, Optional[int]]]:
+        """Dijkstra's algorithm over the reversed roads, from the destination out to every node that can reach it"""
+        if destination not in self._trees:
+            snap, length = self._destination_snaps[destination]
+            # (Distance to the destination, tie-breaker, node, the next node on the way there---None at either end of the destination's road)
+            tie_breaker = itertools.count()
+            heap = [(snap.distance_m + snap.fraction * length, next(tie_breaker), snap.edge.node_begin, None)]
+            if not snap.edge.one_way:
+                heap.append((snap.distance_m + (1 - snap.fraction) * length, next(tie_breaker), snap.edge.node_end, None))
+            heapq.heapify(heap)
+            distances, next_nodes = {}, {}
+            while heap:
+                distance, _, node, next_node = heapq.heappop(heap)
+                if node in distances:
+                    continue
+                distances[node] = distance
+                next_nodes[node] = next_node
+                for previous, road_length in self._incoming.get(node, ()):
+                    if previous not in distances:
+                        heapq.heappush(heap, (distance + road_length, next(tie_breaker), previous, node))
+            self._trees[destination] = distances, next_nodes
+        return self._trees[destination]
+
+    def _route(self, start: Optional[Tuple[EdgeSnap, float]], destination: int) -> Optional[GroundRoute]:
+        if start is None or self._destination_snaps[destination] is None:
+            return None
+        snap, length = start
+        distances, next_nodes = self._tree(destination)
+        # Drive onto the road, then along it to the node at either end (or just the end, if it's one-way)
+        options = [(snap.distance_m + (1 - snap.fraction) * length, snap.edge.node_end)]
+        if not snap.edge.one_way:
+            options.append((snap.distance_m + snap.fraction * length, snap.edge.node_begin))
+        best_distance, best_node = min(((leg + distances[node], node) for leg, node in options if node in distances), default=(inf, None))
+
+        dest_snap, _ = self._destination_snaps[destination]
+        if dest_snap.edge is snap.edge and (dest_snap.fraction >= snap.fraction or not snap.edge.one_way):
+            direct = snap.distance_m + abs(dest_snap.fraction - snap.fraction) * length + dest_snap.distance_m
+            if direct <= best_distance:
+                return GroundRoute([], direct)
+        if best_node is None:
+            return None  # No road leads there
+        nodes = [best_node]
+        while next_nodes[nodes[-1]] is not None:
+            nodes.append(next_nodes[nodes[-1]])
+        return GroundRoute(nodes, best_distance)
+
+    def route(self, lat: float, lon: float, destination: int) -> Optional[GroundRoute]:
+        """
+        :param lat: Where the vehicle starts (like a TruckParking's position)
+        :param lon: Where the vehicle starts
+        :param destination: Index into ``destinations``
+        :returns: The shortest route along the service roads, or None if the airport has no roads or none lead there
+        """
+        return self._route(self._snap(lat, lon) if self._incoming else None, destination)
+
+    def routes(self, queries: Iterable[Tuple[float, float, int]]) -> List[Optional[GroundRoute]]:
+        """:returns: The result of ``route()`` for each (lat, lon, destination index), sharing the work for vehicles bound for the same destination"""
+        return [self.route(lat, lon, destination) for lat, lon, destination in queries]
+
+    def nearest_destination(self, lat: float, lon: float, truck_type: str, exclude: Collection[int] = ()) -> Optional[TruckAssignment]:
+        """
+        :param lat: Where the vehicle starts
+        :param lon: Where the vehicle starts
+        :param truck_type: The type of vehicle, like 'fuel_jets'
+        :param exclude: Indices into ``destinations`` to skip, like those already being served
+        :returns: The destination this type of vehicle may use that's the shortest drive along the roads (or, if the airport has none,
+                  the shortest straight line), plus the route there; None if no destination is reachable
+        """
+        candidates = [i for i in self._by_truck_type.get(truck_type, ()) if i not in exclude]
+        if not self._incoming:
+            nearest = min(candidates, key=lambda i: haversine_nm(lat, lon, self.destinations[i].lat, self.destinations[i].lon), default=None)
+            return None if nearest is None else TruckAssignment(nearest, None)
+        start = self._snap(lat, lon)
+        best = None
+        for i in candidates:
+            route = self._route(start, i)
+            if route is not None and (best is None or route.distance_m < best.route.distance_m):
+                best = TruckAssignment(i, route)
+        return best
+
+    def assign(self, parking: Optional[Iterable[TruckParking]] = None) -> List[Optional[TruckAssignment]]:
+        """
+        :param parking: The parked vehicles to dispatch; if None, every one at the airport
+        :returns: The result of ``nearest_destination()`` for each vehicle
+        """
+        return [self.nearest_destination(spot.lat, spot.lon, spot.truck_type) for spot in (self.parking if parking is None else parking)]
+
+
+# The cached Airport properties derived from lines of each row code, which we discard when those lines are edited
+_cached_properties_by_row_code = {
+    code: properties
+    for codes, properties in (((RowCode.METADATA,), ('metadata',)),
+                              (frequency_codes, ('frequencies',)),
+                              ((RowCode.TAXI_ROUTE_NODE,), ('taxi_network', 'service_road_network', 'ground_services')),
+                              ((RowCode.TAXI_ROUTE_EDGE,), ('taxi_network',)),
+                              ((RowCode.TAXI_ROUTE_ROAD,), ('service_road_network', 'ground_services')),
+                              ((RowCode.TRUCK_PARKING,), ('truck_parking', 'ground_services')),
+                              ((RowCode.TRUCK_DESTINATION,), ('truck_destinations', 'ground_services')),
+                              (start_location_codes, ('start_locations', 'start_location_index')),
+                              (flow_codes, ('traffic_flows',)))
+    for code in codes
+}
+
+# The AptDat indexes built from lines of each row code, which a collection discards when those lines of one of its airports are edited
+# (except for the metadata index, which it updates in place)
+_indexes_by_row_code = {
+    code: indexes
+    for codes, indexes in ((airport_header_codes, ('name_search', 'coordinates', 'airports_by_id')),
+                           ((RowCode.METADATA,), ('metadata', 'name_search')),
+                           (frequency_codes, ('frequency',)),
+                           (runway_codes, ('coordinates',)))
+    for code in codes
+}
+
+
+def _line_forms(line: Union[str, Sequence[Union[RowCode, int, str, float]]]) -> Tuple[str, List[Union[RowCode, str]]]:
+    """:returns: The raw text & tokens of a line given as either text or tokens"""
+    if isinstance(line, str):
+        raw = line.strip()
+        tokens = AptDatLine.tokenize(raw)
+    else:
+        tokens = [RowCode(int(line[0]))] + [str(token) for token in line[1:]] if line else []
+        raw = ' '.join(map(str, tokens))
+    if not tokens:
+        raise ValueError("Airports can't contain blank lines")
+    return raw, tokens
+
 
 @dataclass
 class Airport:
@@ -291,6 +998,7 @@ class Airport:
     # An intermediate tokenization, used for speed of parsing.
     # The first element is the RowCode of the line, remaining elements (if any) are strings.
     tokenized_lines: List[List[Union[RowCode, str]]] = field(default_factory=list)
+    dirty = False  # True if the airport has been edited (via set_line(), insert_line(), etc.) since it was read or last saved
 
     def __bool__(self):
         return bool(self.tokenized_lines)
@@ -298,6 +1006,18 @@ class Airport:
     def __str__(self):
         return WED_LINE_ENDING.join(self.raw_lines)
 
+    def __getattr__(self, name: str):
+        # Only called for attributes not found the normal way, like the tokens of an airport we've just unpickled
+        if name == 'tokenized_lines':
+            self.tokenized_lines = [AptDatLine.tokenize(line) for line in self.raw_lines if line.lstrip()]
+            return self.tokenized_lines
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def __reduce__(self):
+        # Pickle only the text: tokens are cheap to rebuild, and cached properties would bloat the pickle.
+        # Note that tokens from a TokenInterner (whether interned or numeric) come back as plain strings.
+        return _airport_from_text, (self.from_file, WED_LINE_ENDING.join(self.raw_lines), self.xplane_version)
+
     def head(self, num_lines: int=10) -> str:
         """
         :param num_lines: The max number of lines to return
@@ -310,14 +1030,7 @@ class Airport:
         Writes a complete apt.dat file containing only this airport
         :param path_to_write_to: A complete file path (ending in .dat); if None, we'll use the path this airport came from
         """
-        if not path_to_write_to:
-            path_to_write_to = self.from_file
-        assert str(path_to_write_to).endswith('.dat')
-        with open(str(path_to_write_to), 'w') as f:
-            f.write("I" + WED_LINE_ENDING)
-            f.write(f"{self.xplane_version} Generated by WorldEditor{WED_LINE_ENDING}{WED_LINE_ENDING}")
-            f.write(str(self))
-            f.write(str(RowCode.FILE_END) + WED_LINE_ENDING)
+        write_apt_dat([self], path_to_write_to or self.from_file, self.xplane_version)
 
     @apt_cached_property
     def text(self) -> List[AptDatLine]:
@@ -337,11 +1050,10 @@ class Airport:
     def metadata(self) -> Dict[MetadataKey, str]:
         """:returns: Metadata about the airport defined by X-Plane"""
         out = {}
-        for tokenized_line in self.tokenized_lines:
-            if tokenized_line[0] == RowCode.METADATA:
-                val = ' '.join(tokenized_line[2:]) if len(tokenized_line) > 2 else ''
-                with suppress(ValueError):  # If we don't now about this MetadataKey type, ignore it
-                    out[MetadataKey(tokenized_line[1])] = val
+        for tokenized_line in self.lines_with_row_code(RowCode.METADATA):
+            val = ' '.join(tokenized_line[2:]) if len(tokenized_line) > 2 else ''
+            with suppress(ValueError):  # If we don't now about this MetadataKey type, ignore it
+                out[MetadataKey(tokenized_line[1])] = val
         return out
 
     @property
@@ -384,7 +1096,12 @@ class Airport:
         """
         :returns: True if this airport defines communication radio frequencies for interacting with ATC
         """
-        return self.has_row_code([RowCode.FREQUENCY_AWOS, RowCode.FREQUENCY_CTAF, RowCode.FREQUENCY_DELIVERY, RowCode.FREQUENCY_GROUND, RowCode.FREQUENCY_TOWER, RowCode.FREQUENCY_APPROACH, RowCode.FREQUENCY_CENTER])
+        return self.has_row_code(frequency_codes)
+
+    @apt_cached_property
+    def frequencies(self) -> List[Frequency]:
+        """:returns: The radio frequencies defined by the airport (from both legacy and 8.33 kHz records), in file order"""
+        return [Frequency.from_tokenized_line(tokens) for tokens in self.lines_with_row_code(frequency_codes)]
 
     def has_row_code(self, row_code_or_codes: Union[int, str, Iterable[int]]) -> bool:
         """
@@ -400,7 +1117,161 @@ class Airport:
 
     @apt_cached_property
     def row_codes(self) -> FrozenSet[RowCode]:
-        return frozenset(line_tokens[0] for line_tokens in self.tokenized_lines)
+        return frozenset(self.row_code_index)
+
+    @apt_cached_property
+    def row_code_index(self) -> Dict[RowCode, List[int]]:
+        """:returns: The (ascending) indices into ``tokenized_lines`` of every line, grouped by row code"""
+        index = defaultdict(list)
+        for i, line_tokens in enumerate(self.tokenized_lines):
+            index[line_tokens[0]].append(i)
+        return dict(index)
+
+    def _positions(self, row_code_or_codes: Union[int, Iterable[int]]) -> Iterable[int]:
+        index = self.row_code_index
+        if isinstance(row_code_or_codes, int):
+            return index.get(row_code_or_codes, ())
+        return heapq.merge(*(index.get(code, ()) for code in row_code_or_codes))
+
+    def lines_with_row_code(self, row_code_or_codes: Union[int, Iterable[int]]) -> List[List[Union[RowCode, str]]]:
+        """
+        :param row_code_or_codes: One or more row codes
+        :returns: The tokenized lines beginning with the specified row code(s), in the order they appear in the airport; costs time proportional only to the number of matching lines
+        """
+        tokenized_lines = self.tokenized_lines
+        return [tokenized_lines[i] for i in self._positions(row_code_or_codes)]
+
+    def line_indices(self, row_code_or_codes: Union[int, Iterable[int]]) -> List[int]:
+        """
+        :param row_code_or_codes: One or more row codes
+        :returns: The (ascending) indices into ``tokenized_lines`` and ``raw_lines`` of the lines beginning with the specified row code(s)
+        """
+        return list(self._positions(row_code_or_codes))
+
+    def _begin_edit(self):
+        if not self.dirty:
+            # Take our own copies of the lines (which may be shared with whoever built us), dropping any blank raw lines,
+            # so that raw_lines[i] always corresponds to tokenized_lines[i]
+            self.tokenized_lines = list(self.tokenized_lines)
+            self.raw_lines = [line for line in self.raw_lines if line.lstrip()]
+            assert len(self.raw_lines) == len(self.tokenized_lines), f"Airport {self.id}'s raw & tokenized lines don't match"
+
+    def _lines_changed(self, row_codes: Iterable[RowCode], lines_moved: bool):
+        """Marks us dirty, and discards the cached properties (and tells the collections that index us) derived from lines with these row codes"""
+        self.dirty = True
+        stale = ['text', 'content_hash']
+        if lines_moved:
+            stale += ['row_code_index', 'row_codes']
+        for code in row_codes:
+            stale += _cached_properties_by_row_code.get(code, ())
+        for name in stale:
+            self.__dict__.pop(name, None)
+        for collection_ref in self.__dict__.get('_indexed_by', ()):
+            collection = collection_ref()
+            if collection is not None:
+                collection._airport_edited(self, row_codes)
+
+    def _indexed_in(self, collection: 'AptDat'):
+        """Registers a collection whose indexes include us, so that our edits can update them (without keeping the collection alive)"""
+        refs = self.__dict__.get('_indexed_by', ())
+        if not any(ref() is collection for ref in refs):
+            self._indexed_by = tuple(ref for ref in refs if ref() is not None) + (weakref.ref(collection),)
+
+    def _check_header(self, index: int, tokens: List[Union[RowCode, str]]):
+        if (tokens[0] in airport_header_codes) != (index == 0):
+            raise ValueError("An airport's first line (and only its first line) must be an airport header")
+
+    def set_line(self, index: int, line: Union[str, Sequence[Union[RowCode, int, str, float]]]):
+        """
+        Replaces one of the airport's lines, keeping ``raw_lines`` and ``tokenized_lines`` in step
+        :param index: The index of the line to replace (as in ``line_indices()``)
+        :param line: The new line, either as text or as tokens (the first being the row code)
+        """
+        self._begin_edit()
+        index = range(len(self.tokenized_lines))[index]
+        raw, tokens = _line_forms(line)
+        self._check_header(index, tokens)
+        old_row_code = self.tokenized_lines[index][0]
+        self.raw_lines[index] = raw
+        self.tokenized_lines[index] = tokens
+        self._lines_changed({old_row_code, tokens[0]}, lines_moved=old_row_code != tokens[0])
+
+    def insert_line(self, line: Union[str, Sequence[Union[RowCode, int, str, float]]], index: Optional[int] = None) -> int:
+        """
+        :param line: The line to add, either as text or as tokens (the first being the row code)
+        :param index: The index the new line should have; if None, we'll put it after the last line with the same row code (or at the end of the airport, if there are none)
+        :returns: The index of the new line
+        """
+        raw, tokens = _line_forms(line)
+        if index is None:
+            same_code = self.row_code_index.get(tokens[0])
+            index = same_code[-1] + 1 if same_code else len(self.tokenized_lines)
+        elif not 0 <= index <= len(self.tokenized_lines):
+            raise IndexError(f"Can't insert a line at index {index} of airport {self.id}")
+        if index == 0 and self.tokenized_lines:
+            raise ValueError("Can't insert a line ahead of the airport header; use set_line() to replace the header")
+        self._check_header(index, tokens)
+        self._begin_edit()
+        self.raw_lines.insert(index, raw)
+        self.tokenized_lines.insert(index, tokens)
+        self._lines_changed({tokens[0]}, lines_moved=True)
+        return index
+
+    def delete_lines(self, indices: Iterable[int]) -> int:
+        """
+        :param indices: The indices of the lines to remove (which may not include the airport header)
+        :returns: The number of lines removed
+        """
+        indices = sorted({range(len(self.tokenized_lines))[i] for i in indices}, reverse=True)
+        if not indices:
+            return 0
+        if indices[-1] == 0:
+            raise ValueError("Can't delete an airport's header line")
+        self._begin_edit()
+        row_codes = set()
+        for i in indices:
+            del self.raw_lines[i]
+            row_codes.add(self.tokenized_lines.pop(i)[0])
+        self._lines_changed(row_codes, lines_moved=True)
+        return len(indices)
+
+    def delete_lines_with_row_code(self, row_code_or_codes: Union[int, Iterable[int]],
+                                   where: Optional[Callable[[List[Union[RowCode, str]]], bool]] = None) -> int:
+        """
+        :param row_code_or_codes: One or more row codes
+        :param where: If provided, we'll only delete the lines whose tokens satisfy this predicate
+        :returns: The number of lines removed
+        """
+        tokenized_lines = self.tokenized_lines
+        return self.delete_lines([i for i in self._positions(row_code_or_codes) if where is None or where(tokenized_lines[i])])
+
+    def update_lines_with_row_code(self, row_code_or_codes: Union[int, Iterable[int]],
+                                   update: Callable[[List[Union[RowCode, str]]], Union[str, Sequence, None]]) -> int:
+        """
+        :param row_code_or_codes: One or more row codes
+        :param update: Called with the tokens of each matching line; returns the replacement line (as text or tokens), or None to leave it as-is
+        :returns: The number of lines replaced
+        """
+        updated = 0
+        for i in self.line_indices(row_code_or_codes):
+            replacement = update(list(self.tokenized_lines[i]))
+            if replacement is not None:
+                self.set_line(i, replacement)
+                updated += 1
+        return updated
+
+    def set_metadata(self, key: MetadataKey, value: Optional[str]):
+        """
+        Adds, changes, or (if ``value`` is None) removes one of the airport's 1302 metadata lines
+        """
+        existing = [i for i in self._positions(RowCode.METADATA) if self.tokenized_lines[i][1:2] == [key.value]]
+        if value is None:
+            self.delete_lines(existing)
+        elif existing:
+            self.set_line(existing[0], f"{RowCode.METADATA} {key.value} {value}")
+            self.delete_lines(existing[1:])
+        else:
+            self.insert_line(f"{RowCode.METADATA} {key.value} {value}")
 
     @staticmethod
     def _rwy_center(rwy_tokens: List[Union[RowCode, str]], start: int, end: int) -> float:
@@ -439,18 +1310,78 @@ class Airport:
             return float(rwy_0[3])
 
     def _first_runway_tokens(self) -> List[Union[RowCode, str]]:
-        rwy_0_list = list(itertools.islice(self._runway_lines(), 1))
-        assert rwy_0_list, f"Airport {self.id} appears to have no runway lines: {self.tokenized_lines}"
-        return rwy_0_list[0]
+        index = self.row_code_index
+        first_positions = [index[code][0] for code in runway_codes if code in index]
+        assert first_positions, f"Airport {self.id} appears to have no runway lines: {self.tokenized_lines}"
+        return self.tokenized_lines[min(first_positions)]
 
-    def _runway_lines(self) -> Iterable[List[Union[RowCode, str]]]:
-        return (line_tokens
-                for line_tokens in self.tokenized_lines
-                if line_tokens[0] in runway_codes)
+    def _runway_lines(self) -> List[List[Union[RowCode, str]]]:
+        return self.lines_with_row_code(runway_codes)
 
     @apt_cached_property
     def taxi_network(self) -> TaxiRouteNetwork:
-        return TaxiRouteNetwork.from_tokenized_lines(self.tokenized_lines)
+        return TaxiRouteNetwork.from_tokenized_lines(self.lines_with_row_code((RowCode.TAXI_ROUTE_NODE, RowCode.TAXI_ROUTE_EDGE)))
+
+    @apt_cached_property
+    def service_road_network(self) -> TaxiRouteNetwork:
+        """:returns: The roads for ground service vehicles (1206 records), along with the taxi route nodes they connect"""
+        edges = [TaxiRouteEdge.from_tokenized_line(tokens) for tokens in self.lines_with_row_code(RowCode.TAXI_ROUTE_ROAD)]
+        road_node_ids = {edge.node_begin for edge in edges} | {edge.node_end for edge in edges}
+        nodes = {node.id: node
+                 for node in (TaxiRouteNode(id=int(tokens[4]), lon=float(tokens[2]), lat=float(tokens[1]))
+                              for tokens in self.lines_with_row_code(RowCode.TAXI_ROUTE_NODE))
+                 if node.id in road_node_ids}
+        return TaxiRouteNetwork(nodes=nodes, edges=edges)
+
+    @apt_cached_property
+    def truck_parking(self) -> List[TruckParking]:
+        """:returns: The parking spots for ground service vehicles, in file order"""
+        return [TruckParking.from_tokenized_line(tokens) for tokens in self.lines_with_row_code(RowCode.TRUCK_PARKING)]
+
+    @apt_cached_property
+    def truck_destinations(self) -> List[TruckDestination]:
+        """:returns: The destinations for ground service vehicles, in file order"""
+        return [TruckDestination.from_tokenized_line(tokens) for tokens in self.lines_with_row_code(RowCode.TRUCK_DESTINATION)]
+
+    @apt_cached_property
+    def ground_services(self) -> GroundServiceIndex:
+        """:returns: An index for dispatching ground service vehicles to their destinations along the service roads"""
+        return GroundServiceIndex(self.truck_parking, self.truck_destinations, self.service_road_network)
+
+    @apt_cached_property
+    def start_locations(self) -> List[StartupLocation]:
+        """:returns: The airport's ramp starts (gates, hangars, tie-downs, etc.), in file order"""
+        return StartupLocation.from_tokenized_lines(self.lines_with_row_code(start_location_codes))
+
+    @apt_cached_property
+    def start_location_index(self) -> StartupLocationIndex:
+        """:returns: An index for quickly finding the ramp starts that meet your criteria"""
+        return StartupLocationIndex(self.start_locations)
+
+    @apt_cached_property
+    def traffic_flows(self) -> List[TrafficFlow]:
+        """:returns: The airport's traffic flows, in the order ATC considers them"""
+        return TrafficFlow.from_tokenized_lines(self.lines_with_row_code(flow_codes))
+
+    def active_traffic_flow(self, conditions: WeatherConditions) -> Optional[TrafficFlow]:
+        """:returns: The first of the airport's traffic flows that may be used under the specified conditions, or None if none match"""
+        for flow in self.traffic_flows:
+            if flow.accepts(conditions):
+                return flow
+        return None
+
+    def normalized_lines(self) -> List[str]:
+        """:returns: The airport's lines with insignificant whitespace removed (so that, e.g., re-indenting an airport doesn't change it)"""
+        return [' '.join(line.split()) for line in self.raw_lines if line.strip()]
+
+    @apt_cached_property
+    def content_hash(self) -> str:
+        """:returns: A digest of the airport's normalized lines; two airports with the same hash have the same content"""
+        digest = hashlib.blake2b(digest_size=16)
+        for line in self.normalized_lines():
+            digest.update(line.encode('utf8'))
+            digest.update(b'\n')
+        return digest.hexdigest()
 
     @staticmethod
     def from_lines(dat_lines: List[str], from_file_name: Optional[Path] = None, xplane_version: int = 1100) -> 'Airport':
@@ -472,35 +1403,718 @@ class Airport:
         return Airport.from_lines(cleaned_lines, from_file_name, xplane_version)
 
 
+def _airport_from_text(from_file: Optional[Path], text: str, xplane_version: int) -> Airport:
+    """:returns: An airport whose tokens won't be built until they're first needed (when unpickling or loading from SQLite)"""
+    apt = Airport.__new__(Airport)
+    apt.from_file = from_file
+    apt.raw_lines = text.split(WED_LINE_ENDING) if text else []
+    apt.xplane_version = xplane_version
+    return apt  # Leaving the tokens to be rebuilt by __getattr__() when first used
+
+
+@dataclass
+class AirportDiff:
+    """A change to a single airport between two versions of an apt.dat"""
+    old: Airport
+    new: Airport
+
+    @property
+    def id(self) -> str:
+        return self.new.id
+
+    @apt_cached_property
+    def lines(self) -> List[str]:
+        """:returns: A unified diff of the two versions' normalized lines"""
+        return list(difflib.unified_diff(self.old.normalized_lines(), self.new.normalized_lines(),
+                                         str(self.old.from_file or 'old'), str(self.new.from_file or 'new'), lineterm=''))
+
+
+@dataclass
+class AptDatDiff:
+    """The differences between two collections of airports, matched by airport ID"""
+    added: List[Airport] = field(default_factory=list)          # Airports only in the new version
+    removed: List[Airport] = field(default_factory=list)        # Airports only in the old version
+    changed: List[AirportDiff] = field(default_factory=list)    # Airports in both versions, whose content differs
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+class ParseStats:
+    """
+    Instrumentation for a single parse of an apt.dat file.
+    Pass one to ``AptDat()`` or ``AptDat.from_file_text()`` to find out where the time goes;
+    when you don't pass one, parsing takes the uninstrumented (fast) path.
+
+    Note that timing each line adds measurable overhead of its own, so compare ``lines_per_second``
+    only against other instrumented parses.
+    """
+    def __init__(self, top_n: int = 10, on_airport: Optional[Callable[['Airport', float], None]] = None):
+        """
+        :param top_n: How many of the slowest & largest airports to keep track of
+        :param on_airport: Called with each airport and the seconds spent parsing it, as soon as it has been parsed (e.g., to feed your production metrics)
+        """
+        self.top_n = top_n
+        self.on_airport = on_airport
+        self.lines = 0                     # Lines read, including blank & ignorable lines
+        self.airports = 0
+        self.tokenize_seconds = 0.0        # Time spent in AptDatLine.tokenize()
+        self.total_seconds = 0.0           # Wall time for the complete parse
+        self.row_code_lines = Counter()    # type: Counter[RowCode]
+        self.row_code_tokens = Counter()   # type: Counter[RowCode]
+        self._largest = []                 # type: List[Tuple[int, str]]  # min-heap of (line count, airport ID)
+        self._slowest = []                 # type: List[Tuple[float, str]]  # min-heap of (seconds, airport ID)
+
+    @property
+    def build_seconds(self) -> float:
+        """:returns: Time spent outside the tokenizer, grouping lines into ``Airport`` objects"""
+        return self.total_seconds - self.tokenize_seconds
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.lines / self.total_seconds if self.total_seconds else 0.0
+
+    @property
+    def largest_airports(self) -> List[Tuple[str, int]]:
+        """:returns: (airport ID, line count) for the airports with the most lines, largest first"""
+        return [(apt_id, num_lines) for num_lines, apt_id in sorted(self._largest, reverse=True)]
+
+    @property
+    def slowest_airports(self) -> List[Tuple[str, float]]:
+        """:returns: (airport ID, seconds) for the airports that took longest to parse, slowest first"""
+        return [(apt_id, seconds) for seconds, apt_id in sorted(self._slowest, reverse=True)]
+
+    def instrument(self, tokenize: Callable[[str], List[Union[RowCode, str]]], add_airport: Callable[['Airport'], None]):
+        """
+        :param tokenize: The tokenizer a parse would use
+        :param add_airport: Called by the parse with each airport as it's completed
+        :returns: Equivalents of ``tokenize`` and ``add_airport`` that record what they do in these stats;
+                  each airport's time is measured from the completion of the one before it (or from this call)
+        """
+        perf_counter = time.perf_counter
+        row_code_lines, row_code_tokens = self.row_code_lines, self.row_code_tokens
+        airport_start = perf_counter()
+
+        def instrumented_tokenize(line: str) -> List[Union[RowCode, str]]:
+            self.lines += 1
+            tokenize_start = perf_counter()
+            tokens = tokenize(line)
+            self.tokenize_seconds += perf_counter() - tokenize_start
+            if tokens:
+                row_code_lines[tokens[0]] += 1
+                row_code_tokens[tokens[0]] += len(tokens)
+            return tokens
+
+        def instrumented_add_airport(apt: 'Airport'):
+            nonlocal airport_start
+            add_airport(apt)
+            airport_end = perf_counter()
+            self.record_airport(apt, airport_end - airport_start)
+            airport_start = airport_end
+
+        return instrumented_tokenize, instrumented_add_airport
+
+    def record_airport(self, apt: 'Airport', seconds: float):
+        self.airports += 1
+        for heap, entry in ((self._largest, (len(apt.tokenized_lines), apt.id)), (self._slowest, (seconds, apt.id))):
+            if len(heap) < self.top_n:
+                heapq.heappush(heap, entry)
+            else:
+                heapq.heappushpop(heap, entry)
+        if self.on_airport:
+            self.on_airport(apt, seconds)
+
+    def as_dict(self) -> Dict[str, object]:
+        """:returns: A JSON-serializable summary of the stats"""
+        return {
+            'lines': self.lines,
+            'airports': self.airports,
+            'total_seconds': self.total_seconds,
+            'tokenize_seconds': self.tokenize_seconds,
+            'build_seconds': self.build_seconds,
+            'lines_per_second': self.lines_per_second,
+            'row_code_lines': {int(code): count for code, count in self.row_code_lines.items()},
+            'row_code_tokens': {int(code): count for code, count in self.row_code_tokens.items()},
+            'largest_airports': self.largest_airports,
+            'slowest_airports': self.slowest_airports,
+        }
+
+
+# Compression formats we read & write transparently, keyed by file suffix: (magic bytes at the start of the file, the module's open())
+_compression_formats = {
+    '.gz': (b'\x1f\x8b', gzip.open),
+    '.bz2': (b'BZh', bz2.open),
+    '.xz': (b'\xfd7zXZ\x00', lzma.open),
+}
+
+
+def _apt_dat_suffixes(path: Path) -> Tuple[str, Optional[str]]:
+    """:returns: The (lowercase) suffix of the apt.dat file itself, and the compression suffix (like ``.gz``), if any"""
+    suffixes = [suffix.lower() for suffix in path.suffixes[-2:]]
+    if suffixes and suffixes[-1] in _compression_formats:
+        return (suffixes[0] if len(suffixes) == 2 else ''), suffixes[-1]
+    return (suffixes[-1] if suffixes else ''), None
+
+
+def _open_apt_dat(path: Path) -> io.TextIOBase:
+    """:returns: The apt.dat at ``path``, opened for reading as text, decompressing on the fly if it's gzip, bz2, or xz data"""
+    with path.open('rb') as raw_file:
+        magic = raw_file.read(8)
+    compression = next((suffix for suffix, (magic_bytes, _) in _compression_formats.items() if magic.startswith(magic_bytes)),
+                       _apt_dat_suffixes(path)[1])
+    if compression:
+        return io.TextIOWrapper(_compression_formats[compression][1](str(path), 'rb'), encoding='utf8')
+    return path.open(encoding='utf8')
+
+
+def _iter_lines(text_file: io.TextIOBase, chunk_size: int = 1 << 20) -> Iterable[str]:
+    """
+    :returns: A generator of the lines in the file, without their line endings.
+              Reading (and decompressing) large chunks at a time is much faster than iterating over the file object directly.
+    """
+    tail = ''
+    while True:
+        chunk = text_file.read(chunk_size)
+        if not chunk:
+            break
+        lines = (tail + chunk).splitlines()
+        tail = '' if chunk.endswith(('\n', '\r')) else lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def write_apt_dat(airports: Iterable['Airport'], path_to_write_to: PathLike, xplane_version: int = 1100, atomic: bool = True, buffer_size: int = 1 << 20):
+    """
+    Streams airports to a complete apt.dat file, holding no more than a single airport's text in memory at a time
+    (so ``airports`` may be a generator, like a filter over a huge ``AptDat``).
+
+    :param airports: The airports to write, in order
+    :param path_to_write_to: A complete file path, ending in .dat (or .dat.gz, .dat.bz2, or .dat.xz, in which case we compress the data accordingly)
+    :param xplane_version: The version of the apt.dat spec to declare in the file header
+    :param atomic: If true, we write to a temporary file alongside the destination, then rename it into place, so readers never see a half-written file
+    :param buffer_size: Bytes of output we buffer between writes to disk
+    """
+    assert path_to_write_to, "No path to write the apt.dat to"
+    path = Path(path_to_write_to).expanduser()
+    dat_suffix, compression = _apt_dat_suffixes(path)
+    assert dat_suffix == '.dat', f"Invalid apt.dat path: {path_to_write_to}"
+
+    def blocks() -> Iterable[str]:
+        yield f"I{WED_LINE_ENDING}{xplane_version} Generated by WorldEditor{WED_LINE_ENDING}{WED_LINE_ENDING}"
+        for apt in airports:
+            # Joining a whole airport is far faster than many tiny writes, and bounded by the size of a single airport
+            yield WED_LINE_ENDING.join(apt.raw_lines) + WED_LINE_ENDING * 2
+        yield str(RowCode.FILE_END) + WED_LINE_ENDING
+
+    if atomic:
+        fd, write_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix='.tmp')
+        raw_file = os.fdopen(fd, 'wb', buffering=0)
+    else:
+        write_path = str(path)
+        raw_file = open(write_path, 'wb', buffering=0)
+
+    try:
+        with raw_file:
+            binary_file = _compression_formats[compression][1](raw_file, 'wb') if compression else raw_file
+            with io.TextIOWrapper(io.BufferedWriter(binary_file, buffer_size), encoding='utf8', newline='') as f:
+                f.writelines(blocks())
+        if atomic:
+            os.chmod(write_path, stat.S_IMODE(path.stat().st_mode) if path.exists() else 0o644)
+            os.replace(write_path, str(path))
+    except BaseException:
+        if atomic:
+            with suppress(OSError):
+                os.unlink(write_path)
+        raise
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE airports (key INTEGER PRIMARY KEY, id TEXT NOT NULL, name TEXT, header_code INTEGER, elevation_ft_amsl REAL,
+                       has_atc INTEGER, latitude REAL, longitude REAL, xplane_version INTEGER, from_file TEXT, text TEXT);
+CREATE TABLE runways (airport_key INTEGER REFERENCES airports, runway_type TEXT, end1 TEXT, end2 TEXT, width_m REAL, surface TEXT,
+                      lat1 REAL, lon1 REAL, lat2 REAL, lon2 REAL);
+CREATE TABLE metadata (airport_key INTEGER REFERENCES airports, key TEXT, value TEXT);
+CREATE TABLE frequencies (airport_key INTEGER REFERENCES airports, frequency_khz INTEGER, frequency_type TEXT, name TEXT);
+CREATE TABLE start_locations (airport_key INTEGER REFERENCES airports, name TEXT, location_type TEXT, lat REAL, lon REAL, heading REAL,
+                              aircraft_types TEXT, icao_width TEXT, operation_type TEXT, airline_codes TEXT);
+CREATE TABLE taxi_nodes (airport_key INTEGER REFERENCES airports, node_id INTEGER, lat REAL, lon REAL);
+CREATE TABLE taxi_edges (airport_key INTEGER REFERENCES airports, node_begin INTEGER, node_end INTEGER, name TEXT,
+                         is_runway INTEGER, one_way INTEGER, icao_width TEXT);
+"""
+# Created after the bulk insert, which is much faster than maintaining them row by row
+_SQLITE_INDEXES = """
+CREATE INDEX airports_id ON airports (id COLLATE NOCASE);
+CREATE INDEX airports_location ON airports (latitude, longitude);
+CREATE INDEX runways_airport ON runways (airport_key);
+CREATE INDEX metadata_airport ON metadata (airport_key);
+CREATE INDEX metadata_key_value ON metadata (key, value COLLATE NOCASE);
+CREATE INDEX frequencies_airport ON frequencies (airport_key);
+CREATE INDEX frequencies_khz ON frequencies (frequency_khz);
+CREATE INDEX start_locations_airport ON start_locations (airport_key);
+CREATE INDEX taxi_nodes_airport ON taxi_nodes (airport_key, node_id);
+CREATE INDEX taxi_edges_airport ON taxi_edges (airport_key);
+"""
+
+
+def _sqlite_runway_row(key: int, tokens: List[Union[RowCode, str]]) -> tuple:
+    if tokens[0] == RowCode.LAND_RUNWAY:
+        return (key, RunwayType.LAND_RUNWAY.name, tokens[8], tokens[17], float(tokens[1]), tokens[2],
+                float(tokens[9]), float(tokens[10]), float(tokens[18]), float(tokens[19]))
+    elif tokens[0] == RowCode.WATER_RUNWAY:
+        return (key, RunwayType.WATER_RUNWAY.name, tokens[3], tokens[6], float(tokens[1]), None,
+                float(tokens[4]), float(tokens[5]), float(tokens[7]), float(tokens[8]))
+    return key, RunwayType.HELIPAD.name, tokens[1], None, float(tokens[6]), tokens[7], float(tokens[2]), float(tokens[3]), None, None
+
+
+def _sqlite_rows(key: int, apt: Airport, rows: Dict[str, List[tuple]]):
+    """Appends the rows representing this airport to the list for each table"""
+    located = _has_runway(apt)
+    header = apt.tokenized_lines[0]
+    rows['airports'].append((key, apt.id, apt.name, int(header[0]), apt.elevation_ft_amsl, int(apt.has_atc),
+                             apt.latitude if located else None, apt.longitude if located else None,
+                             apt.xplane_version, str(apt.from_file) if apt.from_file else None, WED_LINE_ENDING.join(apt.raw_lines)))
+    for tokens in apt.lines_with_row_code(runway_codes):
+        with suppress(IndexError, ValueError):  # Skip malformed records, rather than abandoning the export
+            rows['runways'].append(_sqlite_runway_row(key, tokens))
+    rows['metadata'] += [(key, meta_key.value, value) for meta_key, value in apt.metadata.items()]
+    # Parsed without caching the results on the airport, since an export of the whole world would otherwise bloat it considerably
+    frequencies = (Frequency.from_tokenized_line(tokens) for tokens in apt.lines_with_row_code(frequency_codes))
+    rows['frequencies'] += [(key, freq.frequency_khz, freq.frequency_type.value, freq.name) for freq in frequencies]
+    start_locations = StartupLocation.from_tokenized_lines(apt.lines_with_row_code(start_location_codes))
+    rows['start_locations'] += [(key, loc.name, loc.location_type, loc.lat, loc.lon, loc.heading, '|'.join(sorted(loc.aircraft_types)),
+                                 str(loc.icao_width) if loc.icao_width else None, loc.operation_type, ' '.join(sorted(loc.airline_codes)))
+                                for loc in start_locations]
+    network = TaxiRouteNetwork.from_tokenized_lines(apt.lines_with_row_code((RowCode.TAXI_ROUTE_NODE, RowCode.TAXI_ROUTE_EDGE)))
+    rows['taxi_nodes'] += [(key, node.id, node.lat, node.lon) for node in network.nodes.values()]
+    rows['taxi_edges'] += [(key, edge.node_begin, edge.node_end, edge.name, int(edge.is_runway), int(edge.one_way),
+                            str(edge.icao_width) if edge.icao_width else None)
+                           for edge in network.edges]
+
+
+def _execute_statements(conn: sqlite3.Connection, script: str):
+    # Unlike executescript(), this doesn't commit first, so it stays within our transaction
+    for statement in script.split(';'):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def write_sqlite(airports: Iterable[Airport], path: PathLike, batch_size: int = 50000):
+    """
+    Exports airports to a SQLite database, with a table each for airports, runways, metadata, frequencies,
+    start locations, and taxi route nodes & edges (the latter all keyed by ``airport_key``).
+    The database is built in a temporary file and moved into place once complete, replacing any existing file.
+
+    :param airports: The airports to export
+    :param path: Where to write the database
+    :param batch_size: The number of rows we buffer (across all tables) before inserting them
+    """
+    path = Path(path).expanduser()
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=path.name, suffix='.tmp')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path, isolation_level=None)
+        try:
+            # Safe to skip the journal: if we fail partway, we'll throw away the whole file anyway
+            conn.execute('PRAGMA journal_mode = OFF')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('BEGIN')
+            _execute_statements(conn, _SQLITE_SCHEMA)
+            tables = ('airports', 'runways', 'metadata', 'frequencies', 'start_locations', 'taxi_nodes', 'taxi_edges')
+            rows = {table: [] for table in tables}
+
+            def flush():
+                for table, table_rows in rows.items():
+                    if table_rows:
+                        placeholders = ', '.join('?' * len(table_rows[0]))
+                        conn.executemany(f'INSERT INTO {table} VALUES ({placeholders})', table_rows)
+                        table_rows.clear()
+
+            buffered = 0
+            for key, apt in enumerate(airports):
+                _sqlite_rows(key, apt, rows)
+                buffered += 1 + len(apt.raw_lines)
+                if buffered >= batch_size:
+                    flush()
+                    buffered = 0
+            flush()
+            _execute_statements(conn, _SQLITE_INDEXES)
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+class AirportDatabase:
+    """
+    Reads a SQLite database written by ``AptDat.to_sqlite()``.
+    Use ``connection`` for arbitrary SQL queries; look up airports by ID to get ``Airport`` objects,
+    which we build from the stored text only when you ask for them.
+    """
+    def __init__(self, path: PathLike):
+        path = Path(path).expanduser()
+        if not path.is_file():
+            raise FileNotFoundError(f"No airport database at {path}")
+        self.connection = sqlite3.connect(str(path))
+        self._airports = {}  # Airport key -> the airport we've already built
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _hydrate(self, key: int, from_file: Optional[str], text: str, xplane_version: int) -> Airport:
+        with suppress(KeyError):
+            return self._airports[key]
+        apt = self._airports[key] = _airport_from_text(Path(from_file) if from_file else None, text, xplane_version)
+        return apt
+
+    def search_by_id(self, id: str) -> Optional[Airport]:
+        """:returns: The airport with this ID (case-insensitive), or None if there isn't one in the database"""
+        row = self.connection.execute('SELECT key, from_file, text, xplane_version FROM airports WHERE id = ? COLLATE NOCASE ORDER BY key LIMIT 1',
+                                      (id,)).fetchone()
+        return self._hydrate(*row) if row else None
+
+    def __getitem__(self, id: str) -> Airport:
+        apt = self.search_by_id(id)
+        if apt is None:
+            raise KeyError(f"No airport with ID '{id}'")
+        return apt
+
+    def __contains__(self, id: str) -> bool:
+        return self.connection.execute('SELECT 1 FROM airports WHERE id = ? COLLATE NOCASE', (id,)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM airports').fetchone()[0]
+
+    @property
+    def ids(self) -> List[str]:
+        return [row[0] for row in self.connection.execute('SELECT id FROM airports ORDER BY key')]
+
+    def airports(self, where: str = '1', params: Iterable = ()) -> Iterable[Airport]:
+        """
+        :param where: A SQL condition on the ``airports`` table, like ``"latitude BETWEEN ? AND ?"`` or
+                      ``"key IN (SELECT airport_key FROM metadata WHERE key = 'country' AND value = ?)"``
+        :param params: The values of any ``?`` placeholders in ``where``
+        :returns: A generator of the matching airports, in their original order
+        """
+        for row in self.connection.execute(f'SELECT key, from_file, text, xplane_version FROM airports WHERE {where} ORDER BY key', tuple(params)):
+            yield self._hydrate(*row)
+
+    def to_apt_dat(self) -> 'AptDat':
+        """:returns: Every airport in the database"""
+        out = AptDat()
+        out.airports = list(self.airports())
+        if out.airports:
+            out.xplane_version = max(apt.xplane_version for apt in out.airports)
+        return out
+
+
+def _split_file_header(dat_lines: Iterable[str]) -> Tuple[Optional[int], Iterable[str]]:
+    """:returns: The X-Plane version from the file header (or None if the file has no header), and the lines following the header"""
+    dat_lines = iter(dat_lines)
+    first_lines = list(itertools.islice(dat_lines, 2))
+    has_file_header = len(first_lines) == 2 and first_lines[0].strip() in ('A', 'I') and 'Generated by WorldEditor' in first_lines[1]
+    if not has_file_header:
+        return None, itertools.chain(first_lines, dat_lines)
+    xplane_version = AptDatLine(first_lines[1]).row_code
+    assert xplane_version < 9999, f"Invalid X-Plane apt.dat spec version {xplane_version} specified in file header"
+    return xplane_version, dat_lines
+
+
+def _iter_airport_blocks(dat_lines: Iterable[str]) -> Iterable[List[str]]:
+    """
+    Splits the lines of an apt.dat (following the file header) into airports without tokenizing them,
+    yielding the same raw lines ``AptDat`` would give each ``Airport``.
+    """
+    header_codes = {str(code.value) for code in airport_header_codes}
+    block = []
+    for line in dat_lines:
+        first_token = line.split(None, 1)[:1]
+        if first_token:
+            if first_token[0] in header_codes and block:
+                yield block
+                block = []
+            block.append(line)
+    if block:
+        if block[-1].split() == [str(RowCode.FILE_END.value)]:
+            block.pop()
+        if block:
+            yield block
+
+
+# Job ID -> (airports, function to apply) for in-flight parallel maps; forked workers inherit this, so airports never need pickling
+_parallel_jobs = {}
+_parallel_job_ids = itertools.count()
+
+
+def _map_forked_chunk(job_id: int, start: int, stop: int) -> List[Any]:
+    """Runs in a forked worker, applying the job's function to the airports it inherited from the parent"""
+    airports, fn = _parallel_jobs[job_id]
+    return [fn(apt) for apt in itertools.islice(airports, start, stop)]
+
+
+def _map_shipped_chunk(fn: Callable[[Airport], Any], airport_lines: List[Tuple[Optional[PathLike], List[str], int]]) -> List[Any]:
+    """Runs in a spawned worker (where we can't fork), re-tokenizing the raw lines we were sent"""
+    return [fn(Airport.from_lines(raw_lines, from_file, xplane_version)) for from_file, raw_lines, xplane_version in airport_lines]
+
+
+def _has_runway(apt: Airport) -> bool:
+    """:returns: True if the airport has a location (which X-Plane defines by its first runway)"""
+    return apt.has_row_code(runway_codes)
+
+
+class AirportCoordinates(NamedTuple):
+    """The locations of every airport in a collection, as flat arrays"""
+    rows: Dict[str, int]  # Uppercase airport ID -> index into lats & lons (of the first airport with that ID)
+    lats: array           # NaN for airports with no runways (and thus no location)
+    lons: array
+
+    @staticmethod
+    def from_airports(airports: Iterable[Airport]) -> 'AirportCoordinates':
+        out = AirportCoordinates({}, array('d'), array('d'))
+        for apt in airports:
+            out.rows.setdefault(apt.id.upper(), len(out.lats))
+            located = _has_runway(apt)
+            out.lats.append(apt.latitude if located else nan)
+            out.lons.append(apt.longitude if located else nan)
+        return out
+
+    def select(self, ids: Iterable[str]) -> Tuple[array, array]:
+        """:returns: The latitudes & longitudes of the airports with these IDs (case-insensitive), in order; raises a KeyError for unknown IDs"""
+        rows = []
+        for apt_id in ids:
+            try:
+                rows.append(self.rows[apt_id.upper()])
+            except KeyError:
+                raise KeyError(f"No airport with ID '{apt_id}'") from None
+        return array('d', (self.lats[i] for i in rows)), array('d', (self.lons[i] for i in rows))
+
+
+class MetadataIndex:
+    """
+    An inverted index from each ``MetadataKey`` value (like the country or IATA code) to the airports that use it,
+    supporting exact and prefix lookups without extracting every airport's metadata on every query.
+    Values are compared case-insensitively.
+    """
+    def __init__(self, airports: Iterable[Airport] = ()):
+        self._airports_by_value = {key: defaultdict(list) for key in MetadataKey}
+        # id() of each indexed airport -> the (key, uppercase value) pairs we indexed it under, since its metadata may since have been edited
+        self._indexed_under = defaultdict(list)
+        for apt in airports:
+            indexed_under = self._indexed_under[id(apt)]  # Present even for airports with no metadata, so we know what we've indexed
+            for key, value in apt.metadata.items():
+                self._airports_by_value[key][value.upper()].append(apt)
+                indexed_under.append((key, value.upper()))
+        # Sorting once after the bulk load is far cheaper than inserting each value in order
+        self._sorted_values = {key: sorted(by_value) for key, by_value in self._airports_by_value.items()}
+
+    def add(self, apt: Airport):
+        """Indexes a newly added airport"""
+        indexed_under = self._indexed_under[id(apt)]
+        for key, value in apt.metadata.items():
+            value = value.upper()
+            by_value = self._airports_by_value[key]
+            if value not in by_value:
+                bisect.insort(self._sorted_values[key], value)
+            by_value[value].append(apt)
+            indexed_under.append((key, value))
+
+    def remove(self, apt: Airport):
+        """Removes an airport (identified by object identity, not equality) from the index"""
+        for key, value in self._indexed_under.pop(id(apt), ()):
+            by_value = self._airports_by_value[key]
+            remaining = [indexed for indexed in by_value.get(value, []) if indexed is not apt]
+            if remaining:
+                by_value[value] = remaining
+            elif value in by_value:
+                del by_value[value]
+                sorted_values = self._sorted_values[key]
+                del sorted_values[bisect.bisect_left(sorted_values, value)]
+
+    def update(self, apt: Airport):
+        """Re-indexes an airport whose metadata has been edited (if it's one we've indexed)"""
+        if id(apt) in self._indexed_under:
+            self.remove(apt)
+            self.add(apt)
+
+    def lookup(self, key: MetadataKey, value: str, prefix: bool = False) -> List[Airport]:
+        """
+        :param key: The metadata field to search, like ``MetadataKey.COUNTRY``
+        :param value: The value to match, case-insensitive
+        :param prefix: If true, we'll match all values starting with ``value`` (so ``'United'`` would match both the US and UK)
+        :returns: The matching airports, in the order they were indexed (grouped by value for prefix searches)
+        """
+        value = value.upper()
+        by_value = self._airports_by_value[key]
+        if not prefix:
+            return list(by_value.get(value, []))
+        sorted_values = self._sorted_values[key]
+        out = []
+        for candidate in itertools.islice(sorted_values, bisect.bisect_left(sorted_values, value), None):
+            if not candidate.startswith(value):
+                break
+            out += by_value[candidate]
+        return out
+
+    def values(self, key: MetadataKey) -> List[str]:
+        """:returns: Every distinct (uppercased) value of this metadata field, in sorted order"""
+        return list(self._sorted_values[key])
+
+
+_non_alphanumeric = re.compile(r'[^0-9A-Z]+')
+# The metadata we index alongside the airport ID, so users can find airports by any code they know them by
+_searchable_code_keys = (MetadataKey.ICAO_CODE, MetadataKey.IATA_CODE, MetadataKey.FAA_CODE, MetadataKey.LOCAL_CODE)
+
+
+def _search_words(text: str) -> List[str]:
+    """:returns: The uppercase, accent-free alphanumeric words in the text, like ['PERU', 'INTL'] for 'Perú Int\'l'"""
+    decomposed = unicodedata.normalize('NFKD', text.upper())
+    return _non_alphanumeric.sub(' ', ''.join(c for c in decomposed if not unicodedata.combining(c))).split()
+
+
+def _trigrams(word: str, complete: bool = True) -> FrozenSet[str]:
+    """
+    :param complete: False if the word may still be being typed, in which case we won't require that it end here
+    :returns: The trigrams of the word, padded with spaces so that matching the start (and end) of the word counts
+    """
+    padded = ' ' + word + (' ' if complete else '')
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class NameSearchIndex:
+    """
+    A trigram & prefix index over the names, IDs, and ICAO/IATA/FAA/local codes of a list of airports,
+    for ranked, typo-tolerant, type-ahead searches (e.g., "seatle tacoma" or "KSE").
+
+    Build it once (it's independent of any AptDat), then ``save()`` it alongside your data to skip the build next time.
+    """
+    _FILE_FORMAT_VERSION = 1
+    _MIN_SIMILARITY = 0.4  # The fraction of the query's trigrams an airport must contain to match on trigrams alone
+
+    def __init__(self, airports: Iterable[Airport] = ()):
+        self.ids = []  # The ID of the airport at each position in the list we indexed
+        self._trigram_postings = defaultdict(list)  # Trigram -> positions of the airports that contain it
+        self._trigram_counts = []  # Position -> number of distinct trigrams in the airport's words
+        self._codes = defaultdict(list)  # Uppercase code -> positions of the airports known by it
+        word_positions = set()
+        for i, apt in enumerate(airports):
+            self.ids.append(apt.id)
+            codes = {apt.id.upper()} | {apt.metadata[key].upper() for key in _searchable_code_keys if apt.metadata.get(key)}
+            words = set(_search_words(apt.name)) | codes
+            trigrams = frozenset().union(*(_trigrams(word) for word in words))
+            for trigram in trigrams:
+                self._trigram_postings[trigram].append(i)
+            self._trigram_counts.append(len(trigrams))
+            for code in codes:
+                self._codes[code].append(i)
+            word_positions.update((word, i) for word in words)
+        word_positions = sorted(word_positions)
+        self._words = [word for word, _ in word_positions]  # Sorted, for prefix matching with bisect
+        self._word_positions = [i for _, i in word_positions]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """
+        :param query: Any mix of words from the airport's name and its codes, possibly misspelled, with the last word possibly incomplete
+        :param limit: The maximum number of results to return
+        :returns: The (position in the indexed airports, score) of the best matches, best first
+        """
+        words = _search_words(query)
+        if not words:
+            return []
+        last_word_complete = query[-1:].isspace()
+        query_trigrams = frozenset().union(*(_trigrams(word, complete=last_word_complete or j < len(words) - 1)
+                                             for j, word in enumerate(words)))
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._trigram_postings.get(trigram, ()))
+
+        # Mostly, how much of the query does this airport contain... with a slight preference for shorter names
+        min_shared = self._MIN_SIMILARITY * len(query_trigrams)
+        scores = {i: n / len(query_trigrams) - 0.1 * (self._trigram_counts[i] - n) / self._trigram_counts[i]
+                  for i, n in shared.items() if n >= min_shared}
+        partial = words[-1]
+        lo = bisect.bisect_left(self._words, partial)
+        hi = bisect.bisect_left(self._words, partial + '\uffff')
+        prefix_bonuses = {}  # Type-ahead: some word starts with what the user has typed so far (better yet, *is* it)
+        for word, i in zip(self._words[lo:hi], self._word_positions[lo:hi]):
+            prefix_bonuses[i] = max(prefix_bonuses.get(i, 0), 0.75 if word == partial else 0.5)
+        for i, bonus in prefix_bonuses.items():
+            scores[i] = scores.get(i, 0) + bonus
+        for word in words:
+            for i in self._codes.get(word, ()):
+                scores[i] = scores.get(i, 0) + 1  # Searching by code should put that airport first
+        return heapq.nsmallest(limit, ((i, score) for i, score in scores.items()), key=lambda result: (-result[1], result[0]))
+
+    def save(self, path: PathLike):
+        """Writes this index to disk as JSON, for later use with ``NameSearchIndex.load()``"""
+        with open(str(path), 'w', encoding='utf8') as f:
+            json.dump({'version': self._FILE_FORMAT_VERSION,
+                       'ids': self.ids,
+                       'trigram_postings': self._trigram_postings,
+                       'trigram_counts': self._trigram_counts,
+                       'codes': self._codes,
+                       'words': self._words,
+                       'word_positions': self._word_positions}, f, separators=(',', ':'))
+
+    @staticmethod
+    def load(path: PathLike) -> 'NameSearchIndex':
+        """Reads an index previously written with ``save()``"""
+        with open(str(path), encoding='utf8') as f:
+            saved = json.load(f)
+        if saved.get('version') != NameSearchIndex._FILE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index version {saved.get('version')} in {path}")
+        out = NameSearchIndex()
+        out.ids = saved['ids']
+        out._trigram_postings = defaultdict(list, saved['trigram_postings'])
+        out._trigram_counts = saved['trigram_counts']
+        out._codes = defaultdict(list, saved['codes'])
+        out._words = saved['words']
+        out._word_positions = saved['word_positions']
+        return out
+
+
 class AptDat:
     """
     A container class for ``Airport`` objects.
     Parses X-Plane's gigantic apt.dat files, which may have data on hundreds of airports.
     """
-    def __init__(self, path_to_file: Optional[PathLike] = None, xplane_version: int = 1100):
+    def __init__(self, path_to_file: Optional[PathLike] = None, xplane_version: int = 1100, stats: Optional[ParseStats] = None, interner: Optional[TokenInterner] = None):
         """
-        :param path_to_file Location of the apt.dat (or ICAO.dat) file to read from disk
+        :param path_to_file Location of the apt.dat (or ICAO.dat) file to read from disk; may be compressed with gzip, bz2, or xz
         :param xplane_version The version of the apt.dat spec used by this file---overridden by any file we read (assuming it has a proper header).
+        :param stats If provided, we'll record instrumentation about the parse here
+        :param interner If provided, we'll use it to deduplicate tokens, reducing the memory used by the parsed airports
         """
         self.airports = []
         """:type: list[Airport]"""
         self.xplane_version = xplane_version
+        self._indexes = {}  # Lazily built lookup structures, discarded (or updated) whenever the collection or one of its airports changes
 
         if path_to_file:
             self.path_to_file = Path(path_to_file).expanduser()
-            with self.path_to_file.open(encoding="utf8") as f:
-                self._parse_text(f.readlines(), path_to_file)
+            with _open_apt_dat(self.path_to_file) as f:
+                self._parse_text(_iter_lines(f), path_to_file, stats, interner)
         else:
             self.path_to_file = None
 
     @staticmethod
-    def from_file_text(dat_file_text: str, from_file: Optional[PathLike] = None) -> 'AptDat':
+    def from_file_text(dat_file_text: str, from_file: Optional[PathLike] = None, stats: Optional[ParseStats] = None, interner: Optional[TokenInterner] = None) -> 'AptDat':
         """
         :param dat_file_text: The contents of an apt.dat (or ICAO.dat) file
         :param from_file: Path to the file from which this was read
+        :param stats: If provided, we'll record instrumentation about the parse here
+        :param interner: If provided, we'll use it to deduplicate tokens, reducing the memory used by the parsed airports
         """
-        # TODO: Provide an API to stream the file from disk so we don't have to store the whole thing in memory
-        return AptDat()._parse_text(dat_file_text, from_file)
+        return AptDat()._parse_text(dat_file_text, from_file, stats, interner)
 
     def clone(self) -> 'AptDat':
         out = AptDat()
@@ -508,18 +2122,26 @@ class AptDat:
         out.path_to_file = self.path_to_file
         return out
 
-    def _parse_text(self, dat_text: Union[List[str], str], from_file: Optional[PathLike] = None) -> 'AptDat':
-        if not isinstance(dat_text, list):  # Must be a newline-containing string
-            assert isinstance(dat_text, str)
+    def _parse_text(self, dat_text: Union[Iterable[str], str], from_file: Optional[PathLike] = None, stats: Optional[ParseStats] = None, interner: Optional[TokenInterner] = None) -> 'AptDat':
+        """
+        :param dat_text: Either the complete text of the file, or an iterable of its lines (without line endings)---possibly a generator streaming the file from disk
+        """
+        parse_start = time.perf_counter()
+        if isinstance(dat_text, str):
             dat_text = dat_text.splitlines()
 
-        has_file_header = dat_text[0].strip() in ('A', 'I') and 'Generated by WorldEditor' in dat_text[1]
-        if has_file_header:
-            self.xplane_version = AptDatLine(dat_text[1]).row_code
-            assert self.xplane_version < 9999, f"Invalid X-Plane apt.dat spec version {self.xplane_version} specified in file header"
-            dat_text = dat_text[2:]
+        file_version, dat_text = _split_file_header(dat_text)
+        if file_version is not None:
+            self.xplane_version = file_version
 
         self.path_to_file = from_file
+        self.invalidate_indexes()
+        tokenize = interner.tokenize if interner is not None else AptDatLine.tokenize
+        add_airport = self.airports.append
+        if stats is not None:
+            # Rather than a separate, instrumented copy of the loop below, we wrap the two calls it makes
+            tokenize, add_airport = stats.instrument(tokenize, add_airport)
+
         tokenized_lines = []
         raw_lines = []
         for line in dat_text:
@@ -528,11 +2150,11 @@ class AptDat:
             #          If you touch any of this loop, be sure to compare the before & after
             #          using benchmark.py.
             ################################################################################
-            tokenized = AptDatLine.tokenize(line)
+            tokenized = tokenize(line)
             if tokenized:
                 if tokenized[0] in airport_header_codes:
                     if tokenized_lines:  # finish off the previous airport
-                        self.airports.append(Airport(from_file, raw_lines, self.xplane_version, tokenized_lines))
+                        add_airport(Airport(from_file, raw_lines, self.xplane_version, tokenized_lines))
                     raw_lines = [line]
                     tokenized_lines = [tokenized]
                 else:
@@ -542,24 +2164,101 @@ class AptDat:
             if tokenized_lines[-1][0] == RowCode.FILE_END:
                 tokenized_lines.pop()
                 raw_lines.pop()
-            self.airports.append(Airport(from_file, raw_lines, self.xplane_version, tokenized_lines))
+            add_airport(Airport(from_file, raw_lines, self.xplane_version, tokenized_lines))
+        if stats is not None:
+            stats.total_seconds += time.perf_counter() - parse_start
         return self
 
+    def refresh(self, interner: Optional[TokenInterner] = None) -> AptDatDiff:
+        """
+        Re-reads the apt.dat file this collection came from, after it's been modified on disk (e.g., re-saved by WED).
+        Rather than re-parsing the whole file, we compare each airport's lines to those of the airports already loaded,
+        and only tokenize the airports that were added or changed. Unchanged ``Airport`` objects (and anything they've cached)
+        are kept as-is.
+
+        So as not to silently throw away your work, we raise a ValueError if any airport has unsaved edits
+        (see ``dirty_airports``); save them with ``write_to_disk()`` first, or re-read the file from scratch to discard them.
+
+        :param interner: If provided, we'll use it to tokenize the new & changed airports
+        :returns: The airports added, removed, and changed on disk (matched by ID)
+        """
+        assert self.path_to_file, "Can't refresh an AptDat that wasn't read from disk"
+        dirty = self.dirty_airports
+        if dirty:
+            raise ValueError(f"Can't refresh with unsaved edits to {len(dirty)} airport(s) ({', '.join(apt.id for apt in dirty[:5])}); write them to disk first")
+        path = Path(self.path_to_file).expanduser()
+        tokenize = interner.tokenize if interner is not None else AptDatLine.tokenize
+        # Builtin hashes of the line tuples are cheap (each str caches its own hash), so we use them to find candidate matches
+        unchanged_by_hash = defaultdict(list)
+        for apt in self.airports:
+            unchanged_by_hash[hash(tuple(apt.raw_lines))].append(apt)
+
+        with _open_apt_dat(path) as f:
+            file_version, dat_lines = _split_file_header(_iter_lines(f))
+            if file_version is not None and file_version != self.xplane_version:
+                # Every airport records its spec version, so there's nothing to reuse
+                refreshed = AptDat(path, interner=interner)
+                diff = self.diff(refreshed)
+                self.airports = refreshed.airports
+                self.xplane_version = refreshed.xplane_version
+                self.invalidate_indexes()
+                return diff
+
+            airports = []
+            parsed = []
+            for block in _iter_airport_blocks(dat_lines):
+                candidates = unchanged_by_hash.get(hash(tuple(block)), [])
+                match = next((i for i, candidate in enumerate(candidates) if candidate.raw_lines == block), None)
+                if match is None:
+                    apt = Airport(self.path_to_file, block, self.xplane_version, [tokenize(line) for line in block])
+                    parsed.append(apt)
+                else:
+                    apt = candidates.pop(match)
+                airports.append(apt)
+
+        removed = [apt for candidates in unchanged_by_hash.values() for apt in candidates]
+        removed_by_id = {apt.id.upper(): apt for apt in removed}
+        diff = AptDatDiff()
+        for apt in parsed:
+            old_apt = removed_by_id.pop(apt.id.upper(), None)
+            if old_apt is None:
+                diff.added.append(apt)
+            else:
+                diff.changed.append(AirportDiff(old_apt, apt))
+        diff.removed = list(removed_by_id.values())
+
+        reordered = len(airports) != len(self.airports) or any(new is not old for new, old in zip(airports, self.airports))
+        self.airports = airports
+        if reordered:
+            self._airports_removed(removed)
+            self._airports_added(parsed)
+        return diff
+
     def write_to_disk(self, path_to_write_to: Optional[PathLike] = None):
         """
         Writes a complete apt.dat file containing this entire collection of airports.
+        Airports you haven't edited are written out exactly as they were read; edited ones carry their original text
+        for every line but those you changed. Saving back to the file we read from marks every airport clean.
         :param path_to_write_to: A complete file path (ending in .dat); if None, we'll use the path we read this apt.dat in from
         """
-        if not path_to_write_to:
-            path_to_write_to = self.path_to_file
-        assert path_to_write_to and Path(path_to_write_to).suffix == '.dat', f"Invalid apt.dat path: {path_to_write_to}"
-        with Path(path_to_write_to).expanduser().open('w', encoding="utf8") as f:
-            f.write("I" + WED_LINE_ENDING)
-            f.write(f"{self.xplane_version} Generated by WorldEditor{WED_LINE_ENDING}{WED_LINE_ENDING}")
-            for apt in self.airports:
-                f.write(str(apt))
-                f.write(WED_LINE_ENDING * 2)
-            f.write(str(RowCode.FILE_END) + WED_LINE_ENDING)
+        write_apt_dat(self.airports, path_to_write_to or self.path_to_file, self.xplane_version)
+        if self.path_to_file and (path_to_write_to is None or Path(path_to_write_to).expanduser() == Path(self.path_to_file).expanduser()):
+            for apt in self.dirty_airports:
+                apt.dirty = False
+
+    @property
+    def dirty_airports(self) -> List[Airport]:
+        """:returns: The airports that have been edited since they were read (or last saved to our file)"""
+        return [apt for apt in self.airports if apt.dirty]
+
+    def to_sqlite(self, path: PathLike):
+        """
+        Exports this collection to a SQLite database (replacing any existing file), for querying with SQL.
+        Read it back with ``AirportDatabase``.
+
+        :param path: Where to write the database
+        """
+        write_sqlite(self.airports, path)
 
     def sort(self, key: str = 'name'):
         """
@@ -570,6 +2269,217 @@ class AptDat:
         :param key: The ``Airport`` key to sort on
         """
         self.airports = sorted(self.airports, key=attrgetter(key))
+        self.invalidate_indexes()
+
+    def __getstate__(self):
+        # Indexes are derived data (and can be large), so we'd rather rebuild them than pickle them
+        return {key: val for key, val in self.__dict__.items() if key != '_indexes'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._indexes = {}
+
+    def invalidate_indexes(self):
+        """
+        Discards the indexes we build to speed up searches.
+        We do this automatically when you add or remove airports via our own methods & operators, and when you edit one of
+        our airports (via ``Airport.set_line()`` and friends) we update or discard just the indexes built from the lines you changed,
+        but you'll need to call it yourself if you modify ``airports`` directly.
+        """
+        self._indexes.clear()
+
+    def _airports_added(self, airports: Iterable[Airport]):
+        """Keeps the indexes that support incremental updates current, and discards the rest"""
+        indexes = self._indexes
+        if 'metadata' in indexes:
+            for apt in airports:
+                indexes['metadata'].add(apt)
+            self._watch(airports)
+        self._indexes = {name: index for name, index in indexes.items() if name == 'metadata'}
+
+    def _airports_removed(self, airports: Iterable[Airport]):
+        """Keeps the indexes that support incremental updates current, and discards the rest"""
+        indexes = self._indexes
+        if 'metadata' in indexes:
+            for apt in airports:
+                indexes['metadata'].remove(apt)
+        self._indexes = {name: index for name, index in indexes.items() if name == 'metadata'}
+
+    def _watch(self, airports: Iterable[Airport]):
+        """Asks these airports to tell us about their edits, since our indexes now include them"""
+        for apt in airports:
+            apt._indexed_in(self)
+
+    def _airport_edited(self, apt: Airport, row_codes: Iterable[RowCode]):
+        """Updates (or discards) the indexes built from the lines with these row codes, which were just edited in this airport"""
+        stale = {name for code in row_codes for name in _indexes_by_row_code.get(code, ())}
+        if 'metadata' in stale and 'metadata' in self._indexes:
+            stale.discard('metadata')
+            self._indexes['metadata'].update(apt)
+        for name in stale:
+            self._indexes.pop(name, None)
+
+    def _index(self, name: str, build: Callable[[], object]):
+        """:returns: The index with the specified name, building it first if need be"""
+        indexes = self._indexes
+        with suppress(KeyError):
+            return indexes[name]
+        if not indexes:
+            self._watch(self.airports)  # Any we'd already been watching still are, so we need only do this for the first index
+        out = indexes[name] = build()
+        return out
+
+    @property
+    def frequency_index(self) -> Dict[int, List[Tuple[Airport, Frequency]]]:
+        """:returns: Every frequency defined by any airport in this collection (in kHz, like 122800), mapped to the airports using it"""
+        def build():
+            index = defaultdict(list)
+            for apt in self.airports:
+                for freq in apt.frequencies:
+                    index[freq.frequency_khz].append((apt, freq))
+            return dict(index)
+        return self._index('frequency', build)
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        """:returns: An inverted index over the metadata of every airport in this collection, built on first use"""
+        return self._index('metadata', lambda: MetadataIndex(self.airports))
+
+    def search_by_metadata(self, key: MetadataKey, value: str, prefix: bool = False) -> List[Airport]:
+        """
+        :param key: The metadata field to search, like ``MetadataKey.COUNTRY`` or ``MetadataKey.IATA_CODE``
+        :param value: The value to match, case-insensitive
+        :param prefix: If true, we'll match all airports whose value starts with ``value``
+        :returns: All airports with matching metadata (an empty list if no airports match)
+        """
+        return self.metadata_index.lookup(key, value, prefix)
+
+    @property
+    def name_search_index(self) -> NameSearchIndex:
+        """:returns: The trigram & prefix index backing ``search()``, built on first use"""
+        return self._index('name_search', lambda: NameSearchIndex(self.airports))
+
+    def use_name_search_index(self, index: NameSearchIndex):
+        """
+        Installs a previously built (e.g., loaded from disk) ``NameSearchIndex``, so that ``search()`` need not build one.
+        :param index: An index built from exactly the airports in this collection, in the same order
+        """
+        if index.ids != [apt.id for apt in self.airports]:
+            raise ValueError("The search index was built from a different set of airports")
+        self._indexes.pop('name_search', None)
+        self._index('name_search', lambda: index)
+
+    def search(self, query: str, limit: int = 10) -> List[Airport]:
+        """
+        Fuzzy, type-ahead search over airport names, IDs, and ICAO/IATA/FAA/local codes.
+
+        :param query: Words from the name and/or codes of the airport, like "seatle tacoma" or "KSE"; tolerates typos & incomplete words
+        :param limit: The maximum number of airports to return
+        :returns: The best-matching airports, best first
+        """
+        return [self.airports[i] for i, _ in self.name_search_index.search(query, limit)]
+
+    def search_by_frequency(self, frequency_mhz: float, frequency_type: Optional[FrequencyType] = None,
+                            near: Optional[Tuple[float, float]] = None, radius_nm: Optional[float] = None) -> List[Tuple[Airport, Frequency]]:
+        """
+        :param frequency_mhz: The frequency to look up, like 122.8
+        :param frequency_type: If provided, we'll only return uses of the frequency for this purpose (like CTAF)
+        :param near: A (latitude, longitude) to search around; requires ``radius_nm``
+        :param radius_nm: If ``near`` is provided, the maximum distance from it (in nautical miles) of the airports we return
+        :returns: The airports using the frequency, and their use of it
+        """
+        matches = self.frequency_index.get(int(round(frequency_mhz * 1000)), [])
+        if frequency_type is not None:
+            matches = [(apt, freq) for apt, freq in matches if freq.frequency_type == frequency_type]
+        if near is not None:
+            assert radius_nm is not None, "You must specify a search radius along with a location"
+            matches = [(apt, freq) for apt, freq in matches
+                       if _has_runway(apt) and haversine_nm(near[0], near[1], apt.latitude, apt.longitude) <= radius_nm]
+        return list(matches)
+
+    @property
+    def coordinates(self) -> AirportCoordinates:
+        """:returns: The location of every airport in this collection, as flat arrays of floats built on first use"""
+        return self._index('coordinates', lambda: AirportCoordinates.from_airports(self.airports))
+
+    def distance_matrix(self, ids_a: Iterable[str], ids_b: Optional[Iterable[str]] = None, chunk_rows: Optional[int] = None):
+        """
+        :param ids_a: The airports for the rows of the matrix
+        :param ids_b: The airports for the columns; if None, the same as ``ids_a``
+        :param chunk_rows: The number of rows to compute at once, bounding the temporary memory we use (see ``geodesy.iter_distance_matrix_nm()``)
+        :returns: The great-circle distance in nautical miles between every pair of airports (NaN for airports with no runways),
+                  as a 2-D NumPy array if NumPy is installed, or a list of lists if it isn't
+        """
+        lats_a, lons_a = self.coordinates.select(ids_a)
+        lats_b, lons_b = (lats_a, lons_a) if ids_b is None else self.coordinates.select(ids_b)
+        return distance_matrix_nm(lats_a, lons_a, lats_b, lons_b, chunk_rows)
+
+    def frequency_conflicts(self, radius_nm: float, frequency_type: Optional[FrequencyType] = None) -> Iterable[Tuple[int, Airport, Airport, float]]:
+        """
+        Finds pairs of distinct airports using the same frequency within ``radius_nm`` of one another.
+
+        :param radius_nm: The minimum distance at which we'd consider two uses of the same frequency *not* to conflict
+        :param frequency_type: If provided, we'll only consider uses of frequencies for this purpose (like CTAF)
+        :returns: A generator of (frequency in kHz, airport, airport, distance in nautical miles)
+        """
+        max_lat_separation = radius_nm / NM_PER_DEGREE_LAT
+        for frequency_khz, uses in self.frequency_index.items():
+            located = sorted({(apt.latitude, apt.longitude, id(apt)): apt
+                              for apt, freq in uses
+                              if (frequency_type is None or freq.frequency_type == frequency_type) and _has_runway(apt)}.items())
+            # Sweep in latitude order, so we only measure the distance between airports in the same latitude band
+            for i, ((lat_a, lon_a, _), apt_a) in enumerate(located):
+                for (lat_b, lon_b, _), apt_b in itertools.islice(located, i + 1, None):
+                    if lat_b - lat_a > max_lat_separation:
+                        break
+                    distance = haversine_nm(lat_a, lon_a, lat_b, lon_b)
+                    if distance <= radius_nm:
+                        yield frequency_khz, apt_a, apt_b, distance
+
+    def parallel_map(self, fn: Callable[[Airport], Any], workers: Optional[int] = None) -> List[Any]:
+        """
+        Applies a function to every airport in this collection across multiple processes.
+
+        Where forking is the multiprocessing start method (by default, on Linux before Python 3.14), workers inherit this collection from the parent,
+        so only airport indices go to them and only your function's results come back---``fn`` may even be a lambda.
+        Elsewhere (or if you've chosen another start method), we send each worker the airports' raw lines to re-tokenize, and ``fn`` must be picklable.
+
+        :param fn: The function to apply; changes it makes to the airports it receives will *not* be seen by the parent
+        :param workers: The number of processes to use; if None, one per CPU; if 1, we run serially in this process
+        :returns: The result of ``fn`` for each airport, in order
+        """
+        airports = self.airports
+        if workers == 1 or len(airports) < 2:
+            return [fn(apt) for apt in airports]
+        workers = workers or os.cpu_count() or 1
+        chunk_size = ceil(len(airports) / (workers * 4))  # Several chunks per worker, so the slow airports even out
+        starts = range(0, len(airports), chunk_size)
+        stops = [min(start + chunk_size, len(airports)) for start in starts]
+        # Respect the start method the user chose (else the platform's default, which get_all_start_methods() lists first), rather than forcing a fork
+        start_method = multiprocessing.get_start_method(allow_none=True) or multiprocessing.get_all_start_methods()[0]
+        if start_method == 'fork':
+            job_id = next(_parallel_job_ids)
+            _parallel_jobs[job_id] = (airports, fn)
+            try:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                    chunks = list(pool.map(_map_forked_chunk, itertools.repeat(job_id, len(starts)), starts, stops))
+            finally:
+                del _parallel_jobs[job_id]
+        else:
+            # Before Python 3.8, a pool whose task can't be pickled never returns; failing here instead matches what you get elsewhere
+            pickle.dumps(fn)
+            airport_lines = [[(apt.from_file, apt.raw_lines, apt.xplane_version) for apt in airports[start:stop]]
+                             for start, stop in zip(starts, stops)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunks = list(pool.map(_map_shipped_chunk, itertools.repeat(fn, len(starts)), airport_lines))
+        return [result for chunk in chunks for result in chunk]
+
+    def parallel_filter(self, predicate_fn: Callable[[Airport], bool], workers: Optional[int] = None) -> List[Airport]:
+        """
+        Like ``search_by_predicate()``, but evaluates the predicate across multiple processes (see ``parallel_map()``).
+        :returns: The airports (from this collection, not copies) for which ``predicate_fn`` returned True
+        """
+        return [apt for apt, keep in zip(self.airports, self.parallel_map(predicate_fn, workers)) if keep]
 
     def search_by_id(self, id: str) -> Optional[Airport]:
         """
@@ -636,6 +2546,48 @@ class AptDat:
     def __eq__(self, other: 'AptDat'):
         return self.airports == other.airports
 
+    def active_traffic_flows(self, conditions_by_id: Dict[str, WeatherConditions]) -> Dict[str, Optional[TrafficFlow]]:
+        """
+        Chooses the active traffic flow for many airports at once, like after a weather update.
+        Each airport's flows are parsed only once, then cached for all later updates.
+
+        :param conditions_by_id: The current conditions at each airport we should evaluate, keyed by airport ID (case-insensitive)
+        :returns: The active flow for each airport in ``conditions_by_id`` that's in this collection (None if it has no flow that matches)
+        """
+        airports_by_id = self._airports_by_id
+        return {apt_id: airports_by_id[apt_id.upper()].active_traffic_flow(conditions)
+                for apt_id, conditions in conditions_by_id.items()
+                if apt_id.upper() in airports_by_id}
+
+    @property
+    def _airports_by_id(self) -> Dict[str, Airport]:
+        """:returns: The first airport with each (uppercase) ID, built on first use"""
+        def build():
+            out = {}
+            for apt in self.airports:
+                out.setdefault(apt.id.upper(), apt)
+            return out
+        return self._index('airports_by_id', build)
+
+    def diff(self, other: 'AptDat') -> AptDatDiff:
+        """
+        Compares this (old) collection of airports with another (new) one.
+        Airports are matched by ID and compared by ``content_hash``, so the only airports whose lines we ever compare are the ones that changed.
+
+        :returns: The airports added, removed, and changed between ``self`` and ``other``
+        """
+        old_by_id = {apt.id.upper(): apt for apt in self.airports}
+        new_by_id = {apt.id.upper(): apt for apt in other.airports}
+        out = AptDatDiff()
+        for apt_id, new_apt in new_by_id.items():
+            old_apt = old_by_id.get(apt_id)
+            if old_apt is None:
+                out.added.append(new_apt)
+            elif old_apt.content_hash != new_apt.content_hash:
+                out.changed.append(AirportDiff(old_apt, new_apt))
+        out.removed = [old_apt for apt_id, old_apt in old_by_id.items() if apt_id not in new_by_id]
+        return out
+
     def __iter__(self):
         return (apt for apt in self.airports)
 
@@ -646,10 +2598,13 @@ class AptDat:
 
     def __delitem__(self, key: Union[str, int]):
         if isinstance(key, str):
+            self._airports_removed([apt for apt in self.airports if apt.id == key])
             self.airports = [apt for apt in self.airports if apt.id != key]
         elif isinstance(key, int):
+            self._airports_removed([self.airports[key]])
             del self.airports[key]
         else:
+            self._airports_removed([key])
             self.airports.remove(key)
 
     def __reversed__(self):
@@ -672,7 +2627,10 @@ class AptDat:
         Add the airport data in other to the data in this object.
         Note that no de-duplication will occur---it's your job to make sure the two airport data are disjoint.
         """
-        self.airports += list(other.airports)
+        added = list(other.airports)
+        self.airports += added
+        self._airports_added(added)
+        return self
 
     def __add__(self, apt: Airport):
         """
@@ -689,4 +2647,5 @@ class AptDat:
         Note that no de-duplication will occur---it's your job to make sure the two airport data are disjoint.
         """
         self.airports.append(apt)
+        self._airports_added([apt])
         return self
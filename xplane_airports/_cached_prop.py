@@ -1,7 +1,21 @@
 # Python 3.6-compatible wrapper for using cached_property
-# If you're pre-Python 3.8, you get no caching. You'll be okay.
+# Pre-Python 3.8, we use a minimal stand-in that (like functools.cached_property) stores the value in the instance's __dict__,
+# so that edits can discard a cached value with self.__dict__.pop(name, None) on every version.
 try:
     import functools
     apt_cached_property = functools.cached_property
-except:
-    apt_cached_property = property
+except AttributeError:
+    class apt_cached_property:
+        def __init__(self, func):
+            self.func = func
+            self.attrname = func.__name__
+            self.__doc__ = func.__doc__
+
+        def __set_name__(self, owner, name):
+            self.attrname = name
+
+        def __get__(self, instance, owner=None):
+            if instance is None:
+                return self
+            value = instance.__dict__[self.attrname] = self.func(instance)
+            return value
@@ -4,13 +4,20 @@ Tools for interfacing with the X-Plane Scenery Gateway's API.
 Docs at: https://gateway.x-plane.com/api
 """
 import base64
+import json
+import random
+import re
+import threading
 import zipfile
-from time import sleep
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep, time
 import requests
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import IntEnum
 from io import BytesIO
-from typing import Any, Callable, Dict, Iterable, Optional, Union
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, Optional, Sequence, Tuple, Union
 from xplane_airports.AptDat import Airport
 
 GATEWAY_DOMAIN = "https://gateway.x-plane.com"  # The root URL for the Gateway API
@@ -61,7 +68,85 @@ class GatewayApt:
     apt_metadata: Optional[Dict[str, Any]]  # The JSON object received from the Gateway with metadata about the airport this scenery pack represents; None if this hasn't been downloaded (yet)
 
 
-def airports(retries_on_error: int=20) -> Dict[str, Dict[str, Any]]:
+@dataclass
+class RetryPolicy:
+    """
+    Controls how hard we try to get a response out of the Gateway before giving up.
+    Pass one of these anywhere the API wrapping functions accept ``retries_on_error``.
+    """
+    max_retries: int = 20            # Retries after the first attempt; 0 means "try exactly once"
+    backoff_base: float = 0.5        # Seconds; the backoff ceiling for retry n is backoff_base * 2**n...
+    backoff_max: float = 30.0        # ...capped at this many seconds
+    jitter: bool = True              # If true, sleep a uniformly random time up to the backoff ceiling ("full jitter")
+    timeout: Optional[float] = 60.0  # Seconds to wait on the Gateway per request (connect & read); None waits forever
+    retry_statuses: FrozenSet[int] = field(default_factory=lambda: frozenset({408, 425, 429, 500, 502, 503, 504}))  # HTTP statuses worth retrying
+    max_retry_after: float = 120.0   # Never honor a Retry-After header asking us to wait longer than this
+
+    @staticmethod
+    def from_retries(retries_on_error: Union[int, 'RetryPolicy']) -> 'RetryPolicy':
+        """:returns: ``retries_on_error`` itself if it's already a policy, else the default policy with that many retries"""
+        if isinstance(retries_on_error, RetryPolicy):
+            return retries_on_error
+        return RetryPolicy(max_retries=int(retries_on_error))
+
+    def backoff(self, retry_number: int) -> float:
+        """:returns: The number of seconds to sleep before the (zero-indexed) ``retry_number``th retry"""
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** retry_number)
+        return random.uniform(0, ceiling) if self.jitter else ceiling
+
+
+class GatewayUnavailableError(requests.RequestException):
+    """Raised without touching the network when recent requests to the Gateway have failed so often that we've stopped trying."""
+
+
+class CircuitBreaker:
+    """
+    Shared across all requests to the Gateway: after ``failure_threshold`` consecutive requests fail
+    (each only once it has exhausted its retries), we fail fast for ``reset_after`` seconds,
+    then let a single trial request through to see if the Gateway has recovered.
+    """
+    def __init__(self, failure_threshold: int = 3, reset_after: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._consecutive_failures = 0
+        self._opened_at = None  # type: Optional[float]
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """:returns: True if we're currently refusing to send requests"""
+        with self._lock:
+            return self._opened_at is not None and monotonic() - self._opened_at < self.reset_after
+
+    def check(self):
+        """
+        Raises a ``GatewayUnavailableError`` if the breaker is open.
+        Once ``reset_after`` has elapsed, the first caller becomes the trial request: the breaker stays open to everyone else
+        until the trial reports back (or, should it never do so, for another ``reset_after`` seconds).
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if monotonic() - self._opened_at < self.reset_after:
+                raise GatewayUnavailableError(f"Giving the Gateway a rest after {self._consecutive_failures} consecutive failed requests")
+            self._opened_at = monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = monotonic()
+
+
+circuit_breaker = CircuitBreaker()  # Shared by every request this module makes; replace it to change the thresholds
+
+
+def airports(retries_on_error: Union[int, RetryPolicy]=20) -> Dict[str, Dict[str, Any]]:
     """
     Queries the Scenery Gateway for all the airports it knows about. Note that the download size is greater than 1 MB.
     Documented at: https://gateway.x-plane.com/api#get-all-airports
@@ -84,7 +169,36 @@ def airports(retries_on_error: int=20) -> Dict[str, Dict[str, Any]]:
     return {apt['AirportCode']: apt for apt in _gateway_json_request('/apiv1/airports', 'airports', retries_on_error)}
 
 
-def airport(airport_id: str, retries_on_error: int=20) -> Dict[str, Any]:
+@lru_cache(maxsize=None)
+def _record_type(fields: Tuple[str, ...]):
+    return namedtuple('GatewayAirportRecord', fields)
+
+
+def iter_airports(fields: Optional[Sequence[str]]=None, retries_on_error: Union[int, RetryPolicy]=20) -> Iterator[Any]:
+    """
+    A streaming equivalent of ``airports()``: yields each airport's metadata as soon as it has been downloaded & decoded,
+    rather than holding the complete list (and its JSON text) in memory at once.
+    Note that we can only retry failures that occur before the download begins; an error partway through the stream is raised.
+
+    :param fields: If ``None``, we yield the complete metadata dict for each airport; otherwise, we yield a compact ``namedtuple`` with only these keys (missing keys are ``None``).
+    :returns: A generator of airport metadata, in the order the Gateway sends it
+
+    >>> ksea = next(apt for apt in iter_airports(['AirportCode', 'RecommendedSceneryId']) if apt.AirportCode == 'KSEA')
+    >>> ksea._fields
+    ('AirportCode', 'RecommendedSceneryId')
+    >>> isinstance(ksea.RecommendedSceneryId, int)
+    True
+    """
+    record_type = _record_type(tuple(fields)) if fields is not None else None
+    response = _gateway_request('/apiv1/airports', retries_on_error, stream=True)
+    with response:
+        if not response.encoding:
+            response.encoding = 'utf-8'
+        for apt in _iter_json_array(response.iter_content(chunk_size=1 << 16, decode_unicode=True), 'airports'):
+            yield record_type(*(apt.get(f) for f in fields)) if record_type else apt
+
+
+def airport(airport_id: str, retries_on_error: Union[int, RetryPolicy]=20) -> Dict[str, Any]:
     """
     Queries the Scenery Gateway for metadata on a single airport, plus metadata on all the scenery packs uploaded for that airport.
     Documented at: https://gateway.x-plane.com/api#get-a-single-airport
@@ -111,13 +225,20 @@ def airport(airport_id: str, retries_on_error: int=20) -> Dict[str, Any]:
     return _gateway_json_request('/apiv1/airport/' + airport_id, 'airport', retries_on_error)
 
 
-def recommended_scenery_packs(selective_apt_ids: Optional[Iterable[str]]=None, retries_on_error: int=20) -> Iterable[GatewayApt]:
+_RECOMMENDED_PACK_FIELDS = ('AirportCode', 'Deprecated', 'RecommendedSceneryId')
+
+
+def recommended_scenery_packs(selective_apt_ids: Optional[Iterable[str]]=None, retries_on_error: Union[int, RetryPolicy]=20,
+                              fields: Optional[Sequence[str]]=None) -> Iterable[GatewayApt]:
     """
     A generator to iterate over the recommended scenery packs for all (or just the selected) airports on the Gateway.
     Downloads and unzips all files into memory.
 
     :param selective_apt_ids: If ``None``, we will download scenery for all 35,000+ airports; if a list of airport IDs (as returned by ``airports()``), the airports whose recommended packs we should download.
-    :returns: A generator of the recommended scenery packs; each pack contains the same data as a call to ``scenery_pack()`` directly
+    :param fields: If ``None``, each pack's ``apt_metadata`` is the airport's complete metadata dict (as in ``airports()``);
+                   otherwise, a dict with only these keys (plus ``AirportCode``, ``Deprecated``, and ``RecommendedSceneryId``, which we need to pick the packs),
+                   which saves memory while we list all 35,000+ airports
+    :returns: A generator of the recommended scenery packs; each pack contains the same data as a call to ``scenery_pack()`` directly, plus its ``apt_metadata``
 
     >>> type(next(recommended_scenery_packs())).__name__
     'GatewayApt'
@@ -140,20 +261,34 @@ def recommended_scenery_packs(selective_apt_ids: Optional[Iterable[str]]=None, r
     >>> all_3d and all_have_atc_flow and all_have_taxi_route
     True
     """
-    all_airports = airports(retries_on_error)
-    if selective_apt_ids:
-        all_airports = {apt_id: apt
-                        for apt_id, apt in all_airports.items()
-                        if apt_id in selective_apt_ids}
-
-    for apt_id, airport in all_airports.items():
-        if not airport['Deprecated'] and airport['RecommendedSceneryId']:
-            out = scenery_pack(airport['RecommendedSceneryId'], retries_on_error)
-            out.apt_metadata = airport
-            yield out
-
-
-def scenery_pack(pack_to_download: Union[int, str], retries_on_error: int=20) -> GatewayApt:
+    # Read the list of airports to completion before downloading any packs,
+    # so that a slow consumer can't leave the Gateway's airport list stream open (and timing out) in the meantime
+    remaining_ids = set(selective_apt_ids) if selective_apt_ids else None
+    if fields is not None:
+        fields = tuple(dict.fromkeys((*_RECOMMENDED_PACK_FIELDS, *fields)))
+    to_download = []
+    records = iter_airports(fields, retries_on_error)
+    try:
+        for record in records:
+            apt = record if fields is None else record._asdict()
+            if remaining_ids is not None:
+                if apt['AirportCode'] not in remaining_ids:
+                    continue
+                remaining_ids.discard(apt['AirportCode'])
+            if not apt['Deprecated'] and apt['RecommendedSceneryId']:
+                to_download.append(apt)
+            if remaining_ids is not None and not remaining_ids:
+                break  # No need to download the rest of the list
+    finally:
+        records.close()
+
+    for apt in to_download:
+        out = scenery_pack(apt['RecommendedSceneryId'], retries_on_error)
+        out.apt_metadata = apt
+        yield out
+
+
+def scenery_pack(pack_to_download: Union[int, str], retries_on_error: Union[int, RetryPolicy]=20) -> GatewayApt:
     """
     Downloads a single scenery pack, including its apt.dat and any associated DSF from the Gateway, and unzips it into memory.
 
@@ -215,20 +350,121 @@ def scenery_pack(pack_to_download: Union[int, str], retries_on_error: int=20) ->
 # TODO: API for bulk download and editing of scenery packs
 
 
-def _gateway_json_request(relative_download_url: str, expected_key: str, retries_on_error: int=20):
-    def retry(action: Callable, max_tries):
-        for attempted in range(max_tries):
-            try:
-                return action()
-            except Exception as e:
-                sleep(attempted)
-        return action()
+class _TransientError(Exception):
+    """A failure that might go away if we ask again"""
+    def __init__(self, cause: Exception, retry_after: Optional[float] = None):
+        super().__init__(str(cause))
+        self.cause = cause
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(header_value: Optional[str]) -> Optional[float]:
+    """:returns: The number of seconds a Retry-After header (in either delta-seconds or HTTP-date form) asks us to wait"""
+    if not header_value:
+        return None
+    try:
+        return max(0.0, float(header_value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(header_value).timestamp() - time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _gateway_request(relative_download_url: str, retries_on_error: Union[int, RetryPolicy]=20, stream: bool=False, parse: Callable[[requests.Response], Any]=lambda r: r):
+    """
+    :param parse: Applied to each successful response; its result is what we return
+    :param stream: If true, we return as soon as the headers arrive, leaving the body to be read by the caller
+    """
+    policy = RetryPolicy.from_retries(retries_on_error)
+    url = GATEWAY_DOMAIN + relative_download_url
 
     def make_req():
-        r = requests.get(GATEWAY_DOMAIN + relative_download_url)
+        try:
+            r = requests.get(url, timeout=policy.timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _TransientError(e)
         if r.status_code >= 300:
-            raise requests.HTTPError(f"HTTP Status {r.status_code} returned by {GATEWAY_DOMAIN + relative_download_url}")
-        return r.json()[expected_key]
+            r.close()
+            error = requests.HTTPError(f"HTTP Status {r.status_code} returned by {url}", response=r)
+            if r.status_code in policy.retry_statuses:
+                raise _TransientError(error, _parse_retry_after(r.headers.get('Retry-After')))
+            raise error  # Client errors like a 404 will never succeed, no matter how often we ask
+        return parse(r)
+
+    circuit_breaker.check()  # Once per request, so that a request's retries count as (at most) a single failure
+    for retry_number in range(policy.max_retries + 1):
+        try:
+            out = make_req()
+        except _TransientError as e:
+            if retry_number == policy.max_retries:
+                circuit_breaker.record_failure()
+                raise e.cause
+            delay = policy.backoff(retry_number)
+            if e.retry_after is not None:
+                delay = max(delay, min(e.retry_after, policy.max_retry_after))
+            sleep(delay)
+        except Exception:
+            circuit_breaker.record_success()  # The Gateway answered (e.g., with a 404), just not how we'd hoped
+            raise
+        else:
+            circuit_breaker.record_success()
+            return out
 
-    return retry(make_req, max_tries=retries_on_error)
 
+def _gateway_json_request(relative_download_url: str, expected_key: str, retries_on_error: Union[int, RetryPolicy]=20):
+    return _gateway_request(relative_download_url, retries_on_error, parse=lambda r: r.json()[expected_key])
+
+
+def _iter_json_array(text_chunks: Iterable[str], key: str) -> Iterator[Any]:
+    """
+    Incrementally decodes the elements of the array stored under ``key`` in a JSON object,
+    without ever holding more than a chunk or two of the document in memory.
+    Assumes ``key`` appears at the top level of the object before any nested key of the same name.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(text_chunks)
+    buffer = ''
+    pos = 0
+
+    def fill() -> bool:
+        nonlocal buffer, pos
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    # Skip ahead to the opening bracket of the array we care about
+    key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    while True:
+        match = key_pattern.search(buffer)
+        if match:
+            pos = match.end()
+            break
+        if not fill():
+            raise ValueError(f'No "{key}" array found in the Gateway\'s response')
+        pos = max(0, len(buffer) - len(key) - 64)  # the key may straddle two chunks
+
+    while True:
+        # Skip the whitespace & commas between elements
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer):
+                break
+            if not fill():
+                raise ValueError(f'Unterminated "{key}" array in the Gateway\'s response')
+        if buffer[pos] == ']':
+            return
+        try:
+            element, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if not fill():  # The element must have been cut off at the end of the chunk
+                raise
+            continue
+        if isinstance(element, (int, float)) and (end == len(buffer) or buffer[end] in '.eE+-0123456789') and fill():
+            continue  # A number cut off at the end of the chunk would still decode; wait until we can see where it ends
+        pos = end
+        yield element
@@ -0,0 +1,115 @@
+"""
+Great-circle math for working with airport locations.
+
+The array functions use NumPy when it's installed (``pip install numpy``), and fall back to (much slower) pure Python
+when it isn't; either way, the results are the same. Positions are in degrees, and unknown positions may be NaN.
+"""
+from math import asin, atan2, cos, degrees, isnan, nan, radians, sin, sqrt
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EARTH_RADIUS_NM = 3440.065  # Mean radius of the Earth, in nautical miles
+NM_PER_DEGREE_LAT = 60.0
+METERS_PER_NM = 1852.0
+DEFAULT_CHUNK_ELEMENTS = 1 << 20  # Distances computed per block of a distance matrix, bounding the size of our temporaries
+
+
+def haversine_nm(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """:returns: The great-circle distance between two points, in nautical miles"""
+    d_lat = radians(lat2 - lat1)
+    d_lon = radians(lon2 - lon1)
+    a = sin(d_lat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * asin(sqrt(min(a, 1.0)))  # min(a, 1.0), unlike min(1.0, a), passes NaN through
+
+
+def initial_bearing(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """:returns: The true course (0 to 360 degrees) at which the great circle from the first point to the second departs the first"""
+    lat1, lat2, d_lon = radians(lat1), radians(lat2), radians(lon2 - lon1)
+    x = cos(lat1) * sin(lat2) - sin(lat1) * cos(lat2) * cos(d_lon)
+    return degrees(atan2(sin(d_lon) * cos(lat2), x)) % 360
+
+
+# Sequences of floats in, a NumPy array (if available) or list out
+Floats = Union[Sequence[float], 'numpy.ndarray']
+
+
+def haversine_nm_array(lats1: Floats, lons1: Floats, lats2: Floats, lons2: Floats) -> Floats:
+    """
+    :returns: The great-circle distance (in nautical miles) between each pair of points; with NumPy, the arguments may be
+              any shapes that broadcast together (e.g., one point vs. an array of them)
+    """
+    if numpy is None:
+        return [haversine_nm(*points) for points in zip(lats1, lons1, lats2, lons2)]
+    lat1, lon1, lat2, lon2 = (numpy.radians(numpy.asarray(values, dtype=float)) for values in (lats1, lons1, lats2, lons2))
+    a = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+
+def initial_bearing_array(lats1: Floats, lons1: Floats, lats2: Floats, lons2: Floats) -> Floats:
+    """:returns: The ``initial_bearing()`` from each first point to the corresponding second point; with NumPy, the arguments broadcast"""
+    if numpy is None:
+        return [initial_bearing(*points) for points in zip(lats1, lons1, lats2, lons2)]
+    lat1, lon1, lat2, lon2 = (numpy.radians(numpy.asarray(values, dtype=float)) for values in (lats1, lons1, lats2, lons2))
+    d_lon = lon2 - lon1
+    x = numpy.cos(lat1) * numpy.sin(lat2) - numpy.sin(lat1) * numpy.cos(lat2) * numpy.cos(d_lon)
+    return numpy.degrees(numpy.arctan2(numpy.sin(d_lon) * numpy.cos(lat2), x)) % 360
+
+
+def iter_distance_matrix_nm(lats_a: Floats, lons_a: Floats, lats_b: Floats, lons_b: Floats,
+                            chunk_rows: Optional[int] = None) -> Iterable[Tuple[int, Floats]]:
+    """
+    Computes the great-circle distance from every point in A to every point in B, a block of rows at a time,
+    so you can process (or write out) a matrix far too big to hold in memory.
+
+    :param chunk_rows: The number of rows (points in A) per block; if None, enough to make blocks of about ``DEFAULT_CHUNK_ELEMENTS`` distances
+    :returns: A generator of (the index in A of the block's first row, a 2-D block of distances in nautical miles)
+    """
+    num_a, num_b = len(lats_a), len(lats_b)
+    chunk_rows = chunk_rows or max(1, DEFAULT_CHUNK_ELEMENTS // max(1, num_b))
+    if numpy is None:
+        b = [(radians(lat), radians(lon), cos(radians(lat))) for lat, lon in zip(lats_b, lons_b)]
+        for start in range(0, num_a, chunk_rows):
+            block = []
+            for lat, lon in zip(lats_a[start:start + chunk_rows], lons_a[start:start + chunk_rows]):
+                if isnan(lat) or isnan(lon):
+                    block.append([nan] * num_b)
+                    continue
+                lat, lon = radians(lat), radians(lon)
+                cos_lat = cos(lat)
+                block.append([2 * EARTH_RADIUS_NM * asin(sqrt(min(sin((lat2 - lat) / 2) ** 2 + cos_lat * cos_lat2 * sin((lon2 - lon) / 2) ** 2, 1.0)))
+                              for lat2, lon2, cos_lat2 in b])
+            yield start, block
+        return
+
+    # Everything that depends on only one of the two points, we compute once up front
+    lat_a, lon_a = numpy.radians(numpy.asarray(lats_a, dtype=float)), numpy.radians(numpy.asarray(lons_a, dtype=float))
+    lat_b, lon_b = numpy.radians(numpy.asarray(lats_b, dtype=float)), numpy.radians(numpy.asarray(lons_b, dtype=float))
+    cos_a, cos_b = numpy.cos(lat_a), numpy.cos(lat_b)
+    for start in range(0, num_a, chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        a = numpy.sin((lat_b - lat_a[rows, None]) / 2) ** 2
+        a += cos_a[rows, None] * cos_b * numpy.sin((lon_b - lon_a[rows, None]) / 2) ** 2
+        numpy.minimum(a, 1.0, out=a)
+        numpy.sqrt(a, out=a)
+        numpy.arcsin(a, out=a)
+        a *= 2 * EARTH_RADIUS_NM
+        yield start, a
+
+
+def distance_matrix_nm(lats_a: Floats, lons_a: Floats, lats_b: Floats, lons_b: Floats,
+                       chunk_rows: Optional[int] = None) -> Union[List[List[float]], 'numpy.ndarray']:
+    """
+    :param chunk_rows: As in ``iter_distance_matrix_nm()``; bounds the memory used beyond that of the result itself
+    :returns: The great-circle distance (in nautical miles) from every point in A (rows) to every point in B (columns);
+              a 2-D NumPy array if available, else a list of lists
+    """
+    if numpy is None:
+        return [row for _, block in iter_distance_matrix_nm(lats_a, lons_a, lats_b, lons_b, chunk_rows) for row in block]
+    out = numpy.empty((len(lats_a), len(lats_b)))
+    for start, block in iter_distance_matrix_nm(lats_a, lons_a, lats_b, lons_b, chunk_rows):
+        out[start:start + len(block)] = block
+    return out
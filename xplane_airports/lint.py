@@ -0,0 +1,260 @@
+"""
+Validation of apt.dat files in a single streaming pass.
+
+Every rule sees every line as we read it (without building ``Airport`` objects), so checking a file costs one read
+no matter how many rules you run, memory stays bounded by the size of one airport, and malformed data that would trip
+up ``AptDat``'s parser gets reported (with its line number) rather than raising.
+
+Write your own rules by subclassing ``LintRule`` and overriding whichever of its hooks you need.
+"""
+import re
+from enum import Enum
+from os import PathLike
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+from xplane_airports.AptDat import RowCode, _iter_lines, _open_apt_dat, airport_header_codes, runway_codes
+
+
+class LintSeverity(Enum):
+    ERROR = 'error'      # X-Plane (or our parser) will choke on this
+    WARNING = 'warning'  # Suspicious, but loadable
+
+
+class LintIssue(NamedTuple):
+    line_number: int  # 1-based, counting every line in the file (including the file header & blank lines)
+    severity: LintSeverity
+    rule: str
+    message: str
+    airport_id: Optional[str] = None  # The airport in which the issue occurred, if any
+
+    def __str__(self):
+        where = f" ({self.airport_id})" if self.airport_id else ''
+        return f"{self.line_number}{where}: {self.severity.value}: {self.message} [{self.rule}]"
+
+
+class LintContext:
+    """What the linter knows about the position it's reached in the file, shared by all rules"""
+    def __init__(self):
+        self.line_number = 0
+        self.line = ''  # The text of the current line
+        self.airport_id = None  # The ID of the airport we're in, if any
+        self.airport_line_number = 0  # The line number of the current airport's header
+        self.airport_row_codes = set()  # The row codes used so far by the current airport
+
+    def issue(self, rule: 'LintRule', message: str, severity: Optional[LintSeverity] = None, line_number: Optional[int] = None) -> LintIssue:
+        return LintIssue(line_number or self.line_number, severity or rule.severity, rule.name, message, self.airport_id)
+
+
+class LintRule:
+    """
+    Base class for validation rules. Each hook returns (or yields) any issues it finds.
+    ``tokens`` are the space-separated strings of a line, split exactly as ``AptDat``'s parser splits them;
+    ``row_code`` is None if the first token isn't a known ``RowCode``.
+    """
+    name = 'rule'
+    severity = LintSeverity.ERROR
+
+    def on_line(self, ctx: LintContext, row_code: Optional[RowCode], tokens: List[str]) -> Iterable[LintIssue]:
+        """Called for every non-blank line following the file header"""
+        return ()
+
+    def on_airport_end(self, ctx: LintContext) -> Iterable[LintIssue]:
+        """Called after the last line of each airport, while ``ctx`` still describes it"""
+        return ()
+
+    def on_file_end(self, ctx: LintContext) -> Iterable[LintIssue]:
+        return ()
+
+
+class UnknownRowCode(LintRule):
+    name = 'unknown-row-code'
+
+    def on_line(self, ctx, row_code, tokens):
+        if row_code is None:
+            yield ctx.issue(self, f"Unknown row code '{tokens[0]}'")
+
+
+class UnsupportedWhitespace(LintRule):
+    """Flags tabs (or other whitespace besides spaces) between tokens, which our parser doesn't split on"""
+    name = 'unsupported-whitespace'
+    _pattern = re.compile(r'[^\S ]')
+
+    def on_line(self, ctx, row_code, tokens):
+        if self._pattern.search(ctx.line.strip()):
+            yield ctx.issue(self, "Line separates its fields with tabs or other whitespace besides spaces")
+
+
+class MalformedAirportHeader(LintRule):
+    name = 'malformed-airport-header'
+
+    def on_line(self, ctx, row_code, tokens):
+        if row_code in airport_header_codes:
+            if len(tokens) < 5:
+                yield ctx.issue(self, "Airport header needs an elevation, ATC flag, deprecated field, and ID")
+                return
+            try:
+                float(tokens[1])
+            except ValueError:
+                yield ctx.issue(self, f"Airport elevation '{tokens[1]}' is not a number")
+            if tokens[2] not in ('0', '1'):
+                yield ctx.issue(self, f"Airport ATC flag '{tokens[2]}' should be 0 or 1")
+            if len(tokens) == 5:
+                yield ctx.issue(self, "Airport has no name", LintSeverity.WARNING)
+
+
+class TokenCount(LintRule):
+    """Flags lines with fewer tokens (including the row code) than their record type requires"""
+    name = 'token-count'
+    min_tokens = {
+        RowCode.LAND_RUNWAY: 26,
+        RowCode.WATER_RUNWAY: 9,
+        RowCode.HELIPAD: 12,
+        RowCode.TAXIWAY: 4,
+        RowCode.LINE_SEGMENT: 3,
+        RowCode.LINE_CURVE: 5,
+        RowCode.RING_SEGMENT: 3,
+        RowCode.RING_CURVE: 5,
+        RowCode.END_SEGMENT: 3,
+        RowCode.END_CURVE: 5,
+        RowCode.TAXI_SIGN: 7,
+        RowCode.FLOW_WIND: 5,
+        RowCode.FLOW_CEILING: 3,
+        RowCode.FLOW_VISIBILITY: 3,
+        RowCode.FLOW_TIME: 3,
+        RowCode.FLOW_RUNWAY_RULE: 7,
+        RowCode.FLOW_RUNWAY_RULE_CHANNEL: 7,
+        RowCode.TAXI_ROUTE_NODE: 5,
+        RowCode.TAXI_ROUTE_EDGE: 5,
+        RowCode.START_LOCATION_NEW: 6,
+        RowCode.START_LOCATION_EXT: 3,
+        RowCode.METADATA: 2,
+        RowCode.TRUCK_PARKING: 6,
+        RowCode.TRUCK_DESTINATION: 5,
+    }
+    min_tokens.update({code: 2 for code in RowCode if 50 <= code <= 57 or 1050 <= code <= 1057})  # Frequencies
+
+    def on_line(self, ctx, row_code, tokens):
+        required = self.min_tokens.get(row_code)
+        if required and len(tokens) < required:
+            yield ctx.issue(self, f"Row code {int(row_code)} needs at least {required} tokens, but has {len(tokens)}")
+
+
+class DuplicateAirportId(LintRule):
+    name = 'duplicate-airport-id'
+
+    def __init__(self):
+        self._first_seen = {}  # Uppercase ID -> line number of its first header
+
+    def on_line(self, ctx, row_code, tokens):
+        if row_code in airport_header_codes and ctx.airport_id:
+            first_line = self._first_seen.setdefault(ctx.airport_id.upper(), ctx.line_number)
+            if first_line != ctx.line_number:
+                yield ctx.issue(self, f"Airport ID {ctx.airport_id} was already used on line {first_line}")
+
+
+class AirportWithoutRunway(LintRule):
+    name = 'no-runway'
+
+    def on_airport_end(self, ctx):
+        if not ctx.airport_row_codes.intersection(runway_codes):
+            yield ctx.issue(self, "Airport has no runways, helipads, or water runways (so it has no location)",
+                            line_number=ctx.airport_line_number)
+
+
+class LineOutsideAirport(LintRule):
+    name = 'line-outside-airport'
+
+    def on_line(self, ctx, row_code, tokens):
+        if row_code not in airport_header_codes and ctx.airport_line_number == 0 and row_code != RowCode.FILE_END:
+            yield ctx.issue(self, "Line precedes the first airport header")
+
+
+class FileStructure(LintRule):
+    """Checks the file header (``I`` or ``A``, then the version line) and the ``99`` end-of-file marker"""
+    name = 'file-structure'
+    severity = LintSeverity.WARNING
+
+    def __init__(self):
+        self._ended = False
+        self._reported_trailing_data = False
+
+    def on_line(self, ctx, row_code, tokens):
+        if self._ended and not self._reported_trailing_data:
+            self._reported_trailing_data = True  # Once is enough
+            yield ctx.issue(self, "Data follows the 99 end-of-file marker")
+        if row_code == RowCode.FILE_END:
+            self._ended = True
+
+    def on_file_end(self, ctx):
+        if not self._ended and ctx.line_number:
+            yield ctx.issue(self, "File is missing its 99 end-of-file marker")
+
+
+def default_rules() -> List[LintRule]:
+    """:returns: A fresh instance of each of our built-in rules"""
+    return [UnknownRowCode(), UnsupportedWhitespace(), MalformedAirportHeader(), TokenCount(), DuplicateAirportId(),
+            AirportWithoutRunway(), LineOutsideAirport(), FileStructure()]
+
+
+_row_codes = {str(code.value): code for code in RowCode}
+_header_code_strs = {str(code.value) for code in airport_header_codes}
+
+
+def lint_lines(lines: Iterable[str], rules: Optional[Sequence[LintRule]] = None) -> Iterable[LintIssue]:
+    """
+    Validates the lines of an apt.dat file in a single pass.
+
+    :param lines: The lines of the file (with or without line endings), including the file header; may be a generator
+    :param rules: The rules to apply; if None, all of ``default_rules()``. Rules keep state, so use fresh ones for each file.
+    :returns: A generator of the issues found, in line order (roughly: airport-level issues come at the end of the airport)
+    """
+    rules = default_rules() if rules is None else rules
+    ctx = LintContext()
+    in_file_header = True
+    for line_number, line in enumerate(lines, start=1):
+        ctx.line_number = line_number
+        if in_file_header:
+            if line_number == 1 and line.strip() in ('I', 'A'):
+                continue
+            in_file_header = False
+            if line_number == 2 and 'Generated by WorldEditor' in line:
+                continue
+            if line_number == 1:
+                yield LintIssue(1, LintSeverity.WARNING, FileStructure.name, "File doesn't begin with an I or A header line")
+            else:
+                yield LintIssue(2, LintSeverity.WARNING, FileStructure.name, "File header is missing its version line")
+
+        ctx.line = line
+        tokens = [t for t in line.strip().split(' ') if t]  # As AptDatLine.tokenize() does
+        if not tokens:
+            continue
+        row_code = _row_codes.get(tokens[0])
+        if tokens[0] in _header_code_strs:
+            if ctx.airport_line_number:
+                for rule in rules:
+                    yield from rule.on_airport_end(ctx)
+            ctx.airport_id = tokens[4] if len(tokens) > 4 else None
+            ctx.airport_line_number = ctx.line_number
+            ctx.airport_row_codes = set()
+        if row_code is not None:
+            ctx.airport_row_codes.add(row_code)
+        for rule in rules:
+            yield from rule.on_line(ctx, row_code, tokens)
+
+    if ctx.airport_line_number:
+        for rule in rules:
+            yield from rule.on_airport_end(ctx)
+    for rule in rules:
+        yield from rule.on_file_end(ctx)
+
+
+def lint_apt_dat(path: PathLike, rules: Optional[Sequence[LintRule]] = None) -> Iterable[LintIssue]:
+    """
+    Validates an apt.dat file (optionally compressed) in a single streaming pass.
+
+    :param path: The apt.dat file to check
+    :param rules: The rules to apply; if None, all of ``default_rules()``
+    :returns: A generator of the issues found, in line order
+    """
+    with _open_apt_dat(Path(path).expanduser()) as f:
+        yield from lint_lines(_iter_lines(f), rules)
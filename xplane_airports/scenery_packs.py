@@ -0,0 +1,152 @@
+"""
+Tools for loading the airports from an entire X-Plane installation: the global airports plus every Custom Scenery pack,
+with the same override precedence X-Plane itself uses.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from xplane_airports.AptDat import Airport, AptDat, WED_LINE_ENDING, _airport_from_text, _iter_airport_blocks, _iter_lines, _open_apt_dat, _split_file_header
+
+_APT_DAT_IN_PACK = Path('Earth nav data') / 'apt.dat'
+_GLOBAL_AIRPORTS_TAG = '*GLOBAL_AIRPORTS*'
+# Where the global airports have lived over the years, newest first
+_GLOBAL_AIRPORTS_DIRS = (Path('Global Scenery') / 'Global Airports',
+                         Path('Custom Scenery') / 'Global Airports',
+                         Path('Resources') / 'default scenery' / 'default apt dat')
+
+
+@dataclass
+class SceneryLoad:
+    """The result of loading & merging the airports from many apt.dat files"""
+    apt_dat: AptDat  # One airport per ID; each airport's from_file is the apt.dat it was taken from
+    overridden: Dict[str, List[Path]] = field(default_factory=dict)  # Airport ID -> the lower-priority apt.dat files whose version of it was ignored
+    duplicated: Dict[str, List[Path]] = field(default_factory=dict)  # Airport ID -> the apt.dat files that define it more than once (we use the first definition in each)
+
+    def source_of(self, apt_id: str) -> Optional[Path]:
+        """:returns: The apt.dat file the winning version of this airport came from, or None if no file defines it"""
+        apt = self.apt_dat.search_by_id(apt_id)
+        return Path(apt.from_file) if apt else None
+
+
+def _global_airports_apt_dat(xplane_root: Path) -> Optional[Path]:
+    for global_dir in _GLOBAL_AIRPORTS_DIRS:
+        candidate = xplane_root / global_dir / _APT_DAT_IN_PACK
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def scenery_pack_apt_dats(xplane_root: PathLike, include_disabled: bool = False) -> List[Path]:
+    """
+    Discovers every apt.dat in an X-Plane installation, in priority order (highest first),
+    as defined by ``Custom Scenery/scenery_packs.ini``. The global airports always come last, unless the ini places them explicitly.
+
+    :param xplane_root: The X-Plane installation directory
+    :param include_disabled: If true, we'll also include packs marked ``SCENERY_PACK_DISABLED``
+    """
+    xplane_root = Path(xplane_root).expanduser()
+    ini_path = xplane_root / 'Custom Scenery' / 'scenery_packs.ini'
+    out = []
+    global_airports = _global_airports_apt_dat(xplane_root)
+    placed_global_airports = False
+    if ini_path.is_file():
+        with ini_path.open(encoding='utf8', errors='replace') as ini:
+            for line in ini:
+                directive, _, pack_path = line.strip().partition(' ')
+                if directive != 'SCENERY_PACK' and not (include_disabled and directive == 'SCENERY_PACK_DISABLED'):
+                    continue
+                if pack_path.strip() == _GLOBAL_AIRPORTS_TAG:
+                    if global_airports:
+                        out.append(global_airports)
+                    placed_global_airports = True
+                    continue
+                pack_dir = Path(pack_path.strip().replace('\\', '/'))
+                apt_dat = (pack_dir if pack_dir.is_absolute() else xplane_root / pack_dir) / _APT_DAT_IN_PACK
+                if apt_dat.is_file():
+                    out.append(apt_dat)
+    else:  # No ini yet (X-Plane writes it on first launch), so every pack is enabled, in alphabetical order
+        custom_scenery = xplane_root / 'Custom Scenery'
+        if custom_scenery.is_dir():
+            out += sorted(apt_dat for apt_dat in custom_scenery.glob(f"*/{_APT_DAT_IN_PACK.as_posix()}")
+                          if apt_dat.parent.parent.name != 'Global Airports')
+    if global_airports and not placed_global_airports:
+        out.append(global_airports)
+    return out
+
+
+def load_apt_dats(apt_dat_paths: Sequence[PathLike], workers: Optional[int] = None) -> SceneryLoad:
+    """
+    Parses many apt.dat files in parallel, and merges them such that an airport in an earlier (higher-priority) file
+    overrides the airport with the same ID in any later file, just like X-Plane does with the packs in scenery_packs.ini.
+
+    With multiple workers, the worker processes read, decompress, and split the files into airports, but send back only each
+    airport's ID & text: we merge by ID, and the winning airports are tokenized (in this process) the first time you use them,
+    so the ones that lose out to a higher-priority file never are. That makes ``workers`` pay off when there are many packs
+    (or compressed ones); for a handful of plain files, ``workers=1`` avoids the cost of starting processes and shipping the text between them.
+
+    :param apt_dat_paths: The apt.dat files to load, highest priority first (as returned by ``scenery_pack_apt_dats()``)
+    :param workers: The number of processes to read with; if None, one per CPU; if 1, we parse serially in this process
+    """
+    apt_dat_paths = [Path(path) for path in apt_dat_paths]
+    if workers == 1 or len(apt_dat_paths) < 2:
+        parsed = map(AptDat, apt_dat_paths)
+        return _merge(((apt_dat.xplane_version, [(apt.id, apt) for apt in apt_dat]) for apt_dat in parsed), apt_dat_paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map() yields in priority order, so we can merge each file as soon as it (and everything above it) is ready
+        read = pool.map(_read_airport_texts, apt_dat_paths, chunksize=4)
+        files = ((AptDat().xplane_version if file_version is None else file_version, airports) for file_version, airports in read)
+        return _merge(files, apt_dat_paths)
+
+
+def load_scenery(xplane_root: PathLike, workers: Optional[int] = None) -> SceneryLoad:
+    """
+    Loads the merged airports from every enabled scenery pack in an X-Plane installation, plus the global airports.
+
+    :param xplane_root: The X-Plane installation directory
+    :param workers: The number of processes to parse with; if None, one per CPU
+    """
+    return load_apt_dats(scenery_pack_apt_dats(xplane_root), workers)
+
+
+def _read_airport_texts(path: Path) -> Tuple[Optional[int], List[Tuple[str, str]]]:
+    """
+    Runs in a worker: reads an apt.dat and splits it into the text of each airport.
+    Tokens don't survive pickling (see ``Airport.__reduce__()``), so building them here would be wasted work;
+    instead, we read each airport's ID from its header line, so the parent can merge without tokenizing anything.
+    :returns: The X-Plane version from the file header (or None if it has none), and the (ID, text) of each airport
+    """
+    with _open_apt_dat(path) as f:
+        file_version, dat_lines = _split_file_header(_iter_lines(f))
+        out = []
+        for block in _iter_airport_blocks(dat_lines):
+            header = [token for token in block[0].strip().split(' ') if token]  # As AptDatLine.tokenize() splits it
+            out.append((header[4] if len(header) > 4 else '', WED_LINE_ENDING.join(block)))
+        return file_version, out
+
+
+def _merge(files: Iterable[Tuple[int, List[Tuple[str, Union[Airport, str]]]]], apt_dat_paths: List[Path]) -> SceneryLoad:
+    """
+    :param files: The X-Plane version of each file, and the (ID, airport) of each airport in it, where the airport may be
+                  just its text (as read by ``_read_airport_texts()``), in which case we only build it if it wins
+    """
+    out = SceneryLoad(AptDat())
+    winners = {}  # Uppercase airport ID -> the ID of the airport that takes precedence, as it was written
+    for path, (xplane_version, airports) in zip(apt_dat_paths, files):
+        out.apt_dat.xplane_version = max(out.apt_dat.xplane_version, xplane_version)
+        seen_in_file = set()
+        for apt_id, apt in airports:
+            key = apt_id.upper()
+            if key in seen_in_file:  # A file can't override itself; only its first definition counts
+                duplicated_in = out.duplicated.setdefault(winners[key], [])
+                if path not in duplicated_in:
+                    duplicated_in.append(path)
+                continue
+            seen_in_file.add(key)
+            if key in winners:
+                out.overridden.setdefault(winners[key], []).append(path)
+            else:
+                winners[key] = apt_id
+                out.apt_dat.airports.append(_airport_from_text(path, apt, xplane_version) if isinstance(apt, str) else apt)
+    return out
@@ -0,0 +1,257 @@
+"""
+A read-only ``AptDat`` that many processes can share, backed by a memory-mapped file.
+
+Parse the world apt.dat once, write it out with ``write_shared_apt_dat()``, then open a ``SharedAptDat`` on that file
+in each worker process. The OS page cache holds a single copy of the data for all of them; each process only pays for
+the airports it's currently using.
+"""
+import mmap
+import os
+import re
+import struct
+import tempfile
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from xplane_airports.AptDat import Airport, AirportCoordinates, AptDat, AptDatLine, MetadataIndex, MetadataKey, NameSearchIndex, \
+    TrafficFlow, WeatherConditions, WED_LINE_ENDING
+
+# Magic, X-Plane version, number of airports, length of the source path (in bytes).
+# Followed by the source path (padded to a multiple of 8 bytes), then (number of airports + 1) native-endian
+# uint64 offsets into the text, then the UTF-8 text of each airport. No pointers, so every process can map it anywhere.
+_HEADER = struct.Struct('=8sIIQ')
+_MAGIC = b'XPAPTDB1'
+
+# Finding lines in the mapped text without decoding the rest of the airport
+_line = re.compile(rb'[^\r\n]*')
+_metadata_line = re.compile(rb'^[ \t]*1302 ', re.MULTILINE)
+_runway_line = re.compile(rb'^[ \t]*10[012] ', re.MULTILINE)
+
+
+def _pad8(length: int) -> int:
+    return (length + 7) & ~7
+
+
+def write_shared_apt_dat(apt_dat: AptDat, path: PathLike):
+    """
+    Writes airports in the flat format read by ``SharedAptDat``.
+    The file is replaced atomically, so processes that already have the old version mapped keep working with it.
+
+    :param apt_dat: The airports to write
+    :param path: Where to write them; ideally on a local disk (or tmpfs, like /dev/shm)
+    """
+    path = Path(path).expanduser()
+    source = str(apt_dat.path_to_file or '').encode('utf8')
+    offsets = array('Q', [0])
+    texts = []
+    for apt in apt_dat.airports:
+        texts.append(WED_LINE_ENDING.join(apt.raw_lines).encode('utf8'))
+        offsets.append(offsets[-1] + len(texts[-1]))
+
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, apt_dat.xplane_version, len(texts), len(source)))
+            f.write(source.ljust(_pad8(len(source)), b'\0'))
+            f.write(offsets.tobytes())
+            f.writelines(texts)
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class _SharedAirports(Sequence):
+    """The airports in a memory-mapped file, decoded on demand"""
+    def __init__(self, buffer: memoryview, xplane_version: int, from_file: Optional[Path], cache_size: int):
+        num_airports, source_len = _HEADER.unpack_from(buffer)[2:]
+        offsets_start = _HEADER.size + _pad8(source_len)
+        self._text_start = offsets_start + (num_airports + 1) * 8
+        self._offsets = buffer[offsets_start:self._text_start].cast('Q')
+        self._buffer = buffer
+        self._xplane_version = xplane_version
+        self._from_file = from_file
+        self._cache = OrderedDict()  # Index -> recently used Airport, most recent last
+        self._cache_size = cache_size
+        self._headers = None  # The (ID, name) of each airport, read on first use
+        self._index_by_id = None  # Uppercase ID -> index, built on first use
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Airport, List[Airport]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Airport index {index} out of range")
+        with_cache = self._cache.get(index)
+        if with_cache is not None:
+            self._cache.move_to_end(index)
+            return with_cache
+        apt = Airport.from_lines(self._text(index).split(WED_LINE_ENDING), self._from_file, self._xplane_version)
+        if self._cache_size:
+            self._cache[index] = apt
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return apt
+
+    def __add__(self, other: Iterable[Airport]) -> List[Airport]:
+        return list(self) + list(other)
+
+    def _span(self, index: int) -> Tuple[int, int]:
+        """:returns: The start & end of the airport's text in the buffer"""
+        return self._text_start + self._offsets[index], self._text_start + self._offsets[index + 1]
+
+    def _text(self, index: int) -> str:
+        start, end = self._span(index)
+        return str(self._buffer[start:end], 'utf8')
+
+    def _line_at(self, start: int, end: int) -> str:
+        """:returns: The line beginning at ``start`` in the buffer, going no further than ``end``"""
+        return str(_line.match(self._buffer, start, end).group(), 'utf8')
+
+    @property
+    def headers(self) -> List[Tuple[str, str]]:
+        """:returns: The (ID, name) of every airport, read from their header lines alone"""
+        if self._headers is None:
+            self._headers = []
+            for i in range(len(self)):
+                tokens = AptDatLine.tokenize(self._line_at(*self._span(i)))
+                self._headers.append((tokens[4] if len(tokens) > 4 else '', ' '.join(tokens[5:])))
+        return self._headers
+
+    def index_of_id(self, apt_id: str) -> Optional[int]:
+        """:returns: The index of the airport with this ID (case-insensitive), found without decoding any airports"""
+        if self._index_by_id is None:
+            self._index_by_id = {}
+            for i, (header_id, _) in enumerate(self.headers):
+                self._index_by_id.setdefault(header_id.upper(), i)
+        return self._index_by_id.get(apt_id.upper())
+
+    def summaries(self) -> Iterator[Airport]:
+        """
+        :returns: A stand-in for each airport with nothing but its header, metadata, and first runway lines,
+                  which is all it takes to know its ID, name, codes, and location, but a fraction of the work to decode
+        """
+        for i in range(len(self)):
+            start, end = self._span(i)
+            lines = [self._line_at(start, end)]
+            lines += [self._line_at(match.start(), end) for match in _metadata_line.finditer(self._buffer, start, end)]
+            runway = _runway_line.search(self._buffer, start, end)
+            if runway:
+                lines.append(self._line_at(runway.start(), end))
+            yield Airport.from_lines(lines, self._from_file, self._xplane_version)
+
+    def release(self):
+        self._cache.clear()
+        self._offsets.release()
+
+
+class SharedAptDat(AptDat):
+    """
+    A read-only ``AptDat`` view of a file written by ``write_shared_apt_dat()``.
+    Nothing is copied up front: each airport is decoded from the shared mapping when you access it
+    (and a few hundred of the most recently used are kept), so all the normal ``Airport`` accessors work.
+    Methods that would modify the collection raise a ``TypeError``.
+
+    Searches by ID, name, metadata, and location are served by indexes built from just the few lines of each airport they need.
+    The ``metadata_index`` and ``frequency_index`` properties, which would hold every decoded airport in memory, raise a ``TypeError``;
+    ``clone()`` this collection if you need them.
+    """
+    def __init__(self, path: PathLike, cache_size: int = 256):
+        """
+        :param path: A file written by ``write_shared_apt_dat()``
+        :param cache_size: The number of decoded airports to keep around for reuse
+        """
+        super().__init__()
+        self._shared_path = Path(path).expanduser()
+        self._cache_size = cache_size
+        self._file = open(str(self._shared_path), 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        magic, self.xplane_version, _, source_len = _HEADER.unpack_from(self._buffer)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a shared apt.dat file")
+        source = str(self._buffer[_HEADER.size:_HEADER.size + source_len], 'utf8')
+        self.path_to_file = Path(source) if source else None
+        self.airports = _SharedAirports(self._buffer, self.xplane_version, self.path_to_file, cache_size)
+
+    def close(self):
+        """Unmaps the file; airports you've already retrieved remain usable"""
+        if isinstance(self.airports, _SharedAirports):
+            self.airports.release()
+            self.airports = []
+        self._buffer.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __reduce__(self):
+        # The receiving process maps the same file, so all we need to send is its path
+        return SharedAptDat, (self._shared_path, self._cache_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _watch(self, airports):
+        # Our indexes come from the file, which editing a decoded airport doesn't change (and listening would decode them all)
+        pass
+
+    @property
+    def ids(self) -> Iterable[str]:
+        return (apt_id for apt_id, _ in self.airports.headers)
+
+    def search_by_id(self, id: str) -> Optional[Airport]:
+        index = self.airports.index_of_id(id)
+        return None if index is None else self.airports[index]
+
+    def search_by_name(self, name: str) -> List[Airport]:
+        name = name.upper()
+        return [self.airports[i] for i, (_, header_name) in enumerate(self.airports.headers) if header_name.upper() == name]
+
+    def __contains__(self, item: Union[str, Airport]):
+        if isinstance(item, str):
+            index = self.airports.index_of_id(item)
+            return index is not None and self.airports.headers[index][0] == item
+        return super().__contains__(item)
+
+    def search_by_metadata(self, key: MetadataKey, value: str, prefix: bool = False) -> List[Airport]:
+        def build():
+            summaries = list(self.airports.summaries())
+            return MetadataIndex(summaries), {id(summary): i for i, summary in enumerate(summaries)}
+        index, positions = self._index('shared_metadata', build)
+        return [self.airports[positions[id(summary)]] for summary in index.lookup(key, value, prefix)]
+
+    @property
+    def name_search_index(self) -> NameSearchIndex:
+        return self._index('name_search', lambda: NameSearchIndex(self.airports.summaries()))
+
+    @property
+    def coordinates(self) -> AirportCoordinates:
+        return self._index('coordinates', lambda: AirportCoordinates.from_airports(self.airports.summaries()))
+
+    def active_traffic_flows(self, conditions_by_id: Dict[str, WeatherConditions]) -> Dict[str, Optional[TrafficFlow]]:
+        # We decode only the airports we were asked about (whose flows stay cached for as long as they do)
+        out = {}
+        for apt_id, conditions in conditions_by_id.items():
+            index = self.airports.index_of_id(apt_id)
+            if index is not None:
+                out[apt_id] = self.airports[index].active_traffic_flow(conditions)
+        return out
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("SharedAptDat is read-only; use clone() to get a modifiable copy")
+
+    def _holds_every_airport(self):
+        raise TypeError("This index would hold every airport in memory; use clone() to get a regular AptDat")
+
+    sort = refresh = __delitem__ = __iadd__ = __iconcat__ = _read_only
+    metadata_index = frequency_index = property(_holds_every_airport)
@@ -1,6 +1,12 @@
+import gzip
+import os
+import pickle
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
 from pathlib import Path
-from xplane_airports.AptDat import Airport, AptDat, MetadataKey, AptDatLine, RunwayType
+from xplane_airports.geodesy import haversine_nm
+from xplane_airports.AptDat import Airport, AirportDatabase, AptDat, MetadataIndex, MetadataKey, AptDatLine, Frequency, FrequencyType, NameSearchIndex, ParseStats, RowCode, RunwayType, TokenInterner, write_apt_dat
 
 
 class TestAptDatLine(TestCase):
@@ -383,3 +389,422 @@ class TestAptDat(TestCase):
         for apt in self.multi_parser:
             self.assertEqual(apt.has_taxi_route, apt.id == 'YTWB', 'Only YTWB in the list should have this feature')
             self.assertEqual(apt.has_traffic_flow, apt.id == 'YTWB', 'Only YTWB in the list should have this feature')
+
+    def test_parse_stats(self):
+        seen = []
+        stats = ParseStats(top_n=2, on_airport=lambda apt, seconds: seen.append(apt.id))
+        instrumented = AptDat.from_file_text(self.apt_dat_multi_string, 'foo.dat', stats)
+        self.assertEqual(instrumented, self.multi_parser)
+        self.assertEqual(seen, ['YTWB', 'SDCR', 'SCVO', 'YTNK'])
+        self.assertEqual(stats.airports, 4)
+        self.assertEqual(stats.row_code_lines[RowCode.AIRPORT_HEADER], 4)
+        self.assertEqual(stats.row_code_lines[RowCode.LAND_RUNWAY], 7)
+        self.assertEqual(stats.row_code_tokens[RowCode.LAND_RUNWAY], 7 * 26)
+        self.assertEqual(stats.largest_airports[0], ('YTWB', 12))
+        self.assertEqual(len(stats.slowest_airports), 2)
+        self.assertGreaterEqual(stats.total_seconds, stats.tokenize_seconds)
+        self.assertGreater(stats.lines_per_second, 0)
+
+    def test_write_to_disk(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_path = Path(tmp_dir) / 'out.dat'
+            self.multi_parser.write_to_disk(out_path)
+            self.assertEqual(AptDat(out_path), AptDat.from_file_text(self.apt_dat_multi_string, out_path))
+            self.assertEqual(os.listdir(tmp_dir), ['out.dat'], "Atomic write left its temporary file behind")
+
+            self.single_parser.write_to_disk(out_path)
+            self.assertEqual(list(AptDat(out_path).ids), ['EDX6'])
+
+    def test_write_apt_dat_streaming(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_path = Path(tmp_dir) / 'filtered.dat.gz'
+            write_apt_dat((apt for apt in self.multi_parser if apt.has_atc or apt.id == 'YTWB'), out_path, self.multi_parser.xplane_version, atomic=False)
+            with gzip.open(str(out_path), 'rt', encoding='utf8') as f:
+                reread = AptDat.from_file_text(f.read(), out_path)
+            self.assertEqual(AptDat(out_path), reread)
+            self.assertEqual(list(reread.ids), ['YTWB', 'SCVO'])
+            self.assertEqual(reread.xplane_version, 1234)
+            self.assertEqual(str(reread), str(self.multi_parser['YTWB']) + '\n' + str(self.multi_parser['SCVO']))
+
+    def test_row_code_index(self):
+        ytwb = self.multi_parser['YTWB']
+        self.assertEqual(ytwb.row_code_index[RowCode.LAND_RUNWAY], [1, 2])
+        self.assertEqual(ytwb.row_code_index[RowCode.LINE_SEGMENT], [5, 6, 7])
+        self.assertEqual(ytwb.row_codes, frozenset(line[0] for line in ytwb.tokenized_lines))
+        self.assertEqual(ytwb.lines_with_row_code(RowCode.METADATA), [[RowCode.METADATA, 'icao_code', 'YTWB']])
+        self.assertEqual([line[0] for line in ytwb.lines_with_row_code([RowCode.FLOW_WIND, RowCode.LAND_RUNWAY, RowCode.TAXI_ROUTE_NODE])],
+                         [RowCode.LAND_RUNWAY, RowCode.LAND_RUNWAY, RowCode.TAXI_ROUTE_NODE, RowCode.FLOW_WIND])
+        self.assertEqual(ytwb.lines_with_row_code(RowCode.HELIPAD), [])
+        self.assertEqual(list(ytwb.taxi_network.nodes), [5416])
+
+    def test_content_hash(self):
+        reindented = Airport.from_str('\n'.join('  ' + line.strip().replace(' ', '   ') for line in self.multi_parser['SCVO'].raw_lines))
+        self.assertEqual(reindented.content_hash, self.multi_parser['SCVO'].content_hash)
+        self.assertNotEqual(self.multi_parser['SCVO'].content_hash, self.multi_parser['YTNK'].content_hash)
+
+    def test_diff(self):
+        self.assertFalse(self.multi_parser.diff(AptDat.from_file_text(self.apt_dat_multi_string, 'copy.dat')))
+
+        new_version = self.multi_parser.clone()
+        del new_version['SDCR']
+        new_version += self.single_parser
+        ytnk = new_version['YTNK']
+        edited_lines = [line.replace('Tennant Creek', 'Tennant Creek Edited') for line in ytnk.raw_lines]
+        new_version.airports[new_version.airports.index(ytnk)] = Airport.from_lines(edited_lines, 'new.dat')
+
+        diff = self.multi_parser.diff(new_version)
+        self.assertEqual([apt.id for apt in diff.added], ['EDX6'])
+        self.assertEqual([apt.id for apt in diff.removed], ['SDCR'])
+        self.assertEqual([apt_diff.id for apt_diff in diff.changed], ['YTNK'])
+        changed_lines = [line for line in diff.changed[0].lines if line.startswith(('-1 ', '+1 '))]
+        self.assertEqual(changed_lines, ['-1 1235 0 0 YTNK Tennant Creek', '+1 1235 0 0 YTNK Tennant Creek Edited'])
+
+    def test_compressed_files(self):
+        test_file_path = Path(__file__).parent / 'test_apt.dat'
+        uncompressed = AptDat(test_file_path)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for suffix in ('.gz', '.bz2', '.xz'):
+                compressed_path = Path(tmp_dir) / ('apt.dat' + suffix)
+                uncompressed.write_to_disk(compressed_path)
+                self.assertNotEqual(compressed_path.read_bytes()[:2], b'I\n')
+                reread = AptDat(compressed_path)
+                self.assertEqual(list(reread.ids), list(uncompressed.ids))
+                self.assertEqual(str(reread), str(uncompressed))
+
+                # We sniff the format from the file's contents, not just its name
+                misnamed_path = Path(tmp_dir) / 'compressed_but_named.dat'
+                compressed_path.rename(misnamed_path)
+                self.assertEqual(str(AptDat(misnamed_path)), str(uncompressed))
+
+    def test_token_interning(self):
+        test_file_path = Path(__file__).parent / 'test_apt.dat'
+        plain = AptDat(test_file_path)
+        interner = TokenInterner()
+        interned = AptDat(test_file_path, interner=interner)
+        self.assertEqual(interned, plain)
+        twoways = [token for apt in interned for line in apt.tokenized_lines for token in line if token == 'twoway']
+        self.assertGreater(len(twoways), 1)
+        self.assertTrue(all(token is twoways[0] for token in twoways))
+
+        numeric = AptDat(test_file_path, interner=TokenInterner(numeric_columns=True))
+        self.assertEqual(str(numeric), str(plain))
+        for numeric_apt, plain_apt in zip(numeric, plain):
+            self.assertEqual(numeric_apt.content_hash, plain_apt.content_hash)
+            self.assertAlmostEqual(numeric_apt.latitude, plain_apt.latitude)
+            self.assertEqual(numeric_apt.taxi_network, plain_apt.taxi_network)
+        lell_bezier = numeric['LELL'].lines_with_row_code(RowCode.LINE_SEGMENT)[0]
+        self.assertEqual(lell_bezier[:3], [RowCode.LINE_SEGMENT, 41.52112080, 2.10130256])
+
+    def test_frequencies(self):
+        apts = AptDat(Path(__file__).parent / 'test_apt.dat')
+        with_freqs = [apt for apt in apts if apt.has_comm_freq]
+        self.assertTrue(with_freqs)
+        for apt in with_freqs:
+            self.assertTrue(apt.frequencies)
+            for freq in apt.frequencies:
+                self.assertTrue(118 <= freq.frequency_mhz < 137, freq)
+                self.assertIn((apt, freq), apts.search_by_frequency(freq.frequency_mhz))
+
+        freq_apt = Airport.from_str("""1 100 0 0 XFRQ Frequency Test
+                                       100 30.00 1 0 0.25 0 2 0 09 47.0 -122.0 0 0 2 0 1 0 27 47.0 -122.1 0 0 2 0 1 0
+                                       51 12280 CTAF
+                                       1054 118825 TOWER""")
+        self.assertEqual(freq_apt.frequencies, [Frequency(122800, FrequencyType.CTAF, 'CTAF'), Frequency(118825, FrequencyType.TOWER, 'TOWER')])
+
+        # Legacy (10 kHz) records truncate 25 kHz channels, which we restore; 8.33 kHz records are exact
+        mixed = Airport.from_str("""1 100 0 0 XMIX Mixed Frequencies
+                                    51 11802 CTAF
+                                    52 12107 DELIVERY
+                                    53 12170 GROUND
+                                    54 12110 TOWER
+                                    1055 118030 APPROACH
+                                    1056 118025 CENTER
+                                    1057 136990 DEPARTURE""")
+        self.assertEqual([freq.frequency_khz for freq in mixed.frequencies], [118025, 121075, 121700, 121100, 118030, 118025, 136990])
+
+        neighbor = Airport.from_str("""1 100 0 0 XNBR Neighbor
+                                       100 30.00 1 0 0.25 0 2 0 09 47.5 -122.0 0 0 2 0 1 0 27 47.5 -122.1 0 0 2 0 1 0
+                                       1051 122800 CTAF""")
+        apts += freq_apt
+        apts += neighbor
+        self.assertEqual(apts.search_by_frequency(118.825), [(freq_apt, freq_apt.frequencies[1])])
+        self.assertEqual([apt.id for apt, freq in apts.search_by_frequency(122.8, FrequencyType.CTAF, near=(47.0, -122.05), radius_nm=40)], ['XFRQ', 'XNBR'])
+        self.assertEqual([apt.id for apt, freq in apts.search_by_frequency(122.8, FrequencyType.CTAF, near=(47.0, -122.05), radius_nm=10)], ['XFRQ'])
+        conflicts = [(khz, a.id, b.id) for khz, a, b, distance in apts.frequency_conflicts(40, FrequencyType.CTAF)]
+        self.assertIn((122800, 'XFRQ', 'XNBR'), conflicts)
+        self.assertFalse(list(apts.frequency_conflicts(20, FrequencyType.CTAF)))
+
+        del apts['XNBR']
+        self.assertEqual([apt.id for apt, freq in apts.search_by_frequency(122.8, FrequencyType.CTAF, near=(47.0, -122.05), radius_nm=40)], ['XFRQ'])
+
+    def test_metadata_index(self):
+        apts = AptDat(Path(__file__).parent / 'test_apt.dat')
+        for country in ('United States', 'Australia', 'Brazil'):
+            expected = apts.search_by_predicate(lambda apt: apt.metadata.get(MetadataKey.COUNTRY) == country)
+            self.assertEqual(apts.search_by_metadata(MetadataKey.COUNTRY, country.lower()), expected)
+        self.assertEqual([apt.metadata[MetadataKey.IATA_CODE] for apt in apts.search_by_metadata(MetadataKey.IATA_CODE, 'bix')], ['BIX'])
+        self.assertEqual({apt.metadata[MetadataKey.COUNTRY] for apt in apts.search_by_metadata(MetadataKey.COUNTRY, 'United', prefix=True)},
+                         {'United Kingdom', 'United States'})
+        self.assertEqual(apts.search_by_metadata(MetadataKey.COUNTRY, 'Atlantis'), [])
+        self.assertEqual(apts.search_by_metadata(MetadataKey.COUNTRY, 'Z', prefix=True), [])
+
+        # The index stays current as airports come and go
+        new_apt = Airport.from_str("""1 100 0 0 XMET Metadata Test
+                                      100 30.00 1 0 0.25 0 2 0 09 47.0 -122.0 0 0 2 0 1 0 27 47.0 -122.1 0 0 2 0 1 0
+                                      1302 country Atlantis
+                                      1302 iata_code XMT""")
+        apts += new_apt
+        self.assertEqual(apts.search_by_metadata(MetadataKey.COUNTRY, 'Atlantis'), [new_apt])
+        self.assertEqual(apts.search_by_metadata(MetadataKey.COUNTRY, 'atl', prefix=True), [new_apt])
+        self.assertIn('ATLANTIS', apts.metadata_index.values(MetadataKey.COUNTRY))
+        del apts['XMET']
+        self.assertEqual(apts.search_by_metadata(MetadataKey.COUNTRY, 'Atlantis'), [])
+        self.assertNotIn('ATLANTIS', apts.metadata_index.values(MetadataKey.COUNTRY))
+        bix = apts.search_by_metadata(MetadataKey.IATA_CODE, 'BIX')[0]
+        del apts[apts.airports.index(bix)]
+        self.assertEqual(apts.search_by_metadata(MetadataKey.IATA_CODE, 'BIX'), [])
+
+        # Airports are removed from wherever they were indexed, even if their metadata has changed since
+        index = MetadataIndex(apts)
+        kbjc = apts['KBJC']
+        kbjc.set_metadata(MetadataKey.COUNTRY, 'Narnia')
+        index.remove(kbjc)
+        self.assertNotIn(kbjc, index.lookup(MetadataKey.COUNTRY, 'United States'))
+        self.assertEqual(index.lookup(MetadataKey.IATA_CODE, 'BJC'), [])
+
+    def test_search(self):
+        apts = AptDat(Path(__file__).parent / 'test_apt.dat')
+        top_id = lambda query: apts.search(query, limit=1)[0].id
+        self.assertEqual(top_id('Rocky Mountain Metropolitan Airport'), 'KBJC')
+        self.assertEqual(top_id('rocky mtn'), 'KBJC')  # Incomplete words
+        self.assertEqual(top_id('bristl regional'), 'TN04')  # Typos
+        self.assertEqual(top_id('kees'), 'KBIX')  # Type-ahead
+        self.assertEqual(top_id('BJC'), 'KBJC')  # IATA code
+        self.assertEqual(top_id('ybo'), 'YBOO')
+        self.assertLessEqual(len(apts.search('Airport', limit=3)), 3)
+        self.assertEqual(apts.search('qqqqqq'), [])
+        self.assertEqual(apts.search('  '), [])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_path = Path(tmp_dir) / 'search_index.json'
+            apts.name_search_index.save(index_path)
+            reloaded = AptDat(Path(__file__).parent / 'test_apt.dat')
+            reloaded.use_name_search_index(NameSearchIndex.load(index_path))
+            self.assertEqual([apt.id for apt in reloaded.search('rocky mtn')], [apt.id for apt in apts.search('rocky mtn')])
+            del reloaded['KBJC']
+            self.assertRaises(ValueError, reloaded.use_name_search_index, NameSearchIndex.load(index_path))
+            self.assertNotIn('KBJC', [apt.id for apt in reloaded.search('rocky mtn')])
+
+    def test_refresh(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'apt.dat'
+            original = AptDat(Path(__file__).parent / 'test_apt.dat')
+            write_apt_dat(original, path, original.xplane_version)
+            apts = AptDat(path)
+            self.assertFalse(apts.refresh())
+            unchanged = apts['KBJC']
+            self.assertEqual(apts.search_by_metadata(MetadataKey.IATA_CODE, 'BIX')[0].id, 'KBIX')
+
+            edited = [apt for apt in original if apt.id not in ('KBIX', 'YBOO')]
+            renamed = Airport.from_str(str(original['YBOO']).replace('Bindoon', 'Bindoon Renamed', 1))
+            added = Airport.from_str("""1 100 0 0 XNEW Newly Added
+                                        100 30.00 1 0 0.25 0 2 0 09 47.0 -122.0 0 0 2 0 1 0 27 47.0 -122.1 0 0 2 0 1 0""")
+            write_apt_dat([renamed] + edited + [added], path, original.xplane_version)
+
+            diff = apts.refresh()
+            self.assertEqual([apt.id for apt in diff.added], ['XNEW'])
+            self.assertEqual([apt.id for apt in diff.removed], ['KBIX'])
+            self.assertEqual([(change.old.name, change.new.name) for change in diff.changed], [('Bindoon', 'Bindoon Renamed')])
+            self.assertIs(apts['KBJC'], unchanged)
+            self.assertEqual([apt.raw_lines for apt in apts], [apt.raw_lines for apt in AptDat(path)])
+            self.assertEqual(apts.search_by_metadata(MetadataKey.IATA_CODE, 'BIX'), [])
+            self.assertFalse(apts.refresh())
+
+            # Unsaved edits must be written (or deliberately discarded) first
+            apts['KBJC'].set_metadata(MetadataKey.CITY, 'Edited')
+            self.assertRaises(ValueError, apts.refresh)
+            self.assertEqual(apts['KBJC'].metadata[MetadataKey.CITY], 'Edited')
+            apts.write_to_disk()
+            self.assertFalse(apts.refresh())
+
+    def test_parallel_map(self):
+        apts = AptDat(Path(__file__).parent / 'test_apt.dat')
+        count_nodes = lambda apt: len(apt.taxi_network.nodes)
+        expected = [count_nodes(apt) for apt in apts]
+        self.assertTrue(any(expected))
+        for workers in (1, 2):
+            self.assertEqual(apts.parallel_map(count_nodes, workers), expected)
+            self.assertEqual(apts.parallel_map(_runway_count, workers), [_runway_count(apt) for apt in apts])
+            helipads = apts.parallel_filter(lambda apt: apt.name.startswith('[H]'), workers)
+            self.assertEqual(helipads, apts.search_by_predicate(lambda apt: apt.name.startswith('[H]')))
+            self.assertTrue(all(any(apt is original for original in apts) for apt in helipads))
+        self.assertEqual(AptDat().parallel_map(count_nodes, 2), [])
+
+        # Where the start method isn't fork, we ship raw lines to the workers instead (so a lambda can't be pickled)
+        with patch('multiprocessing.get_start_method', return_value='spawn'):
+            self.assertEqual(apts.parallel_map(_runway_count, 2), [_runway_count(apt) for apt in apts])
+            self.assertRaises((pickle.PicklingError, AttributeError), apts.parallel_map, count_nodes, 2)
+
+    def test_pickling(self):
+        apts = AptDat(Path(__file__).parent / 'test_apt.dat')
+        kbjc = apts['KBJC']
+        self.assertTrue(kbjc.taxi_network.nodes)
+        self.assertEqual(apts.search_by_metadata(MetadataKey.IATA_CODE, 'BJC'), [kbjc])
+
+        pickled = pickle.dumps(kbjc)
+        self.assertLess(len(pickled), len(str(kbjc).encode('utf8')) + 500)
+        unpickled = pickle.loads(pickled)
+        self.assertNotIn('taxi_network', unpickled.__dict__)
+        self.assertNotIn('tokenized_lines', unpickled.__dict__)  # Rebuilt only once needed...
+        self.assertEqual(unpickled, kbjc)
+        self.assertEqual(unpickled.tokenized_lines, kbjc.tokenized_lines)  # ...like by the comparison above
+        self.assertEqual(unpickled.taxi_network, kbjc.taxi_network)
+        self.assertEqual(pickle.loads(pickle.dumps(Airport())), Airport())
+
+        unpickled_apts = pickle.loads(pickle.dumps(apts))
+        self.assertEqual(unpickled_apts, apts)
+        self.assertEqual(unpickled_apts.xplane_version, apts.xplane_version)
+        self.assertEqual(unpickled_apts.path_to_file, apts.path_to_file)
+        self.assertEqual(unpickled_apts._indexes, {})
+        self.assertEqual(unpickled_apts.search_by_metadata(MetadataKey.IATA_CODE, 'BJC')[0].id, 'KBJC')
+
+    def test_sqlite(self):
+        apts = AptDat(Path(__file__).parent / 'test_apt.dat')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = Path(tmp_dir) / 'airports.sqlite'
+            db_path.write_text('Not a database, but it will be replaced')
+            apts.to_sqlite(db_path)
+            self.assertNotIn('taxi_network', apts['KBJC'].__dict__)  # The export shouldn't leave the airports bloated
+
+            with AirportDatabase(db_path) as db:
+                sql = db.connection.execute
+                self.assertEqual(len(db), len(apts))
+                self.assertEqual(db.ids, list(apts.ids))
+                self.assertEqual(sql('SELECT COUNT(*) FROM runways').fetchone()[0],
+                                 sum(len(apt.lines_with_row_code([RowCode.LAND_RUNWAY, RowCode.WATER_RUNWAY, RowCode.HELIPAD])) for apt in apts))
+                self.assertEqual(sql('SELECT COUNT(*) FROM frequencies').fetchone()[0], sum(len(apt.frequencies) for apt in apts))
+                self.assertEqual(sql('SELECT COUNT(*) FROM start_locations').fetchone()[0], sum(len(apt.start_locations) for apt in apts))
+                kbjc = apts['KBJC']
+                kbjc_key = sql("SELECT key FROM airports WHERE id = 'KBJC'").fetchone()[0]
+                self.assertEqual(sql('SELECT COUNT(*) FROM taxi_nodes WHERE airport_key = ?', (kbjc_key,)).fetchone()[0], len(kbjc.taxi_network.nodes))
+                self.assertEqual(sql('SELECT COUNT(*) FROM taxi_edges WHERE airport_key = ?', (kbjc_key,)).fetchone()[0], len(kbjc.taxi_network.edges))
+                self.assertEqual(sql('SELECT latitude, longitude FROM airports WHERE key = ?', (kbjc_key,)).fetchone(), (kbjc.latitude, kbjc.longitude))
+                self.assertEqual(sql("SELECT a.id FROM airports a JOIN metadata m ON m.airport_key = a.key "
+                                     "WHERE m.key = 'iata_code' AND m.value = 'BJC'").fetchall(), [('KBJC',)])
+
+                self.assertEqual(db['kbjc'], kbjc)
+                self.assertIs(db['KBJC'], db['kbjc'])
+                self.assertIn('KBJC', db)
+                self.assertIsNone(db.search_by_id('XXXX'))
+                self.assertRaises(KeyError, db.__getitem__, 'XXXX')
+                australian = list(db.airports("key IN (SELECT airport_key FROM metadata WHERE key = 'country' AND value = ?)", ['Australia']))
+                self.assertEqual(australian, apts.search_by_metadata(MetadataKey.COUNTRY, 'Australia'))
+                self.assertEqual(db.to_apt_dat(), apts)
+        self.assertRaises(FileNotFoundError, AirportDatabase, Path(__file__).parent / 'no_such.sqlite')
+
+    def test_editing(self):
+        kbjc = AptDat(Path(__file__).parent / 'test_apt.dat')['KBJC']
+        runways = kbjc.lines_with_row_code(RowCode.LAND_RUNWAY)
+        nodes, metadata, network = len(kbjc.taxi_network.nodes), kbjc.metadata, kbjc.taxi_network
+        self.assertFalse(kbjc.dirty)
+
+        kbjc.set_metadata(MetadataKey.CITY, 'Broomfield, CO')
+        self.assertTrue(kbjc.dirty)
+        self.assertEqual(kbjc.metadata[MetadataKey.CITY], 'Broomfield, CO')
+        self.assertIs(kbjc.taxi_network, network, "Editing metadata shouldn't discard unrelated caches")
+        self.assertEqual(kbjc.lines_with_row_code(RowCode.LAND_RUNWAY), runways)
+
+        node = kbjc.line_indices(RowCode.TAXI_ROUTE_NODE)[0]
+        kbjc.set_line(node, [RowCode.TAXI_ROUTE_NODE, 39.9, -105.1, 'both', 9999, 'added_node'])
+        self.assertEqual(kbjc.raw_lines[node], '1201 39.9 -105.1 both 9999 added_node')
+        self.assertIn(9999, kbjc.taxi_network.nodes)
+        self.assertEqual(kbjc.insert_line('1302 local_code BJC'), kbjc.line_indices(RowCode.METADATA)[-1])
+        self.assertEqual(kbjc.metadata[MetadataKey.LOCAL_CODE], 'BJC')
+        self.assertEqual(kbjc.delete_lines_with_row_code(RowCode.TAXI_ROUTE_NODE, where=lambda tokens: tokens[4] != '9999'), nodes - 1)
+        self.assertEqual(list(kbjc.taxi_network.nodes), [9999])
+        self.assertEqual(kbjc.update_lines_with_row_code(RowCode.METADATA, lambda tokens: tokens[:2] + ['US'] if tokens[1] == 'country' else None), 1)
+        self.assertEqual(kbjc.metadata[MetadataKey.COUNTRY], 'US')
+        self.assertEqual(len(kbjc.raw_lines), len(kbjc.tokenized_lines))
+        self.assertEqual(kbjc, Airport.from_lines(kbjc.raw_lines, kbjc.from_file, kbjc.xplane_version))
+
+        self.assertRaises(ValueError, kbjc.delete_lines, [0])
+        self.assertRaises(ValueError, kbjc.insert_line, '1 5500 0 0 XXXX Not a second header', 5)
+        self.assertRaises(ValueError, kbjc.insert_line, '1 5500 0 0 XXXX Not a second header', 0)
+        self.assertRaises(ValueError, kbjc.insert_line, '1302 city Boulder', 0)
+        self.assertEqual([tokens[0] for tokens in kbjc.tokenized_lines].count(RowCode.AIRPORT_HEADER), 1)
+        self.assertEqual(kbjc.id, 'KBJC')
+        self.assertRaises(ValueError, kbjc.set_line, 1, '')
+        self.assertRaises(IndexError, kbjc.set_line, len(kbjc.tokenized_lines), '1302 city Boulder')
+
+    def test_searching_edits(self):
+        apts = AptDat(Path(__file__).parent / 'test_apt.dat')
+        kbjc = apts['KBJC']
+        self.assertIn(kbjc, apts.search_by_metadata(MetadataKey.COUNTRY, 'United States'))
+        self.assertNotEqual(apts.search('Narnia Intl', limit=1), [kbjc])
+
+        kbjc.set_metadata(MetadataKey.COUNTRY, 'Narnia')
+        self.assertEqual(apts.search_by_metadata(MetadataKey.COUNTRY, 'Narnia'), [kbjc])
+        self.assertNotIn(kbjc, apts.search_by_metadata(MetadataKey.COUNTRY, 'United States'))
+        kbjc.set_line(0, kbjc.raw_lines[0].replace('Rocky Mountain Metropolitan', 'Narnia Intl'))
+        self.assertEqual(apts.search('Narnia Intl', limit=1), [kbjc])
+
+        # Only the collections indexing an airport hear about its edits, and they keep the indexes that the edited lines don't feed
+        other = AptDat(Path(__file__).parent / 'test_apt.dat')
+        other_index = other.metadata_index
+        metadata_index, coordinates = apts.metadata_index, apts.coordinates
+        clone = apts.clone()
+        self.assertEqual(clone.search_by_metadata(MetadataKey.CITY, 'Cair Paravel'), [])
+        kbjc.set_metadata(MetadataKey.CITY, 'Cair Paravel')
+        self.assertIs(other.metadata_index, other_index)
+        self.assertIs(apts.metadata_index, metadata_index)  # Updated in place
+        self.assertIs(apts.coordinates, coordinates)
+        self.assertEqual(apts.search_by_metadata(MetadataKey.CITY, 'Cair Paravel'), [kbjc])
+        self.assertEqual(clone.search_by_metadata(MetadataKey.CITY, 'Cair Paravel'), [kbjc])  # It shares the airport
+
+        del clone['KBJC']
+        kbjc.set_metadata(MetadataKey.CITY, 'Beruna')
+        self.assertEqual(apts.search_by_metadata(MetadataKey.CITY, 'Beruna'), [kbjc])
+        self.assertEqual(clone.search_by_metadata(MetadataKey.CITY, 'Beruna'), [])
+
+    def test_saving_edits(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'apt.dat'
+            path.write_text(self.apt_dat_multi_string)
+            apts = AptDat(path)
+            untouched = [apt for apt in apts if apt.id != 'YTWB']
+            apts['SCVO'].set_metadata(MetadataKey.STATE, None)  # No such line, so nothing to change
+            apts['YTWB'].set_metadata(MetadataKey.ICAO_CODE, None)
+            self.assertEqual([apt.id for apt in apts.dirty_airports], ['YTWB'])
+
+            apts.write_to_disk()
+            self.assertEqual(apts.dirty_airports, [])
+            reread = AptDat(path)
+            self.assertNotIn(MetadataKey.ICAO_CODE, reread['YTWB'].metadata)
+            self.assertEqual([apt.raw_lines for apt in reread if apt.id != 'YTWB'], [apt.raw_lines for apt in untouched])
+
+    def test_distance_matrix(self):
+        ids = ['YTWB', 'sdcr', 'SCVO', 'YTNK']
+        matrix = [list(row) for row in self.multi_parser.distance_matrix(ids, chunk_rows=3)]
+        for i, row in enumerate(matrix):
+            for j, distance in enumerate(row):
+                a, b = self.multi_parser[ids[i].upper()], self.multi_parser[ids[j].upper()]
+                self.assertAlmostEqual(distance, haversine_nm(a.latitude, a.longitude, b.latitude, b.longitude), places=6)
+        self.assertEqual(matrix[0][0], 0)
+        self.assertEqual([list(row) for row in self.multi_parser.distance_matrix(['YTNK'], ids[:2])], [matrix[3][:2]])
+        self.assertRaises(KeyError, self.multi_parser.distance_matrix, ['YTWB', 'XXXX'])
+        self.assertEqual(self.multi_parser.coordinates.rows['YTNK'], 3)
+
+        # Moving an airport's runways moves the airport
+        ytnk, ytwb = self.multi_parser['YTNK'], self.multi_parser['YTWB']
+        def move_north(tokens):
+            tokens[9], tokens[18] = str(float(tokens[9]) + 1), str(float(tokens[18]) + 1)
+            return tokens
+        ytnk.update_lines_with_row_code(RowCode.LAND_RUNWAY, move_north)
+        self.assertAlmostEqual(self.multi_parser.coordinates.lats[3], ytnk.latitude)
+        self.assertAlmostEqual(self.multi_parser.distance_matrix(['YTNK'], ['YTWB'])[0][0],
+                               haversine_nm(ytnk.latitude, ytnk.longitude, ytwb.latitude, ytwb.longitude), places=6)
+        self.assertNotAlmostEqual(self.multi_parser.distance_matrix(['YTNK'], ['YTWB'])[0][0], matrix[3][0], places=0)
+
+
+def _runway_count(apt: Airport) -> int:
+    return len(apt.lines_with_row_code(RowCode.LAND_RUNWAY))
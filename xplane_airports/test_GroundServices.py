@@ -0,0 +1,70 @@
+from unittest import TestCase
+from xplane_airports.AptDat import Airport, GroundRoute, TruckAssignment, TruckParking
+
+
+class TestGroundServices(TestCase):
+    # A square loop of roads, 222 m on a side, whose east side is one-way (southbound, from node 3 to node 2)
+    airport = Airport.from_str("""
+            1     10 0 0 XGND Ground Services Test
+            1201 0.000 0.000 both 1 n1
+            1201 0.000 0.002 both 2 n2
+            1201 0.002 0.002 both 3 n3
+            1201 0.002 0.000 both 4 n4
+            1201 0.001 0.001 both 5 taxiway_only
+            1202 5 1 twoway taxiway_A A
+            1206 1 2 twoway
+            1206 3 2 oneway
+            1206 3 4 twoway South Road
+            1206 4 1 twoway
+            1400 0.0018 0.0021 90.00 fuel_jets 0 Fuel 1
+            1400 0.0001 0.0018 0.00 gpu 0 GPU 1
+            1400 0.0001 0.0018 0.00 baggage_train 3 Bags 1
+            1401 -0.0001 0.0015 0.00 fuel_jets|gpu Gate A
+            1401 0.0021 0.0010 180.00 gpu Gate B
+            """)
+
+    def test_parsing(self):
+        self.assertEqual(self.airport.truck_parking[2], TruckParking(0.0001, 0.0018, 0.0, 'baggage_train', 3, 'Bags 1'))
+        self.assertEqual(self.airport.truck_destinations[0].truck_types, frozenset({'fuel_jets', 'gpu'}))
+        roads = self.airport.service_road_network
+        self.assertEqual(sorted(roads.nodes), [1, 2, 3, 4])
+        self.assertEqual([(edge.node_begin, edge.node_end, edge.one_way) for edge in roads.edges], [(1, 2, False), (3, 2, True), (3, 4, False), (4, 1, False)])
+        self.assertEqual(roads.edges[2].name, 'South Road')
+        self.assertEqual(len(self.airport.taxi_network.edges), 1)
+
+    def test_routing(self):
+        services = self.airport.ground_services
+        self.assertEqual(services.destinations_for('gpu'), [0, 1])
+        self.assertEqual(services.destinations_for('pushback'), [])
+        self.assertIsNone(services.nearest_destination(0, 0, 'pushback'))
+
+        fuel, gpu, bags = services.assign()
+        self.assertEqual(fuel.destination, 0)
+        self.assertEqual(fuel.route.nodes, [2])  # Down the one-way road, then along to the gate
+        self.assertAlmostEqual(fuel.route.distance_m, 11 + 200 + 56 + 11, delta=3)
+        self.assertEqual(gpu, TruckAssignment(0, GroundRoute([], gpu.route.distance_m)))  # Gate A is on the same road
+        self.assertAlmostEqual(gpu.route.distance_m, 11 + 33 + 11, delta=3)
+        self.assertIsNone(bags)
+
+        # Gate B is just past node 3, but the one-way road means going the long way around
+        to_b = services.nearest_destination(0.0001, 0.0018, 'gpu', exclude={0})
+        self.assertEqual(to_b.destination, 1)
+        self.assertEqual(to_b.route.nodes, [1, 4])
+        self.assertAlmostEqual(to_b.route.distance_m, 11 + 200 + 222 + 111 + 11, delta=3)
+        self.assertEqual(services.routes([(0.0001, 0.0018, 1), (0.0018, 0.0021, 1)]),
+                         [to_b.route, services.route(0.0018, 0.0021, 1)])
+        self.assertEqual(services.route(0.0018, 0.0021, 1).nodes, [2, 1, 4])  # Already on the one-way road, heading away from node 3
+
+    def test_without_roads(self):
+        no_roads = Airport.from_lines([line for line in self.airport.raw_lines if line.split()[0] != '1206'])
+        services = no_roads.ground_services
+        self.assertEqual(services.assign(), [TruckAssignment(0, None), TruckAssignment(0, None), None])
+        self.assertEqual(services.nearest_destination(0.0021, 0.0011, 'gpu'), TruckAssignment(1, None))
+        self.assertIsNone(services.route(0, 0, 0))
+
+    def test_editing(self):
+        apt = Airport.from_lines(list(self.airport.raw_lines))
+        self.assertEqual(apt.ground_services.assign()[0].destination, 0)
+        apt.delete_lines_with_row_code(1401, where=lambda tokens: tokens[-1] == 'A')
+        self.assertEqual(apt.ground_services.assign()[0], None)
+        self.assertEqual(len(apt.truck_destinations), 1)
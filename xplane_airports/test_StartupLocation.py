@@ -0,0 +1,46 @@
+from unittest import TestCase
+from xplane_airports.AptDat import Airport, IcaoWidth, StartupLocation
+
+
+class TestStartupLocation(TestCase):
+    kpdx = Airport.from_str("""
+            1     31 1 0 KPDX Portland Intl
+            100 45.72 1 1 0.25 1 3 1 10L  45.59340600 -122.60570000    0  306 3 2 1 1 28R  45.58817800 -122.55960700    0  306 3 2 1 1
+            15   45.59000000 -122.59000000 90.00 Legacy Ramp
+            1300  45.58800000 -122.59600000 180.00 gate heavy|jets C1
+            1301 E airline ASA UAL
+            1300  45.58810000 -122.59400000 180.00 gate jets|turboprops C3
+            1301 C airline
+            1300  45.58820000 -122.58000000 180.00 gate jets C5
+            1301 D airline ASA
+            1300  45.58900000 -122.57000000 0.00 tie_down props GA 1
+            1301 A general_aviation
+            1300  45.59100000 -122.58000000 270.00 hangar all Hangar
+            1300  45.58830000 -122.58100000 180.00 gate heavy|jets Cargo 1
+            1301 F cargo FDX
+            """)
+
+    def test_parsing(self):
+        locations = self.kpdx.start_locations
+        self.assertEqual([loc.name for loc in locations], ['Legacy Ramp', 'C1', 'C3', 'C5', 'GA 1', 'Hangar', 'Cargo 1'])
+        self.assertEqual(locations[0], StartupLocation(45.59, -122.59, 90.0, 'misc', frozenset(['all']), 'Legacy Ramp'))
+        self.assertEqual(locations[1], StartupLocation(45.588, -122.596, 180.0, 'gate', frozenset(['heavy', 'jets']), 'C1',
+                                                       IcaoWidth.E, 'airline', frozenset(['ASA', 'UAL'])))
+        self.assertEqual(locations[2].airline_codes, frozenset())
+        self.assertIsNone(locations[5].icao_width)
+        self.assertTrue(locations[5].accepts_aircraft_type('helos'))
+        self.assertFalse(locations[4].accepts_aircraft_type('jets'))
+
+    def test_queries(self):
+        index = self.kpdx.start_location_index
+        names = lambda indices: [index.locations[i].name for i in indices]
+
+        self.assertEqual(names(index.query(location_type='gate')), ['C1', 'C3', 'C5', 'Cargo 1'])
+        self.assertEqual(names(index.query(location_type='gate', icao_width=IcaoWidth.D)), ['C1', 'C5', 'Cargo 1'])
+        self.assertEqual(names(index.query(location_type='gate', icao_width=IcaoWidth.D, airline='UAL')), ['C1'])
+        self.assertEqual(names(index.query(location_type='gate', airline='DAL', operation_type='airline')), ['C3'])
+        self.assertEqual(names(index.query(aircraft_type='helos')), ['Legacy Ramp', 'Hangar'])
+        self.assertEqual(names(index.query(location_type='gate', icao_width=IcaoWidth.C, near=(45.5882, -122.5801))), ['C5', 'Cargo 1', 'C3', 'C1'])
+        self.assertEqual(names(index.query(location_type='gate', icao_width=IcaoWidth.C, near=(45.5882, -122.5801), exclude={3}, limit=2)), ['Cargo 1', 'C3'])
+        self.assertEqual(index.query(location_type='jet_bridge'), [])
+        self.assertEqual(len(index.query()), 7)
@@ -1,5 +1,6 @@
+import random
 from unittest import TestCase
-from xplane_airports.AptDat import TaxiRouteEdge, TaxiRouteNode, TaxiRouteNetwork, AptDatLine, IcaoWidth
+from xplane_airports.AptDat import TaxiRouteEdge, TaxiRouteNode, TaxiRouteNetwork, TaxiRouteSpatialIndex, AptDatLine, IcaoWidth
 
 
 class TestTaxiRouteNetwork(TestCase):
@@ -138,3 +139,30 @@ class TestTaxiRouteNetwork(TestCase):
                       TaxiRouteEdge(node_begin=26, node_end=27, name="18/36", is_runway=True, one_way=False, icao_width=None))
         self.assertTrue(all(edge in edges
                             for edge in test_edges))
+
+    def test_spatial_index(self):
+        rng = random.Random(0)
+        positions = [(rng.uniform(40.080, 40.105), rng.uniform(-92.555, -92.535)) for _ in range(200)]
+        positions += [(40.2, -92.3), (39.0, -93.0)]  # Far from the airport
+        for cell_size_m in (10, 50, 1000):
+            index = TaxiRouteSpatialIndex(self.network, cell_size_m)
+            for (lat, lon), node_snap, edge_snap in zip(positions, index.nearest_nodes(positions), index.nearest_edges(positions)):
+                x, y = index._project(lat, lon)
+                self.assertAlmostEqual(node_snap.distance_m, min(index._node_distance(i, x, y) for i in range(len(index._nodes))), 6)
+                self.assertAlmostEqual(edge_snap.distance_m, min(index._segment_projection(i, x, y)[0] for i in range(len(index._segments))), 6)
+                # The snapped position lies on the edge, at the reported distance
+                begin, end = self.network.nodes[edge_snap.edge.node_begin], self.network.nodes[edge_snap.edge.node_end]
+                self.assertAlmostEqual(edge_snap.lat, begin.lat + edge_snap.fraction * (end.lat - begin.lat), 9)
+                self.assertAlmostEqual(edge_snap.lon, begin.lon + edge_snap.fraction * (end.lon - begin.lon), 9)
+
+        node_19 = self.network.nodes[19]
+        self.assertEqual(self.network.spatial_index.nearest_node(node_19.lat, node_19.lon), (node_19, 0.0))
+        on_runway = self.network.spatial_index.nearest_edge(40.09778, -92.5475)
+        self.assertEqual((on_runway.edge.node_begin, on_runway.edge.node_end), (19, 18))
+        self.assertLess(on_runway.distance_m, 3)
+        self.assertTrue(0 < on_runway.fraction < 1)
+        self.assertIs(self.network.spatial_index, self.network.spatial_index)
+
+        empty = TaxiRouteNetwork().spatial_index
+        self.assertIsNone(empty.nearest_node(40, -92))
+        self.assertEqual(empty.nearest_edges([(40, -92)]), [None])
@@ -0,0 +1,71 @@
+from unittest import TestCase
+from xplane_airports.AptDat import Airport, AptDat, FlowWindRule, RunwayUseRule, WeatherConditions
+
+
+class TestTrafficFlow(TestCase):
+    kbfi = """
+            1     21 1 0 KBFI Boeing Field King Co Intl
+            100 60.96 1 0 0.25 1 3 0 14R  47.54022500 -122.31168600    0    0 3 0 0 0 32L  47.51911400 -122.29614400    0    0 3 0 0 0
+            1000 South flow
+            1001 KBFI 090 270 99
+            1003 KBFI 3
+            1100 32L 12065 arrivals|departures heavy|jets|turboprops|props 000359 000359 32L all
+            1101 32L right
+            1000 North flow, VFR only
+            1001 KBFI 270 090 99
+            1002 KBFI 3000
+            1003 KBFI 5
+            1004 1300 0500
+            1110 14R 120650 arrivals jets|turboprops 000359 000359 14R arrivals
+            1110 14R 120650 departures jets 300060 320340 14R departures
+            1000 North flow, IFR
+            1001 KBFI 270 090 99
+            1100 14R 12065 arrivals|departures heavy|jets|turboprops|props 000359 000359
+            """
+    kbfi = Airport.from_str(kbfi)
+
+    def test_parsing(self):
+        flows = self.kbfi.traffic_flows
+        self.assertEqual([flow.name for flow in flows], ['South flow', 'North flow, VFR only', 'North flow, IFR'])
+        south, north_vfr, north_ifr = flows
+        self.assertEqual(south.wind_rules, [FlowWindRule('KBFI', 90, 270, 99)])
+        self.assertEqual(south.visibility_minimums_sm, [3])
+        self.assertEqual(south.traffic_patterns, {'32L': 'right'})
+        self.assertEqual(north_vfr.ceiling_minimums_ft, [3000])
+        self.assertEqual(north_vfr.time_rules, [(1300, 500)])
+        self.assertEqual(north_vfr.runway_rules[1],
+                         RunwayUseRule(runway='14R', frequency_mhz=120.65, operations=frozenset({'departures'}), equipment=frozenset({'jets'}),
+                                       dep_heading_range=(300, 60), initial_heading_range=(320, 340), name='14R departures'))
+        self.assertEqual(north_ifr.runway_rules[0].frequency_mhz, 120.65)
+        self.assertEqual(north_ifr.arrival_runways, ['14R'])
+        self.assertEqual(south.departure_runways, ['32L'])
+
+    def test_active_flow(self):
+        def active(**conditions) -> str:
+            return self.kbfi.active_traffic_flow(WeatherConditions(**conditions)).name
+
+        self.assertEqual(active(wind_dir=180, wind_speed_kts=10), 'South flow')
+        self.assertEqual(active(), 'South flow')  # Calm winds satisfy any wind rule
+        self.assertEqual(active(wind_dir=340, wind_speed_kts=10, zulu_time=1800), 'North flow, VFR only')
+        self.assertEqual(active(wind_dir=10, wind_speed_kts=10, zulu_time=200, visibility_sm=10), 'North flow, VFR only')
+        self.assertEqual(active(wind_dir=10, wind_speed_kts=10, zulu_time=1200), 'North flow, IFR')
+        self.assertEqual(active(wind_dir=10, wind_speed_kts=10, ceiling_ft=1500), 'North flow, IFR')
+        self.assertEqual(active(wind_dir=10, wind_speed_kts=10, visibility_sm=2), 'North flow, IFR')
+        self.assertIsNone(self.kbfi.active_traffic_flow(WeatherConditions(wind_dir=180, wind_speed_kts=10, visibility_sm=2)))
+        self.assertIsNone(self.kbfi.active_traffic_flow(WeatherConditions(wind_dir=180, wind_speed_kts=120)))
+
+    def test_batch_evaluation(self):
+        apt_dat = AptDat()
+        apt_dat += self.kbfi
+        active = apt_dat.active_traffic_flows({'KBFI': WeatherConditions(wind_dir=10, wind_speed_kts=5, zulu_time=1800),
+                                               'KSEA': WeatherConditions()})
+        self.assertEqual(list(active), ['KBFI'])
+        self.assertEqual(active['KBFI'].name, 'North flow, VFR only')
+
+        # IDs are case-insensitive, and the ID index keeps up as airports come & go
+        north = WeatherConditions(wind_dir=10, wind_speed_kts=5, zulu_time=1800)
+        self.assertEqual(list(apt_dat.active_traffic_flows({'kbfi': north})), ['kbfi'])
+        del apt_dat['KBFI']
+        self.assertEqual(apt_dat.active_traffic_flows({'KBFI': north}), {})
+        apt_dat += self.kbfi
+        self.assertEqual(list(apt_dat.active_traffic_flows({'KBFI': north})), ['KBFI'])
@@ -0,0 +1,197 @@
+import json
+from email.utils import formatdate
+from time import time
+from unittest import TestCase
+from unittest.mock import Mock, patch
+import requests
+from xplane_airports import gateway
+from xplane_airports.gateway import CircuitBreaker, GatewayApt, GatewayUnavailableError, RetryPolicy, _gateway_request, _iter_json_array, _parse_retry_after
+
+
+def _chunked(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestIterJsonArray(TestCase):
+    document = json.dumps({'status': 'ok', 'airports': [{'AirportCode': 'KSEA', 'airports': [1, 2]}, 12345, -6.5e3, 'a string, with ] in it', True, None, []]}, indent=1)
+    expected = json.loads(document)['airports']
+
+    def test_chunk_boundaries(self):
+        for size in range(1, len(self.document) + 1):
+            self.assertEqual(list(_iter_json_array(_chunked(self.document, size), 'airports')), self.expected, f"chunk size {size}")
+
+    def test_separators(self):
+        text = '{"airports" :\n[ 1 ,\t2,\r\n  {"a": [3]} ,"4"\n]\n}'
+        self.assertEqual(list(_iter_json_array(_chunked(text, 3), 'airports')), [1, 2, {'a': [3]}, '4'])
+        self.assertEqual(list(_iter_json_array(['{"airports": [', '', '7', '', ']}'], 'airports')), [7])
+
+    def test_empty(self):
+        self.assertEqual(list(_iter_json_array(['{"airports": []}'], 'airports')), [])
+        self.assertEqual(list(_iter_json_array(['{"airports": [ \n ', ' ]}'], 'airports')), [])
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            list(_iter_json_array([], 'airports'))
+        with self.assertRaises(ValueError):
+            list(_iter_json_array(['{"other": []}'], 'airports'))
+        for truncated in ('{"airports": [', '{"airports": [1, 2', '{"airports": [1, {"a": ', '{"airports": [1, "unterminated'):
+            with self.assertRaises(ValueError):
+                list(_iter_json_array(_chunked(truncated, 4), 'airports'))
+
+
+class TestRecommendedSceneryPacks(TestCase):
+    airports = [{'AirportCode': code, 'AirportName': code + ' Intl', 'Deprecated': deprecated, 'RecommendedSceneryId': scenery_id}
+                for code, deprecated, scenery_id in [('KSEA', False, 1), ('KBOS', True, 2), ('KLAX', False, None), ('KPDX', False, 4), ('KBFI', False, 5)]]
+
+    def setUp(self):
+        self.stream_open = False
+        self.downloads = []
+
+    def fake_iter_airports(self, fields, retries_on_error):
+        self.stream_open = True
+        try:
+            for apt in self.airports:
+                yield apt if fields is None else gateway._record_type(tuple(fields))(*(apt.get(f) for f in fields))
+        finally:
+            self.stream_open = False
+
+    def fake_scenery_pack(self, scenery_id, retries_on_error):
+        self.assertFalse(self.stream_open, "Downloaded a pack while the airport list was still streaming")
+        self.downloads.append(scenery_id)
+        return GatewayApt(apt=None, txt=None, readme='', copying='', pack_metadata={'sceneryId': scenery_id}, apt_metadata=None)
+
+    def test_downloads_after_listing(self):
+        with patch.object(gateway, 'iter_airports', self.fake_iter_airports), patch.object(gateway, 'scenery_pack', self.fake_scenery_pack):
+            packs = list(gateway.recommended_scenery_packs())
+        self.assertEqual(self.downloads, [1, 4, 5])  # Skipping the deprecated airport & the one with no recommended pack
+        self.assertEqual(packs[1].apt_metadata, self.airports[3])
+
+    def test_fields(self):
+        with patch.object(gateway, 'iter_airports', self.fake_iter_airports), patch.object(gateway, 'scenery_pack', self.fake_scenery_pack):
+            packs = list(gateway.recommended_scenery_packs(fields=['AirportName']))
+        self.assertEqual(self.downloads, [1, 4, 5])
+        self.assertEqual(packs[1].apt_metadata, {'AirportCode': 'KPDX', 'Deprecated': False, 'RecommendedSceneryId': 4, 'AirportName': 'KPDX Intl'})
+
+    def test_selective(self):
+        listed = []
+
+        def tracked_iter_airports(fields, retries_on_error):
+            for apt in self.fake_iter_airports(fields, retries_on_error):
+                listed.append(apt['AirportCode'])
+                yield apt
+
+        with patch.object(gateway, 'iter_airports', tracked_iter_airports), patch.object(gateway, 'scenery_pack', self.fake_scenery_pack):
+            packs = list(gateway.recommended_scenery_packs(['KPDX', 'KBOS']))
+        self.assertEqual([pack.pack_metadata['sceneryId'] for pack in packs], [4])
+        self.assertEqual(listed, ['KSEA', 'KBOS', 'KLAX', 'KPDX'])  # We stop reading once we've seen every airport we asked for
+        self.assertFalse(self.stream_open)
+
+
+def _response(status_code: int, retry_after=None):
+    return Mock(status_code=status_code, headers={'Retry-After': retry_after} if retry_after is not None else {})
+
+
+class TestRetries(TestCase):
+    def test_retry_policy(self):
+        policy = RetryPolicy(max_retries=3, backoff_base=1, backoff_max=5, jitter=False)
+        self.assertIs(RetryPolicy.from_retries(policy), policy)
+        self.assertEqual(RetryPolicy.from_retries(7), RetryPolicy(max_retries=7))
+        self.assertEqual([policy.backoff(n) for n in range(5)], [1, 2, 4, 5, 5])
+        jittered = RetryPolicy(backoff_base=1, backoff_max=5)
+        self.assertTrue(all(0 <= jittered.backoff(3) <= 5 for _ in range(100)))
+
+    def test_parse_retry_after(self):
+        self.assertIsNone(_parse_retry_after(None))
+        self.assertIsNone(_parse_retry_after(''))
+        self.assertIsNone(_parse_retry_after('soon'))
+        self.assertEqual(_parse_retry_after('120'), 120)
+        self.assertEqual(_parse_retry_after('-5'), 0)
+        self.assertAlmostEqual(_parse_retry_after(formatdate(time() + 30, usegmt=True)), 30, delta=2)
+        self.assertEqual(_parse_retry_after(formatdate(time() - 30, usegmt=True)), 0)
+
+    def request(self, responses, policy=RetryPolicy(max_retries=2, jitter=False)):
+        """Makes a request against the given sequence of responses (or exceptions), returning what it returned & how long it slept"""
+        with patch.object(gateway.requests, 'get', side_effect=responses) as get, patch.object(gateway, 'sleep') as sleep:
+            try:
+                out = _gateway_request('/test', policy, parse=lambda r: r.status_code)
+            except Exception as e:
+                out = e
+        self.assertEqual(get.call_count, len(responses))
+        return out, [call[0][0] for call in sleep.call_args_list]
+
+    def test_gateway_request(self):
+        with patch.object(gateway, 'circuit_breaker', CircuitBreaker()):
+            self.assertEqual(self.request([_response(503), requests.ConnectionError(), _response(200)]), (200, [0.5, 1]))
+            self.assertEqual(self.request([_response(429, retry_after='10'), _response(200)]), (200, [10]))
+            self.assertEqual(self.request([_response(429, retry_after='1000'), _response(200)]), (200, [120]))  # Capped at max_retry_after
+
+            error, sleeps = self.request([_response(404)])
+            self.assertIsInstance(error, requests.HTTPError)  # Never retried
+            self.assertEqual(sleeps, [])
+
+            error, sleeps = self.request([_response(503), _response(502), requests.Timeout()])
+            self.assertIsInstance(error, requests.Timeout)
+            self.assertEqual(sleeps, [0.5, 1])
+            self.assertEqual(gateway.circuit_breaker._consecutive_failures, 1)  # One failed request, however many retries it took
+
+
+class TestCircuitBreaker(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_after=60)
+        patcher = patch.object(gateway, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.check()
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertRaises(GatewayUnavailableError, self.breaker.check)
+        self.now += 59
+        self.assertRaises(GatewayUnavailableError, self.breaker.check)
+
+    def test_single_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 61
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.check()  # The trial goes through...
+        self.assertRaises(GatewayUnavailableError, self.breaker.check)  # ...but nothing else does while it's out
+        self.assertTrue(self.breaker.is_open)
+
+        self.breaker.record_failure()  # A failed trial reopens the breaker for another full period
+        self.now += 59
+        self.assertRaises(GatewayUnavailableError, self.breaker.check)
+        self.now += 2
+        self.breaker.check()
+        self.breaker.record_success()  # A successful trial closes it
+        self.breaker.check()
+        self.breaker.check()
+
+        # A trial that never reports back doesn't hold the breaker open forever
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 61
+        self.breaker.check()
+        self.now += 61
+        self.breaker.check()
+
+    def test_fails_fast(self):
+        with patch.object(gateway, 'circuit_breaker', self.breaker), patch.object(gateway.requests, 'get', return_value=_response(500)) as get, \
+                patch.object(gateway, 'sleep'):
+            for _ in range(2):
+                self.assertRaises(requests.HTTPError, _gateway_request, '/test', 1)
+            self.assertEqual(get.call_count, 4)
+            self.assertRaises(GatewayUnavailableError, _gateway_request, '/test', 1)
+            self.assertEqual(get.call_count, 4)
+
+            # A 404 still shows the Gateway is up
+            self.now += 61
+            get.return_value = _response(404)
+            self.assertRaises(requests.HTTPError, _gateway_request, '/test', 1)
+            self.assertFalse(self.breaker.is_open)
@@ -0,0 +1,63 @@
+from math import isnan, nan
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+from xplane_airports import geodesy
+from xplane_airports.geodesy import distance_matrix_nm, haversine_nm, haversine_nm_array, initial_bearing, initial_bearing_array, iter_distance_matrix_nm
+
+
+class TestGeodesy(TestCase):
+    # KSEA, KPDX, EGLL, YSSY
+    lats = [47.449, 45.5887, 51.4700, -33.9461]
+    lons = [-122.3093, -122.5975, -0.4543, 151.1772]
+
+    def test_scalar(self):
+        self.assertAlmostEqual(haversine_nm(47.449, -122.3093, 45.5887, -122.5975), 112.4, delta=0.5)
+        self.assertAlmostEqual(haversine_nm(0, 0, 0, 1), 60.04, delta=0.01)
+        self.assertTrue(isnan(haversine_nm(nan, 0, 0, 0)))
+        self.assertAlmostEqual(initial_bearing(0, 0, 0, 1), 90)
+        self.assertAlmostEqual(initial_bearing(0, 0, 1, 0), 0)
+        self.assertAlmostEqual(initial_bearing(0, 1, 0, 0), 270)
+        self.assertAlmostEqual(initial_bearing(47.449, -122.3093, 45.5887, -122.5975), 186.1, delta=0.5)
+
+    def test_arrays(self):
+        reversed_lats, reversed_lons = self.lats[::-1], self.lons[::-1]
+        distances = haversine_nm_array(self.lats, self.lons, reversed_lats, reversed_lons)
+        bearings = initial_bearing_array(self.lats, self.lons, reversed_lats, reversed_lons)
+        for i, (lat, lon) in enumerate(zip(self.lats, self.lons)):
+            self.assertAlmostEqual(distances[i], haversine_nm(lat, lon, reversed_lats[i], reversed_lons[i]), places=6)
+            self.assertAlmostEqual(bearings[i], initial_bearing(lat, lon, reversed_lats[i], reversed_lons[i]), places=6)
+
+    def test_distance_matrix(self):
+        lats_b, lons_b = self.lats[1:] + [nan], self.lons[1:] + [0.0]
+        matrix = [list(row) for row in distance_matrix_nm(self.lats, self.lons, lats_b, lons_b)]
+        self.assertEqual(len(matrix), 4)
+        for i, row in enumerate(matrix):
+            self.assertEqual(len(row), 4)
+            for j in range(3):
+                self.assertAlmostEqual(row[j], haversine_nm(self.lats[i], self.lons[i], lats_b[j], lons_b[j]), places=6)
+            self.assertTrue(isnan(row[3]))
+
+        chunks = list(iter_distance_matrix_nm(self.lats, self.lons, lats_b, lons_b, chunk_rows=3))
+        self.assertEqual([(start, len(block)) for start, block in chunks], [(0, 3), (3, 1)])
+        self.assertEqual([list(row)[:3] for _, block in chunks for row in block], [row[:3] for row in matrix])
+        self.assertEqual(len(distance_matrix_nm([], [], lats_b, lons_b)), 0)
+
+    @skipIf(geodesy.numpy is None, "NumPy isn't installed")
+    def test_numpy_matches_pure_python(self):
+        lats_b, lons_b = self.lats[1:] + [nan], self.lons[1:] + [0.0]
+
+        def compute():
+            return (list(haversine_nm_array(self.lats, self.lons, lats_b, lons_b)),
+                    list(initial_bearing_array(self.lats, self.lons, lats_b, lons_b)),
+                    [value for row in distance_matrix_nm(self.lats, self.lons, lats_b, lons_b, chunk_rows=3) for value in row])
+
+        vectorized = compute()
+        with patch.object(geodesy, 'numpy', None):
+            pure = compute()
+        for numpy_values, python_values in zip(vectorized, pure):
+            self.assertEqual(len(numpy_values), len(python_values))
+            for numpy_value, python_value in zip(numpy_values, python_values):
+                if isnan(python_value):
+                    self.assertTrue(isnan(numpy_value))
+                else:
+                    self.assertAlmostEqual(numpy_value, python_value, places=9)
@@ -0,0 +1,74 @@
+from pathlib import Path
+from unittest import TestCase
+from xplane_airports.lint import LintContext, LintIssue, LintRule, LintSeverity, lint_apt_dat, lint_lines
+
+_RUNWAY = "100 30.00 1 0 0.25 0 2 0 09 47.0 -122.0 0 0 2 0 1 0 27 47.0 -122.1 0 0 2 0 1 0"
+
+
+class TestLint(TestCase):
+    def test_clean_file(self):
+        self.assertEqual(list(lint_apt_dat(Path(__file__).parent / 'test_apt.dat')), [])
+
+    def test_problems_are_reported_with_line_numbers(self):
+        lines = ["I",
+                 "1100 Generated by WorldEditor",
+                 "",
+                 "1 100 0 0 KAAA First",                  # 4
+                 _RUNWAY,
+                 "100 30.00 1 0 0.25",                     # 6: too few tokens
+                 "9999 what is this",                      # 7: unknown row code
+                 "",
+                 "1 100 0 0 XNRW No Runways",               # 9: no runway
+                 "1201 47.0 -122.0 both",                  # 10: too few tokens
+                 "",
+                 "1 high 2 0 kaaa",                        # 12: bad elevation, bad ATC flag, no name, duplicate ID
+                 _RUNWAY,
+                 "99"]
+        issues = list(lint_lines(lines))
+        found = [(issue.line_number, issue.rule) for issue in issues]
+        self.assertEqual(found, [(6, 'token-count'),
+                                 (7, 'unknown-row-code'),
+                                 (10, 'token-count'),
+                                 (9, 'no-runway'),
+                                 (12, 'malformed-airport-header'),
+                                 (12, 'malformed-airport-header'),
+                                 (12, 'malformed-airport-header'),
+                                 (12, 'duplicate-airport-id')])
+        self.assertEqual(issues[3].airport_id, 'XNRW')
+        self.assertEqual(issues[-1].message, "Airport ID kaaa was already used on line 4")
+        self.assertEqual([issue.severity for issue in issues if issue.line_number == 12][2], LintSeverity.WARNING)
+        self.assertEqual(str(issues[0]), "6 (KAAA): error: Row code 100 needs at least 26 tokens, but has 5 [token-count]")
+
+    def test_tabs(self):
+        lines = ["I", "1100 Generated by WorldEditor",
+                 "\t1 100 0 0 KAAA First\t",  # Leading & trailing tabs are stripped, as by the parser
+                 _RUNWAY.replace(' ', '\t', 2),
+                 "1302\tcity Somewhere",
+                 "99"]
+        issues = list(lint_lines(lines))
+        self.assertEqual([(issue.line_number, issue.rule) for issue in issues],
+                         [(4, 'unknown-row-code'), (4, 'unsupported-whitespace'), (5, 'unknown-row-code'), (5, 'unsupported-whitespace'), (3, 'no-runway')])
+        self.assertEqual(issues[0].message, "Unknown row code '100\t30.00\t1'")
+
+    def test_file_structure(self):
+        issues = list(lint_lines(["1 100 0 0 KAAA First", _RUNWAY]))
+        self.assertEqual([(issue.line_number, issue.rule) for issue in issues], [(1, 'file-structure'), (2, 'file-structure')])
+        self.assertIn("99", issues[-1].message)
+
+        issues = list(lint_lines(["A", "1100 Generated by WorldEditor", "14 47.0 -122.0 0 0 Tower", "1 100 0 0 KAAA First", _RUNWAY, "99", "1 100 0 0 KBBB"]))
+        self.assertEqual([(issue.line_number, issue.rule) for issue in issues],
+                         [(3, 'line-outside-airport'), (7, 'malformed-airport-header'), (7, 'file-structure'), (7, 'no-runway')])
+
+    def test_custom_rules(self):
+        class NoClosedAirports(LintRule):
+            name = 'closed-airport'
+            severity = LintSeverity.WARNING
+
+            def on_line(self, ctx: LintContext, row_code, tokens):
+                if row_code is not None and row_code.value == 1 and tokens[5:6] == ['[X]']:
+                    yield ctx.issue(self, "Airport is closed")
+
+        issues = list(lint_apt_dat(Path(__file__).parent / 'test_apt.dat', rules=[NoClosedAirports()]))
+        self.assertEqual(len(issues), 1)
+        self.assertIsInstance(issues[0], LintIssue)
+        self.assertEqual(issues[0].rule, 'closed-airport')
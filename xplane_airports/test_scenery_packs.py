@@ -0,0 +1,83 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from xplane_airports.AptDat import AptDat, AptDatLine
+from xplane_airports.scenery_packs import load_apt_dats, load_scenery, scenery_pack_apt_dats
+
+
+def _apt_dat_text(*airports) -> str:
+    blocks = [f"""1 100 0 0 {apt_id} {name}
+100 30.00 1 0 0.25 0 2 0 09 47.0 -122.0 0 0 2 0 1 0 27 47.0 -122.1 0 0 2 0 1 0"""
+              for apt_id, name in airports]
+    return "I\n1100 Generated by WorldEditor\n\n" + "\n\n".join(blocks) + "\n\n99\n"
+
+
+class TestSceneryPacks(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp_dir.name)
+        self.global_apt_dat = self._write_apt_dat('Global Scenery/Global Airports', ('KSEA', 'Global Seattle'), ('KBFI', 'Global Boeing'), ('KPAE', 'Global Paine'))
+        self.pack_a = self._write_apt_dat('Custom Scenery/A KSEA Hi-Res', ('KSEA', 'Custom Seattle'))
+        self.pack_b = self._write_apt_dat('Custom Scenery/B Puget Sound', ('KSEA', 'Lower Seattle'), ('ksea', 'Lowercase Seattle'), ('KBFI', 'Custom Boeing'))
+        self.disabled = self._write_apt_dat('Custom Scenery/C Disabled', ('KPAE', 'Disabled Paine'))
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _write_apt_dat(self, pack_dir: str, *airports) -> Path:
+        path = self.root / pack_dir / 'Earth nav data' / 'apt.dat'
+        path.parent.mkdir(parents=True)
+        path.write_text(_apt_dat_text(*airports), encoding='utf8')
+        return path
+
+    def _write_ini(self, *lines):
+        (self.root / 'Custom Scenery' / 'scenery_packs.ini').write_text("I\n1000 Version\nSCENERY\n\n" + "\n".join(lines) + "\n", encoding='utf8')
+
+    def test_discovery_follows_ini(self):
+        self._write_ini('SCENERY_PACK Custom Scenery/B Puget Sound/',
+                        'SCENERY_PACK_DISABLED Custom Scenery/C Disabled/',
+                        'SCENERY_PACK Custom Scenery/A KSEA Hi-Res/',
+                        'SCENERY_PACK Custom Scenery/Missing Pack/')
+        self.assertEqual(scenery_pack_apt_dats(self.root), [self.pack_b, self.pack_a, self.global_apt_dat])
+        self.assertEqual(scenery_pack_apt_dats(self.root, include_disabled=True), [self.pack_b, self.disabled, self.pack_a, self.global_apt_dat])
+
+        self._write_ini('SCENERY_PACK *GLOBAL_AIRPORTS*',
+                        'SCENERY_PACK Custom Scenery/A KSEA Hi-Res/')
+        self.assertEqual(scenery_pack_apt_dats(self.root), [self.global_apt_dat, self.pack_a])
+
+    def test_discovery_without_ini(self):
+        self.assertEqual(scenery_pack_apt_dats(self.root), [self.pack_a, self.pack_b, self.disabled, self.global_apt_dat])
+
+    def test_override_precedence(self):
+        self._write_ini('SCENERY_PACK Custom Scenery/A KSEA Hi-Res/',
+                        'SCENERY_PACK Custom Scenery/B Puget Sound/')
+        for workers in (1, 2):
+            loaded = load_scenery(self.root, workers)
+            self.assertEqual(sorted(loaded.apt_dat.ids), ['KBFI', 'KPAE', 'KSEA'])
+            self.assertEqual(loaded.apt_dat['KSEA'].name, 'Custom Seattle')
+            self.assertEqual(loaded.apt_dat['KBFI'].name, 'Custom Boeing')
+            self.assertEqual(loaded.source_of('KSEA'), self.pack_a)
+            self.assertEqual(loaded.source_of('KPAE'), self.global_apt_dat)
+            self.assertIsNone(loaded.source_of('KLAX'))
+            self.assertEqual(loaded.overridden['KSEA'], [self.pack_b, self.global_apt_dat])
+            self.assertEqual(loaded.duplicated, {'KSEA': [self.pack_b]})
+            self.assertEqual(loaded.apt_dat['KSEA'].taxi_network, AptDat(self.pack_a)['KSEA'].taxi_network)
+            self.assertEqual(loaded.apt_dat.xplane_version, 1100)
+            self.assertEqual(loaded.overridden['KBFI'], [self.global_apt_dat])
+            self.assertNotIn('KPAE', loaded.overridden)
+
+    def test_load_explicit_files(self):
+        loaded = load_apt_dats([self.global_apt_dat, self.pack_a])
+        self.assertEqual(loaded.apt_dat['KSEA'].name, 'Global Seattle')
+        self.assertEqual(loaded.overridden, {'KSEA': [self.pack_a]})
+        self.assertEqual(loaded.duplicated, {})
+
+        # Duplicates within the winning file don't override it, either
+        with patch.object(AptDatLine, 'tokenize', side_effect=AssertionError("Tokenized while merging")):
+            loaded = load_apt_dats([self.pack_b, self.pack_a], workers=2)
+        self.assertFalse(any('tokenized_lines' in vars(apt) for apt in loaded.apt_dat.airports))  # Not until they're used
+        self.assertEqual(loaded.apt_dat['KSEA'].name, 'Lower Seattle')
+        self.assertEqual(loaded.overridden, {'KSEA': [self.pack_a]})
+        self.assertEqual(loaded.duplicated, {'KSEA': [self.pack_b]})
+        self.assertEqual(loaded.apt_dat['KBFI'].from_file, self.pack_b)
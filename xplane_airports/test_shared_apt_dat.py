@@ -0,0 +1,95 @@
+import multiprocessing
+import pickle
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+from xplane_airports.AptDat import Airport, AptDat, MetadataKey, WeatherConditions
+from xplane_airports.shared_apt_dat import SharedAptDat, _SharedAirports, write_shared_apt_dat
+
+
+def _count_taxi_nodes(shared_path: str, apt_id: str) -> int:
+    with SharedAptDat(shared_path) as shared:
+        return len(shared[apt_id].taxi_network.nodes)
+
+
+class TestSharedAptDat(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.apt_dat = AptDat(Path(__file__).parent / 'test_apt.dat')
+        self.shared_path = Path(self._tmp_dir.name) / 'world.aptdb'
+        write_shared_apt_dat(self.apt_dat, self.shared_path)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        with SharedAptDat(self.shared_path, cache_size=4) as shared:
+            self.assertEqual(len(shared), len(self.apt_dat))
+            self.assertEqual(shared.xplane_version, self.apt_dat.xplane_version)
+            self.assertEqual(shared.path_to_file, self.apt_dat.path_to_file)
+            self.assertEqual(list(shared.ids), list(self.apt_dat.ids))
+            for original, view in zip(self.apt_dat, shared):
+                self.assertEqual(view, original)
+            self.assertEqual(shared[-1], self.apt_dat[len(self.apt_dat) - 1])
+            self.assertEqual(shared.airports[1:3], self.apt_dat.airports[1:3])
+            self.assertIs(shared['KBJC'], shared['kbjc'])  # Served from the cache
+            self.assertEqual(shared['KBJC'].taxi_network, self.apt_dat['KBJC'].taxi_network)
+            self.assertIn('KBJC', shared)
+            self.assertNotIn('kbjc', shared)
+            self.assertIsNone(shared.search_by_id('XXXX'))
+            self.assertEqual(shared.search(self.apt_dat['KBJC'].name, limit=1)[0].id, 'KBJC')
+
+            self.assertRaises(TypeError, shared.sort)
+            with self.assertRaises(TypeError):
+                shared += Airport.from_str("1 100 0 0 XNEW New")
+            with self.assertRaises(TypeError):
+                del shared['KBJC']
+            copy = shared.clone()
+            del copy['KBJC']
+            self.assertEqual(len(copy), len(shared) - 1)
+
+    def test_searching_without_decoding(self):
+        with SharedAptDat(self.shared_path, cache_size=0) as shared:
+            with patch.object(_SharedAirports, '_text', side_effect=AssertionError("Decoded a whole airport")):
+                self.assertEqual(list(shared.ids), list(self.apt_dat.ids))
+                self.assertIn('KBJC', shared)
+                self.assertNotIn('kbjc', shared)
+                self.assertNotIn('XXXX', shared)
+                self.assertEqual(shared.name_search_index.ids, self.apt_dat.name_search_index.ids)
+                self.assertEqual(shared.coordinates.rows, self.apt_dat.coordinates.rows)
+                self.assertEqual(shared.search_by_name('xxxx'), [])
+                self.assertEqual(shared.search_by_metadata(MetadataKey.COUNTRY, 'Narnia'), [])
+
+            kbjc = self.apt_dat['KBJC']
+            self.assertEqual(shared.search(kbjc.name, limit=3), self.apt_dat.search(kbjc.name, limit=3))
+            self.assertEqual(shared.search_by_name(kbjc.name.lower()), [kbjc])
+            for country, prefix in (('united states', False), ('United', True)):
+                self.assertTrue(self.apt_dat.search_by_metadata(MetadataKey.COUNTRY, country, prefix))
+                self.assertEqual(shared.search_by_metadata(MetadataKey.COUNTRY, country, prefix),
+                                 self.apt_dat.search_by_metadata(MetadataKey.COUNTRY, country, prefix))
+            ids = ['KBJC', 'KBIX', 'YBLT']
+            self.assertEqual([list(row) for row in shared.distance_matrix(ids)], [list(row) for row in self.apt_dat.distance_matrix(ids)])
+            conditions = {apt_id: WeatherConditions(wind_dir=270, wind_speed_kts=5) for apt_id in ids + ['kbjc', 'XXXX']}
+            self.assertEqual(shared.active_traffic_flows(conditions), self.apt_dat.active_traffic_flows(conditions))
+
+            with self.assertRaises(TypeError):
+                shared.metadata_index
+            self.assertRaises(TypeError, shared.search_by_frequency, 118.5)
+
+    def test_shared_among_processes(self):
+        expected = len(self.apt_dat['KBJC'].taxi_network.nodes)
+        self.assertTrue(expected)
+        with multiprocessing.get_context('spawn').Pool(2) as pool:
+            counts = pool.starmap(_count_taxi_nodes, [(str(self.shared_path), 'KBJC')] * 2)
+        self.assertEqual(counts, [expected, expected])
+
+    def test_pickling(self):
+        with SharedAptDat(self.shared_path) as shared:
+            pickled = pickle.dumps(shared)
+            self.assertLess(len(pickled), 500)  # Just the path; the receiver maps the file itself
+            with pickle.loads(pickled) as unpickled:
+                self.assertEqual(list(unpickled.ids), list(shared.ids))
+
+    def test_rejects_other_files(self):
+        self.assertRaises(ValueError, SharedAptDat, Path(__file__).parent / 'test_apt.dat')